@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of appending checkpoint records with different fsync batch sizes
+    - sync every 1: fsync after every email or Venmo request
+    - sync every N: fsync after every N records, the default Checkpoint behaviour
+Usage:
+    python -m tmobile.benchmarks.bench_checkpoint --records 2000 --sync-every 1 8 32
+"""
+import argparse
+import os
+import tempfile
+import time
+from tabulate import tabulate
+from tmobile.libs.lib_checkpoint import Checkpoint
+
+
+def main():
+    """Function to compare per-record cost of checkpoint fsync batch sizes"""
+    cli = argparse.ArgumentParser(description="Benchmark the run checkpoint")
+    cli.add_argument("--records", type=int, default=2000)
+    cli.add_argument("--sync-every", type=int, nargs="+", default=[1, 8, 32])
+    cli_args = cli.parse_args()
+    rows = []
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        checkpoint_file = os.path.join(checkpoint_dir, "checkpoint.jsonl")
+        for sync_every in cli_args.sync_every:
+            checkpoint = Checkpoint(
+                checkpoint_file, sync_every=sync_every, sync_interval=60, fresh=True
+            )
+            started = time.perf_counter()
+            for num in range(cli_args.records):
+                checkpoint.append(
+                    "hash",
+                    (str(num), "email", "user@gmail.com", 2066, "SUCCESS", "id"),
+                )
+            checkpoint.close()
+            elapsed = time.perf_counter() - started
+            rows.append(
+                [
+                    sync_every,
+                    "{:.1f}".format(elapsed * 1000),
+                    "{:.1f}".format(elapsed * 1e6 / cli_args.records),
+                ]
+            )
+    print(
+        tabulate(
+            rows,
+            headers=["Sync every", "Total (ms)", "Per record (us)"],
+            tablefmt="grid",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+"""
+Benchmark of Gmail client construction before and after caching the discovery document
+    - before: pickled credentials and build() fetching the discovery document over the network
+    - after: json token and build_from_document() on the locally cached discovery document
+Usage:
+    python -m tmobile.benchmarks.bench_email_client --repeat 5
+"""
+import argparse
+import os
+import pickle
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from tabulate import tabulate
+
+
+def __get_creds__():
+    """Function to get credentials valid for an hour, nothing is refreshed during the benchmark"""
+    from google.oauth2.credentials import Credentials
+    from tmobile.libs.lib_email import SCOPES
+
+    return Credentials(
+        token="token",
+        refresh_token="refresh",
+        client_id="client",
+        client_secret="secret",
+        token_uri="https://oauth2.googleapis.com/token",
+        scopes=SCOPES,
+        expiry=datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1),
+    )
+
+
+def __before__(static_discovery=False):
+    from googleapiclient.discovery import build
+
+    with open("configs/token.pickle", "rb") as token:
+        creds = pickle.load(token)
+    build("gmail", "v1", credentials=creds, static_discovery=static_discovery)
+
+
+def __after__():
+    from tmobile.libs.lib_email import EmailClient
+
+    return EmailClient().service
+
+
+def __time__(func, repeat):
+    """Function to get mean time taken by func over repeat calls
+
+    :return: Mean time taken in seconds | error message if func failed
+    :rtype: (str)
+    """
+    try:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return "{:.3f}s".format((time.perf_counter() - started) / repeat)
+    except Exception as err:  # e.g. no network to fetch the discovery document
+        return "FAILED ({})".format(type(err).__name__)
+
+
+def main():
+    """Function to time client construction in a scratch configs directory"""
+    cli = argparse.ArgumentParser(description="Benchmark Gmail client construction")
+    cli.add_argument("--repeat", type=int, default=5)
+    cli_args = cli.parse_args()
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir("configs")
+    creds = __get_creds__()
+    with open("configs/token.pickle", "wb") as token:
+        pickle.dump(creds, token)
+    with open("configs/token.json", "w") as token:
+        token.write(creds.to_json())
+    __after__()
+    rows = [
+        ["build() with network discovery", __time__(__before__, cli_args.repeat)],
+        [
+            "build() with bundled discovery",
+            __time__(lambda: __before__(static_discovery=True), cli_args.repeat),
+        ],
+        ["build_from_document() cached", __time__(__after__, cli_args.repeat)],
+    ]
+    print(tabulate(rows, headers=["Client construction", "Mean"], tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+"""
+Benchmark of exporting the lines of many computed bills of a synthetic account
+    - Time and rows per second of each export format
+    - Peak memory of the export with tracemalloc, which stays flat as bills are added
+Usage:
+    python -m tmobile.benchmarks.bench_export --lines 1000 --bills 1 12 36
+"""
+
+import argparse
+import calendar
+import os
+import tempfile
+import time
+import tracemalloc
+from tabulate import tabulate
+from tmobile.benchmarks.synthetic import get_lines
+from tmobile.libs.lib_export import EXPORTERS, open_exporter
+
+
+def __iter_bills__(lines, no_of_bills):
+    """Function to yield computed bills of the lines, one month after another
+
+    :return: Computed bills, as returned by src/main.py __compute_bill__
+    :rtype: (generator)
+    """
+    charges = [
+        (line, "", line.charges.own_charges_cents / 100 + 12.34) for line in lines
+    ]
+    for num in range(no_of_bills):
+        month = calendar.month_abbr[num % 12 + 1]
+        yield {
+            "path": "SummaryBill{}{}.pdf".format(month, 2000 + num // 12),
+            "months": {"current_month": month},
+            "year": 2000 + num // 12,
+            "charges": charges,
+        }
+
+
+def __export__(path, fmt, lines, no_of_bills):
+    """Function to export bills
+
+    :return: Number of rows exported
+    :rtype: (int)
+    """
+    with open_exporter(path, fmt=fmt) as exporter:
+        for bill in __iter_bills__(lines, no_of_bills):
+            exporter.write_bill(bill)
+    return exporter.rows
+
+
+def __measure__(path, fmt, lines, no_of_bills):
+    """Function to get the time of an export in seconds, and the peak memory of the
+       same export in bytes, traced separately as tracing slows every allocation down
+
+    :rtype: (tuple)
+    """
+    started = time.perf_counter()
+    __export__(path, fmt, lines, no_of_bills)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    __export__(path, fmt, lines, no_of_bills)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    """Function to compare export formats over an increasing number of bills"""
+    cli = argparse.ArgumentParser(description="Benchmark exports of computed bills")
+    cli.add_argument("--lines", type=int, default=1000)
+    cli.add_argument("--bills", type=int, nargs="+", default=[1, 12, 36])
+    cli.add_argument("--formats", nargs="+", default=sorted(EXPORTERS))
+    cli_args = cli.parse_args()
+    rows = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        lines = get_lines(cli_args.lines, work_dir)
+        for fmt in cli_args.formats:
+            for no_of_bills in cli_args.bills:
+                path = os.path.join(work_dir, "lines.{}".format(fmt))
+                try:
+                    elapsed, peak = __measure__(path, fmt, lines, no_of_bills)
+                except ImportError as err:
+                    rows.append([fmt, no_of_bills, "-", "-", "-", str(err)])
+                    break
+                no_of_rows = cli_args.lines * no_of_bills
+                rows.append(
+                    [
+                        fmt,
+                        no_of_bills,
+                        "{:.1f}".format(elapsed * 1000),
+                        "{:,.0f}".format(no_of_rows / elapsed),
+                        "{:.1f}".format(peak / 1024),
+                        "{:.1f}".format(os.path.getsize(path) / 1024),
+                    ]
+                )
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "Format",
+                "Bills",
+                "Time (ms)",
+                "Rows/s",
+                "Peak (KiB)",
+                "File (KiB)",
+            ],
+            tablefmt="grid",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
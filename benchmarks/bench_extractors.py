@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+"""
+Benchmark of pdf extraction backends on sample bills
+    - Cold time: import of the backend plus the first extraction in a fresh process
+    - Warm time: mean of the following extractions in the same process
+    - Client peak RSS: maximum resident memory of the process running the backend
+    - Server peak RSS: maximum resident memory of the Tika server started by the backend,
+      read from /proc on Linux. "-" for backends without a server, or a server that was
+      already running or is remote, whose memory is not measured
+Usage:
+    python -m tmobile.benchmarks.bench_extractors SummaryBillApr2020.pdf --repeat 5
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from tabulate import tabulate
+
+__bench_module__ = "tmobile.benchmarks.bench_extractors"
+
+
+def __get_peak_rss_kb__(pid):
+    """Function to get the peak resident memory of a process and its children, from
+       VmHWM of /proc/<pid>/status
+
+    :param pid: Process id
+    :type pid: (int | str)
+    :return: Peak RSS in kB | None if it can not be read, e.g. outside Linux
+    :rtype: (int)
+    """
+    try:
+        with open("/proc/{}/status".format(pid)) as status:
+            peak_kb = next(
+                int(line.split()[1]) for line in status if line.startswith("VmHWM:")
+            )
+        with open("/proc/{0}/task/{0}/children".format(pid)) as children:
+            child_pids = children.read().split()
+    except (OSError, StopIteration):
+        return None
+    # The Tika server runs java under a shell
+    return peak_kb + sum(__get_peak_rss_kb__(child) or 0 for child in child_pids)
+
+
+def __get_server_pid__(backend):
+    """Function to get the process id of the server a backend started
+
+    :return: Process id | None if the backend started no server
+    :rtype: (int)
+    """
+    if backend != "tika":
+        return None
+    from tika import tika as tika_server
+
+    return getattr(tika_server.TikaServerProcess, "pid", None)
+
+
+def __run_backend__(backend, path, repeat):
+    """Function to time a backend on given pdf, runs in its own process
+
+    :return: Cold time, warm time, peak RSS of the process and of the server of the
+             backend, None if it has none or it was not measured
+    :rtype: (dict)
+    """
+    started = time.perf_counter()
+    from tmobile.libs.lib_pdf import get_extractor
+
+    extractor = get_extractor(backend)
+    extractor.extract(path)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(repeat):
+        extractor.extract(path)
+    warm = (time.perf_counter() - started) / max(1, repeat)
+    server_pid = __get_server_pid__(backend)
+    server_rss_kb = None if server_pid is None else __get_peak_rss_kb__(server_pid)
+    return {
+        "cold": cold,
+        "warm": warm,
+        "client_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "server_peak_rss_mb": None if server_rss_kb is None else server_rss_kb / 1024,
+    }
+
+
+def main():
+    """Function to benchmark each backend on each bill in a fresh process"""
+    cli = argparse.ArgumentParser(description="Benchmark pdf extraction backends")
+    cli.add_argument("paths", nargs="+", help="Sample SummaryBillMMMYYYY.pdf files")
+    cli.add_argument("--backends", nargs="+", default=["pypdf", "tika"])
+    cli.add_argument("--repeat", type=int, default=5)
+    cli.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    cli_args = cli.parse_args()
+    if cli_args.child:
+        result = __run_backend__(
+            cli_args.backends[0], cli_args.paths[0], cli_args.repeat
+        )
+        print(json.dumps(result))
+        return
+    rows = []
+    for path in cli_args.paths:
+        for backend in cli_args.backends:
+            child = subprocess.run(
+                [sys.executable, "-m", __bench_module__, path, "--child"]
+                + ["--backends", backend, "--repeat", str(cli_args.repeat)],
+                capture_output=True,
+                text=True,
+            )
+            if child.returncode != 0:
+                rows.append([path, backend, "FAILED", "-", "-", "-"])
+                continue
+            result = json.loads(child.stdout.splitlines()[-1])
+            server_rss = result["server_peak_rss_mb"]
+            rows.append(
+                [
+                    path,
+                    backend,
+                    "{:.3f}s".format(result["cold"]),
+                    "{:.3f}s".format(result["warm"]),
+                    "{:.1f}".format(result["client_peak_rss_mb"]),
+                    "-" if server_rss is None else "{:.1f}".format(server_rss),
+                ]
+            )
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "Bill",
+                "Backend",
+                "Cold",
+                "Warm",
+                "Client peak RSS (MB)",
+                "Server peak RSS (MB)",
+            ],
+            tablefmt="grid",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of per-line charges for an account with thousands of lines
+    - legacy: charges parsed from the bill row strings on every access, as Line used to
+    - dict: charges parsed once into integer cents on an object with a __dict__
+    - slots: models.charges.LineCharges, parsed once into integer cents with __slots__
+Usage:
+    python -m tmobile.benchmarks.bench_line_charges --lines 5000 --repeat 20
+"""
+
+import argparse
+import timeit
+import tracemalloc
+from tabulate import tabulate
+from tmobile.models.charges import LineCharges
+from tmobile.utilities.utils import parse_to_cents, parse_to_float, parse_to_num
+
+
+class __LegacyCharges__:
+    """
+    Previous Line charge properties kept as the baseline of the benchmark
+    """
+
+    def __init__(self, prop):
+        self.prop = prop
+
+    @classmethod
+    def from_prop(cls, prop):
+        return cls(prop)
+
+    @property
+    def equipment(self):
+        if self.prop["Equipment"] == "-":
+            return 0
+        return parse_to_num(self.prop["Equipment"])
+
+    @property
+    def services(self):
+        if self.prop["Services"] == "-":
+            return 0
+        return parse_to_num(self.prop["Services"])
+
+    @property
+    def tax(self):
+        tax = parse_to_num(self.prop["Plans"])
+        if tax > 20:
+            tax = tax - 20
+        return parse_to_float(tax)
+
+    @property
+    def one_time_charge(self):
+        if self.prop.get("One-time") is None or self.prop.get("One-time") == "-":
+            return 0
+        return parse_to_num(self.prop["One-time"])
+
+
+class __DictCharges__:
+    """
+    Same record as LineCharges without __slots__
+    """
+
+    def __init__(self, equipment_cents, services_cents, plans_cents, one_time_cents):
+        self.equipment_cents = equipment_cents
+        self.services_cents = services_cents
+        self.plans_cents = plans_cents
+        self.one_time_cents = one_time_cents
+
+    @classmethod
+    def from_prop(cls, prop):
+        return cls(
+            parse_to_cents(prop["Equipment"]),
+            parse_to_cents(prop["Services"]),
+            parse_to_cents(prop["Plans"]),
+            parse_to_cents(prop.get("One-time") or "-"),
+        )
+
+    tax_cents = LineCharges.tax_cents
+    own_charges_cents = LineCharges.own_charges_cents
+
+
+def __get_synthetic_props__(no_of_lines):
+    """Function to get bill rows of an account with given number of lines
+
+    :param no_of_lines: Number of lines on the account
+    :type no_of_lines: (int)
+    :return: Rows of the bill mapped by titles
+    :rtype: (list)
+    """
+    return [
+        {
+            "Line": "(555) {:03d}-{:04d}".format(num // 10000, num % 10000),
+            "Type": "Voice",
+            "Plans": "$24.{:02d}".format(num % 100),
+            "Equipment": "-" if num % 3 else "$35.56",
+            "Services": "$16.37",
+            "One-time": "-" if num % 7 else "$5.00",
+        }
+        for num in range(no_of_lines)
+    ]
+
+
+def __compute_legacy__(records):
+    """Function computing the tax total and per-line totals as the legacy run did
+
+    :return: Tax total and charges of each line
+    :rtype: (tuple)
+    """
+    tax_total = parse_to_float(sum(record.tax for record in records))
+    totals = [
+        parse_to_float(record.equipment + record.services + record.one_time_charge)
+        for record in records
+    ]
+    return tax_total, totals
+
+
+def __compute_cents__(records):
+    """Function computing the tax total and per-line totals from cents
+
+    :return: Tax total and charges of each line
+    :rtype: (tuple)
+    """
+    tax_total = sum(record.tax_cents for record in records) / 100
+    totals = [record.own_charges_cents / 100 for record in records]
+    return tax_total, totals
+
+
+def __measure__(record_class, compute, props, repeat):
+    """Function to measure build time, access time and memory of records
+
+    :return: Best build time, best compute time and bytes retained by the records
+    :rtype: (tuple)
+    """
+    build = min(
+        timeit.repeat(
+            lambda: [record_class.from_prop(prop) for prop in props],
+            number=1,
+            repeat=repeat,
+        )
+    )
+    records = [record_class.from_prop(prop) for prop in props]
+    access = min(timeit.repeat(lambda: compute(records), number=1, repeat=repeat))
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [record_class.from_prop(prop) for prop in props]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    assert compute(kept) == compute(records)
+    return build, access, retained
+
+
+def main():
+    """Function to compare per-line charge records"""
+    cli = argparse.ArgumentParser(description="Benchmark per-line charge records")
+    cli.add_argument("--lines", type=int, default=5000)
+    cli.add_argument("--repeat", type=int, default=20)
+    cli_args = cli.parse_args()
+    props = __get_synthetic_props__(cli_args.lines)
+    legacy = __compute_legacy__([__LegacyCharges__(prop) for prop in props])
+    exact = __compute_cents__([LineCharges.from_prop(prop) for prop in props])
+    assert legacy == exact, "Charges differ between legacy and cents records"
+    rows = []
+    for name, record_class, compute in [
+        ("legacy", __LegacyCharges__, __compute_legacy__),
+        ("dict", __DictCharges__, __compute_cents__),
+        ("slots", LineCharges, __compute_cents__),
+    ]:
+        build, access, retained = __measure__(
+            record_class, compute, props, cli_args.repeat
+        )
+        rows.append(
+            [
+                name,
+                "{:.2f}".format(build * 1000),
+                "{:.2f}".format(access * 1000),
+                "{:.1f}".format(retained / cli_args.lines),
+            ]
+        )
+    print(
+        tabulate(
+            rows,
+            headers=["Record", "Build (ms)", "Totals (ms)", "Bytes per line"],
+            tablefmt="grid",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
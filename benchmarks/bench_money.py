@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of money arithmetic over a batch of bills
+    - float: the previous float path, basic charge rounded from account_total / no_of_lines
+    - cents: Account in integer cents with basic shares allocated by largest remainder
+Usage:
+    python -m tmobile.benchmarks.bench_money --bills 200 --lines 50 --repeat 10
+"""
+
+import argparse
+import tempfile
+import timeit
+from tabulate import tabulate
+from tmobile.benchmarks.synthetic import get_lines
+from tmobile.models.account import Account
+from tmobile.utilities.utils import parse_to_float
+
+
+def __compute_float__(lines, account_total):
+    """Function computing charges of a bill as the float path did
+
+    :return: Tax total, basic charges and total of each line in dollars
+    :rtype: (tuple)
+    """
+    tax_total = 0
+    for line in lines:
+        tax_total += line.tax
+    basic = parse_to_float(account_total / len(lines))
+    totals = [
+        parse_to_float(line.equipment + line.services + line.one_time_charge + basic)
+        for line in lines
+    ]
+    return parse_to_float(tax_total), [basic] * len(lines), totals
+
+
+def __compute_cents__(lines, account_total):
+    """Function computing charges of a bill in integer cents
+
+    :return: Tax total in dollars, basic shares and total of each line in cents
+    :rtype: (tuple)
+    """
+    account = Account(all_lines=lines, account_total=account_total)
+    return account.tax_total, account.get_basic_shares(), account.get_line_totals()
+
+
+def main():
+    """Function to compare float and integer cent money arithmetic"""
+    cli = argparse.ArgumentParser(description="Benchmark money arithmetic")
+    cli.add_argument("--bills", type=int, default=200)
+    cli.add_argument("--lines", type=int, default=50)
+    cli.add_argument("--repeat", type=int, default=10)
+    cli_args = cli.parse_args()
+    with tempfile.TemporaryDirectory() as users_dir:
+        lines = get_lines(cli_args.lines, users_dir)
+    account_totals = [
+        round(100 + bill * 0.37, 2) for bill in range(1, cli_args.bills + 1)
+    ]
+    rows = []
+    for name, compute, to_dollars in [
+        ("float", __compute_float__, lambda value: value),
+        ("cents", __compute_cents__, lambda value: value / 100),
+    ]:
+        elapsed = min(
+            timeit.repeat(
+                lambda: [compute(lines, total) for total in account_totals],
+                number=1,
+                repeat=cli_args.repeat,
+            )
+        )
+        off = 0
+        for total in account_totals:
+            _, basics, _ = compute(lines, total)
+            if round(to_dollars(sum(basics)), 2) != total:
+                off += 1
+        rows.append([name, "{:.2f}".format(elapsed * 1000), off])
+    print(
+        tabulate(
+            rows,
+            headers=["Money", "Batch (ms)", "Bills with shares off the total"],
+            tablefmt="grid",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
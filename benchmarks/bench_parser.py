@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of bill parsing on a synthetic bill
+    - legacy: the previous TMobile class re-slicing the summary chunk for every field
+    - single-pass: lib_tmobile.TMobile built on parse_bill
+Usage:
+    python -m tmobile.benchmarks.bench_parser --lines 10000 --repeat 20
+"""
+
+import argparse
+import timeit
+import tracemalloc
+from tabulate import tabulate
+from tmobile.benchmarks.synthetic import get_bill_data
+from tmobile.libs.lib_tmobile import TMobile
+from tmobile.utilities.utils import clean_chunk, parse_to_num
+
+
+class __LegacyTMobile__:
+    """
+    Previous TMobile implementation kept as the baseline of the benchmark
+    """
+
+    def __init__(self, raw_data):
+        self.raw_data = raw_data
+        self.positions = self._get_start_end_positions()
+        self.plan_total = parse_to_num(self._data[1].split()[1])
+        self.account_total = parse_to_num(self._data[1].split()[-1])
+        self.titles = self.get_titles()
+
+    @property
+    def _data(self):
+        start = self.positions["start"] + 1
+        end = self.positions["end"]
+        return [chunk for chunk in self.raw_data[start:end] if chunk.strip()]
+
+    def _get_start_end_positions(self):
+        start_pos = end_pos = 0
+        for _, detail in enumerate(self.raw_data):
+            if "SUMMARY" in detail:
+                start_pos = _
+            if "DETAILED" in detail:
+                end_pos = _
+            if start_pos > 0 and end_pos > 0:
+                break
+        return {"start": start_pos, "end": end_pos}
+
+    def get_titles(self):
+        titles = self._data[0].split()
+        if "charges" in titles:
+            titles.pop(titles.index("charges"))
+        return titles
+
+    def get_account_data_mapping(self):
+        account_to_data = []
+        for chunk in self._data[3:]:
+            chunk = clean_chunk(data_chunk=chunk)
+            if "Removed" in chunk:
+                continue
+            account_to_data.append(dict(zip(self.titles, chunk.split(" "))))
+        return account_to_data
+
+
+def __measure__(parser_class, data, repeat):
+    """Function to measure parse time and allocations of parsing data
+
+    :return: Best time of construction alone and with the account mapping,
+             peak memory and number of blocks kept alive by the parsed bill
+    :rtype: (tuple)
+    """
+    construct = min(
+        timeit.repeat(lambda: parser_class(raw_data=data), number=1, repeat=repeat)
+    )
+    full = min(
+        timeit.repeat(
+            lambda: parser_class(raw_data=data).get_account_data_mapping(),
+            number=1,
+            repeat=repeat,
+        )
+    )
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    parsed = parser_class(raw_data=data)
+    parsed.get_account_data_mapping()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return construct, full, peak, blocks
+
+
+def main():
+    """Function to compare the legacy and single-pass parsers"""
+    cli = argparse.ArgumentParser(description="Benchmark bill parsing")
+    cli.add_argument("--lines", type=int, default=10000)
+    cli.add_argument("--repeat", type=int, default=20)
+    cli_args = cli.parse_args()
+    data = get_bill_data(cli_args.lines)
+    rows = []
+    for name, parser_class in [("legacy", __LegacyTMobile__), ("single-pass", TMobile)]:
+        construct, full, peak, blocks = __measure__(parser_class, data, cli_args.repeat)
+        rows.append(
+            [
+                name,
+                "{:.2f}".format(construct * 1000),
+                "{:.2f}".format(full * 1000),
+                "{:.2f}".format(peak / 2**20),
+                blocks,
+            ]
+        )
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "Parser",
+                "Construct (ms)",
+                "With mapping (ms)",
+                "Peak alloc (MB)",
+                "Retained blocks",
+            ],
+            tablefmt="grid",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of dispatching bills one after another versus on the async pipeline
+    - sequential: extract a bill, send its emails, then its Venmo requests, then the next bill
+    - pipeline: extraction, emails and Venmo requests of different bills overlap
+Each step sleeps for a given latency in place of pdf extraction and API calls
+Usage:
+    python -m tmobile.benchmarks.bench_pipeline --bills 12 --lines 8 --latency 0.02
+"""
+
+import argparse
+import time
+from tabulate import tabulate
+from tmobile.utilities.concurrency import Stage, run_pipeline_sync
+
+
+def __run_sequential__(cli_args):
+    """Function to extract and dispatch bills one after another"""
+    for _ in range(cli_args.bills):
+        time.sleep(cli_args.latency)
+        time.sleep(cli_args.latency)
+        for _ in range(cli_args.lines):
+            time.sleep(cli_args.latency / cli_args.venmo_workers)
+
+
+def __run_pipeline__(cli_args, queue_size):
+    """Function to extract and dispatch bills on the pipeline"""
+
+    def __bills__():
+        for num in range(cli_args.bills):
+            time.sleep(cli_args.latency)
+            yield num
+
+    def __send__(batch):
+        time.sleep(cli_args.latency)
+        return batch
+
+    emails = Stage("email", __send__, lambda item, result: None, batch_size=64)
+    venmo = Stage(
+        "venmo",
+        __send__,
+        lambda item, result: None,
+        workers=cli_args.venmo_workers,
+        queue_size=queue_size,
+    )
+    run_pipeline_sync(
+        source=__bills__(),
+        route=lambda num: [(emails, num)] + [(venmo, num)] * cli_args.lines,
+        stages=[emails, venmo],
+        threads=2 + cli_args.venmo_workers,
+    )
+
+
+def main():
+    """Function to compare wall time of sequential and pipelined dispatch of bills"""
+    cli = argparse.ArgumentParser(description="Benchmark the dispatch pipeline")
+    cli.add_argument("--bills", type=int, default=12)
+    cli.add_argument("--lines", type=int, default=8)
+    cli.add_argument("--latency", type=float, default=0.02)
+    cli.add_argument("--venmo-workers", type=int, default=4)
+    cli.add_argument("--queue-size", type=int, nargs="+", default=[4, 64])
+    cli_args = cli.parse_args()
+    runs = [("sequential", lambda: __run_sequential__(cli_args))] + [
+        (
+            "pipeline, queue size {}".format(queue_size),
+            lambda queue_size=queue_size: __run_pipeline__(cli_args, queue_size),
+        )
+        for queue_size in cli_args.queue_size
+    ]
+    rows = []
+    for name, run in runs:
+        started = time.perf_counter()
+        run()
+        rows.append([name, "{:.1f}".format((time.perf_counter() - started) * 1000)])
+    print(tabulate(rows, headers=["Dispatch", "Time (ms)"], tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
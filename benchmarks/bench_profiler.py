@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of the overhead of stage timers per timed block
+    - none: the block without a timer
+    - disabled: the block inside timer() with profiling disabled, the default
+    - enabled: the block inside timer() with profiling enabled, with and without events
+Usage:
+    python -m tmobile.benchmarks.bench_profiler --number 100000 --repeat 5
+"""
+import argparse
+import os
+import tempfile
+import timeit
+from tabulate import tabulate
+from tmobile.utilities.profiler import disable_profiling, enable_profiling, timer
+
+
+def __untimed__():
+    return None
+
+
+def __timed__():
+    with timer("render", line="5550000001"):
+        return None
+
+
+def main():
+    """Function to compare time per block with and without timers"""
+    cli = argparse.ArgumentParser(description="Benchmark overhead of stage timers")
+    cli.add_argument("--number", type=int, default=100000)
+    cli.add_argument("--repeat", type=int, default=5)
+    cli_args = cli.parse_args()
+
+    def __measure__(func):
+        elapsed = min(
+            timeit.repeat(func, number=cli_args.number, repeat=cli_args.repeat)
+        )
+        return "{:.3f}".format(elapsed * 1e6 / cli_args.number)
+
+    rows = [["none", __measure__(__untimed__)], ["disabled", __measure__(__timed__)]]
+    enable_profiling()
+    rows.append(["enabled", __measure__(__timed__)])
+    with tempfile.TemporaryDirectory() as events_dir:
+        enable_profiling(events_file=os.path.join(events_dir, "events.jsonl"))
+        rows.append(["enabled, events", __measure__(__timed__)])
+        disable_profiling()
+    print(tabulate(rows, headers=["Timer", "Per block (us)"], tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of rendering the statement of every line of a synthetic bill
+    - tabulate: tabulate(rows, tablefmt="grid") called for each line, as before
+    - grid, plain, html, csv: utilities.statement renderers of all lines in bulk
+Usage:
+    python -m tmobile.benchmarks.bench_render --lines 10000 --repeat 5
+"""
+
+import argparse
+import tempfile
+import timeit
+from tabulate import tabulate
+from tmobile.benchmarks.synthetic import get_lines
+from tmobile.utilities.statement import (
+    FORMATS,
+    LABELS,
+    get_renderer,
+    get_statement_values,
+)
+
+
+def __render_tabulate__(statements):
+    """Function rendering each statement with tabulate
+
+    :return: Statement of each line
+    :rtype: (list)
+    """
+    return [
+        tabulate(list(zip(LABELS, values)), tablefmt="grid") for values in statements
+    ]
+
+
+def main():
+    """Function to compare rendering statements with tabulate and with renderers"""
+    cli = argparse.ArgumentParser(description="Benchmark statement rendering")
+    cli.add_argument("--lines", type=int, nargs="+", default=[10000])
+    cli.add_argument("--repeat", type=int, default=5)
+    cli_args = cli.parse_args()
+    rows = []
+    with tempfile.TemporaryDirectory() as users_dir:
+        for no_of_lines in cli_args.lines:
+            statements = [
+                get_statement_values(line, 1234)[0]
+                for line in get_lines(no_of_lines, users_dir)
+            ]
+            assert __render_tabulate__(statements) == get_renderer().render_all(
+                statements
+            ), "Statements differ between tabulate and grid"
+            funcs = [("tabulate", lambda: __render_tabulate__(statements))] + [
+                (fmt, lambda fmt=fmt: get_renderer(fmt).render_all(statements))
+                for fmt in FORMATS
+            ]
+            baseline = None
+            for name, func in funcs:
+                elapsed = min(timeit.repeat(func, number=1, repeat=cli_args.repeat))
+                baseline = baseline or elapsed
+                rows.append(
+                    [
+                        no_of_lines,
+                        name,
+                        "{:.1f}".format(elapsed * 1000),
+                        "{:,.0f}".format(no_of_lines / elapsed),
+                        "{:.1f}x".format(baseline / elapsed),
+                    ]
+                )
+    print(
+        tabulate(
+            rows,
+            headers=["Lines", "Renderer", "Time (ms)", "Lines/s", "Speedup"],
+            tablefmt="grid",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
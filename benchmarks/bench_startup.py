@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""
+Benchmark of application startup in test mode, based on `python -X importtime`
+    - Imports src/main.py and creates the email client as a test-mode run does
+    - Reports the slowest imports and whether Google or Venmo libraries were loaded
+Usage:
+    python -m tmobile.benchmarks.bench_startup --top 15
+"""
+import argparse
+import subprocess
+import sys
+from tabulate import tabulate
+
+__heavy_modules__ = ["googleapiclient", "google_auth_oauthlib", "venmo_api", "tika"]
+
+__test_mode_run__ = """
+import sys
+from tmobile.src.main import EmailClient
+EmailClient()
+print(",".join(sorted(m for m in {} if m in sys.modules)))
+""".format(
+    __heavy_modules__
+)
+
+
+def __parse_importtime__(stderr):
+    """Function to parse `python -X importtime` output
+
+    :param stderr: Standard error of the python process
+    :type stderr: (str)
+    :return: Pairs of module and cumulative import time in micro-seconds
+    :rtype: (list)
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.replace("import time:", "", 1).split("|")
+        imports.append((module.strip(), int(cumulative)))
+    return imports
+
+
+def main():
+    """Function to run a test-mode startup in a fresh process and report import times"""
+    cli = argparse.ArgumentParser(description="Benchmark test-mode startup time")
+    cli.add_argument("--top", type=int, default=15)
+    cli_args = cli.parse_args()
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", __test_mode_run__],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = __parse_importtime__(child.stderr)
+    slowest = sorted(imports, key=lambda pair: pair[1], reverse=True)[: cli_args.top]
+    print(
+        tabulate(
+            [[module, "{:.1f}".format(us / 1000)] for module, us in slowest],
+            headers=["Module", "Cumulative import (ms)"],
+            tablefmt="grid",
+        )
+    )
+    loaded = child.stdout.strip()
+    print("Heavy modules loaded in test mode: {}".format(loaded or "none"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of the SQLite bill store on a synthetic history of bills
+    - put: storing one bill with all its lines in one transaction
+    - history queries: total per user, line history and equipment changes
+Usage:
+    python -m tmobile.benchmarks.bench_store --months 36 --lines 500 --repeat 10
+"""
+
+import argparse
+import calendar
+import os
+import tempfile
+import timeit
+from collections import namedtuple
+from tabulate import tabulate
+from tmobile.libs.lib_store import BillStore
+from tmobile.models.charges import LineCharges
+
+__line__ = namedtuple("Line", ["line", "user", "linetype", "charges"])
+
+
+def __get_synthetic_bills__(months, no_of_lines):
+    """Function to get computed bills of consecutive months with given number of lines
+
+    :return: Bill hash and computed bill of each month
+    :rtype: (list)
+    """
+    bills = []
+    for month in range(months):
+        year, month_num = 2000 + month // 12, month % 12 + 1
+        charges = []
+        for num in range(no_of_lines):
+            equipment_cents = 3556 if (num + month // 6) % 3 == 0 else 0
+            line = __line__(
+                "555{:07d}".format(num),
+                {"name": "User{}".format(num % (no_of_lines // 2 or 1))},
+                "Voice",
+                LineCharges(equipment_cents=equipment_cents, services_cents=1637),
+            )
+            charges.append((line, "", (equipment_cents + 1637 + 1257) / 100))
+        name = "SummaryBill{}{}".format(calendar.month_abbr[month_num], year)
+        bill = {
+            "path": "/tmp/{}.pdf".format(name),
+            "months": {"current_month": calendar.month_abbr[month_num]},
+            "year": year,
+            "plan_total": 12.57 * no_of_lines,
+            "charges": charges,
+            "total": sum(total for _, _, total in charges),
+        }
+        bills.append((name, bill))
+    return bills
+
+
+def main():
+    """Function to measure storing and querying a history of bills"""
+    cli = argparse.ArgumentParser(description="Benchmark the bill store")
+    cli.add_argument("--months", type=int, default=36)
+    cli.add_argument("--lines", type=int, default=500)
+    cli.add_argument("--repeat", type=int, default=10)
+    cli_args = cli.parse_args()
+    bills = __get_synthetic_bills__(cli_args.months, cli_args.lines)
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = BillStore(os.path.join(store_dir, "tmobile.db"))
+        put = min(
+            timeit.repeat(
+                lambda: [store.put(bill, bill_hash=name) for name, bill in bills],
+                number=1,
+                repeat=max(1, cli_args.repeat // 5),
+            )
+        )
+        rows = [["put (per bill)", "{:.3f}".format(put * 1000 / len(bills))]]
+        for name, query in [
+            ("total per user, 24 months", lambda: store.get_totals_by_user(24)),
+            ("line history", lambda: store.get_line_history("5550000001")),
+            ("equipment changes", store.get_equipment_changes),
+        ]:
+            elapsed = min(timeit.repeat(query, number=1, repeat=cli_args.repeat))
+            rows.append([name, "{:.3f}".format(elapsed * 1000)])
+        store.close()
+    print(tabulate(rows, headers=["Operation", "Time (ms)"], tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
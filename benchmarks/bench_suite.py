@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+"""
+Benchmark suite of the steps of processing a bill on synthetic bills of given sizes
+    - parse: TMobile parsing of the extracted lines, with the account mapping
+    - clean_chunk: cleaning every row of the summary
+    - lines: Line construction, accounts: Account construction and basic shares
+    - render: statement of each line with the grid renderer, create_message: email of
+      each line
+Each time is divided by the time of a fixed pure Python workload measured right before
+it, so results of different machines, or of a busy machine, can be compared against the
+stored baselines.json. The score of a case is the lowest of several rounds of both, and
+the process exits with status 1 if any case is slower than its baseline
+Usage:
+    python -m tmobile.benchmarks.bench_suite --lines 10 1000
+    python -m tmobile.benchmarks.bench_suite --lines 10 1000 --save
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+from tabulate import tabulate
+from tmobile.benchmarks.synthetic import (
+    get_account_data,
+    get_bill_data,
+    get_plan_total,
+    write_fixtures,
+)
+from tmobile.libs.lib_email import create_message
+from tmobile.libs.lib_tmobile import TMobile
+from tmobile.models.account import Account
+from tmobile.models.line import Line
+from tmobile.models.user_directory import UserDirectory
+from tmobile.src.main import __get_total_charges_and_tabular_data__
+from tmobile.utilities.utils import clean_chunk
+
+__baselines_file__ = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+def __calibrate__():
+    """Function of the fixed workload every case is measured relative to"""
+    squares = {}
+    for num in range(20000):
+        squares[str(num)] = num * num
+    return sorted(squares.items())
+
+
+def __get_cases__(no_of_lines, users_dir):
+    """Function to get the benchmarked function of each case for a synthetic bill
+
+    :param no_of_lines: Number of lines on the account
+    :type no_of_lines: (int)
+    :param users_dir: Directory to write users.json and venmo.json to
+    :type users_dir: (str)
+    :return: Name and function of each case
+    :rtype: (list)
+    """
+    data = get_bill_data(no_of_lines)
+    account_data = get_account_data(no_of_lines)
+    users_file, _ = write_fixtures(users_dir, no_of_lines)
+    directory = UserDirectory(users_file)
+    lines = [Line(prop, directory=directory) for prop in account_data]
+    shares = Account(
+        all_lines=lines, account_total=get_plan_total(no_of_lines)
+    ).get_basic_shares()
+    tables = [
+        __get_total_charges_and_tabular_data__(line, basic_cents)[0]
+        for line, basic_cents in zip(lines, shares)
+    ]
+    rows = [row for row in data if row.startswith("(555)")]
+    return [
+        ("parse", lambda: TMobile(raw_data=data).get_account_data_mapping()),
+        ("clean_chunk", lambda: [clean_chunk(data_chunk=row) for row in rows]),
+        ("lines", lambda: [Line(prop, directory=directory) for prop in account_data]),
+        (
+            "accounts",
+            lambda: Account(
+                all_lines=lines, account_total=get_plan_total(no_of_lines)
+            ).get_basic_shares(),
+        ),
+        (
+            "render",
+            lambda: [
+                __get_total_charges_and_tabular_data__(line, basic_cents)
+                for line, basic_cents in zip(lines, shares)
+            ],
+        ),
+        (
+            "create_message",
+            lambda: [
+                create_message(
+                    "me@gmail.com", line.user["email"], "T-Mobile(Apr 2020)", table
+                )
+                for line, table in zip(lines, tables)
+            ],
+        ),
+    ]
+
+
+def __measure__(func, repeat):
+    """Function to get the best time of func in milliseconds, calling it as many times
+       per repeat as fit in about 20ms
+
+    :return: Best time of one call in milliseconds
+    :rtype: (float)
+    """
+    number, _ = timeit.Timer(func).autorange()
+    number = max(1, number // 10)
+    return min(timeit.repeat(func, number=number, repeat=repeat)) * 1000 / number
+
+
+def __score__(func, repeat, limit=None, rounds=5):
+    """Function to get the time of func relative to the calibration workload measured
+       right before it, the lowest of up to rounds measurements. Measuring stops once the
+       score is within limit, so a burst of load on the machine is not reported as a
+       slowdown, and every round is measured without one
+
+    :param limit: Highest score that is not measured again, defaults to None
+    :type limit: (float), optional
+    :param rounds: Highest number of measurements, defaults to 5
+    :type rounds: (int), optional
+    :return: Best time of one call in milliseconds and its score
+    :rtype: (tuple)
+    """
+    best = None
+    for _ in range(max(1, rounds)):
+        calibration = __measure__(__calibrate__, repeat)
+        elapsed = __measure__(func, repeat)
+        if best is None or elapsed / calibration < best[1]:
+            best = (elapsed, elapsed / calibration)
+        if limit is not None and best[1] <= limit:
+            break
+    return best
+
+
+def __compare__(results, baselines, tolerance):
+    """Function to get rows of results compared to baselines
+
+    :param results: Time in milliseconds and score of each case
+    :type results: (dict)
+    :return: Rows of the report and number of cases slower than the tolerance
+    :rtype: (tuple)
+    """
+    rows, slower = [], 0
+    for case, (elapsed, score) in results.items():
+        baseline = baselines.get("cases", {}).get(case)
+        change, status = "", "NEW"
+        if baseline is not None:
+            change = score / baseline - 1
+            status = "SLOWER" if change > tolerance else "OK"
+            slower += status == "SLOWER"
+            change = "{:+.1%}".format(change)
+        rows.append(
+            [case, "{:.3f}".format(elapsed), "{:.4f}".format(score), change, status]
+        )
+    return rows, slower
+
+
+def main():
+    """Function to run the suite and compare it to the stored baselines"""
+    cli = argparse.ArgumentParser(description="Benchmark suite on synthetic bills")
+    cli.add_argument("--lines", type=int, nargs="+", default=[10, 1000])
+    cli.add_argument("--repeat", type=int, default=7)
+    cli.add_argument(
+        "--rounds",
+        type=int,
+        default=5,
+        help="Measurements of each case, the lowest is kept. All are run with --save",
+    )
+    cli.add_argument("--tolerance", type=float, default=0.5)
+    cli.add_argument("--baselines", default=__baselines_file__)
+    cli.add_argument(
+        "--save", action="store_true", help="Store results as the new baselines"
+    )
+    cli_args = cli.parse_args()
+    baselines = {}
+    if os.path.exists(cli_args.baselines):
+        with open(cli_args.baselines) as baselines_file:
+            baselines = json.load(baselines_file)
+    results = {}
+    with tempfile.TemporaryDirectory() as users_dir:
+        for no_of_lines in cli_args.lines:
+            for name, func in __get_cases__(no_of_lines, users_dir):
+                case = "{}/{}".format(name, no_of_lines)
+                baseline = baselines.get("cases", {}).get(case)
+                # Baselines are the best of all rounds, checks stop once in tolerance
+                limit = None
+                if not cli_args.save and baseline is not None:
+                    limit = baseline * (1 + cli_args.tolerance)
+                results[case] = __score__(
+                    func, cli_args.repeat, limit=limit, rounds=cli_args.rounds
+                )
+    rows, slower = __compare__(results, baselines, cli_args.tolerance)
+    print(
+        tabulate(
+            rows,
+            headers=["Case", "Time (ms)", "Score", "Change", "Status"],
+            tablefmt="grid",
+        )
+    )
+    if cli_args.save:
+        baselines.setdefault("cases", {}).update(
+            {case: round(score, 6) for case, (_, score) in results.items()}
+        )
+        with open(cli_args.baselines, "w") as baselines_file:
+            json.dump(baselines, baselines_file, indent=4, sort_keys=True)
+            baselines_file.write("\n")
+    sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
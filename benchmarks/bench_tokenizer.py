@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of splitting the summary rows of a synthetic bill into columns
+    - clean_chunk: utils.clean_chunk replacing each known suffix, then splitting on spaces
+    - layout: lib_tmobile.LayoutProfile.tokenize matching each row with a compiled pattern
+Usage:
+    python -m tmobile.benchmarks.bench_tokenizer --lines 10 1000 100000 --repeat 10
+"""
+
+import argparse
+import timeit
+from tabulate import tabulate
+from tmobile.benchmarks.synthetic import TITLES, get_bill_data
+from tmobile.libs.lib_tmobile import get_layout
+from tmobile.utilities.utils import clean_chunk
+
+
+def __split_chunks__(rows):
+    """Function splitting rows as parse_bill used to
+
+    :return: Values of each row that was not removed
+    :rtype: (list)
+    """
+    split_rows = []
+    for chunk in rows:
+        chunk = clean_chunk(data_chunk=chunk)
+        if "Removed" in chunk:
+            continue
+        split_rows.append(tuple(chunk.split(" ")[: len(TITLES)]))
+    return split_rows
+
+
+def __tokenize__(rows, tokenize):
+    """Function splitting rows with the layout of their header
+
+    :return: Values of each row that was not removed
+    :rtype: (list)
+    """
+    split_rows = []
+    for chunk in rows:
+        row, status = tokenize(chunk)
+        if status is not None and "Removed" in status:
+            continue
+        split_rows.append(row)
+    return split_rows
+
+
+def main():
+    """Function to compare splitting summary rows with clean_chunk and with layouts"""
+    cli = argparse.ArgumentParser(description="Benchmark summary row tokenization")
+    cli.add_argument("--lines", type=int, nargs="+", default=[10, 1000, 100000])
+    cli.add_argument("--repeat", type=int, default=10)
+    cli_args = cli.parse_args()
+    tokenize = get_layout(tuple(TITLES)).tokenize
+    rows = []
+    for no_of_lines in cli_args.lines:
+        data = get_bill_data(no_of_lines, detail_lines=0)
+        summary = data[: data.index("DETAILED CHARGES")]
+        chunks = [row for row in summary if row.startswith("(555)")]
+        assert __split_chunks__(chunks) == __tokenize__(
+            chunks, tokenize
+        ), "Rows differ between clean_chunk and layout"
+        number = max(1, 100000 // no_of_lines)
+        timings = [
+            min(timeit.repeat(func, number=number, repeat=cli_args.repeat)) / number
+            for func in [
+                lambda: __split_chunks__(chunks),
+                lambda: __tokenize__(chunks, tokenize),
+            ]
+        ]
+        rows.append(
+            [
+                no_of_lines,
+                "{:.3f}".format(timings[0] * 1000),
+                "{:.3f}".format(timings[1] * 1000),
+                "{:,.0f}".format(no_of_lines / timings[0]),
+                "{:,.0f}".format(no_of_lines / timings[1]),
+                "{:.2f}x".format(timings[0] / timings[1]),
+            ]
+        )
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "Lines",
+                "clean_chunk (ms)",
+                "layout (ms)",
+                "clean_chunk (rows/s)",
+                "layout (rows/s)",
+                "Speedup",
+            ],
+            tablefmt="grid",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
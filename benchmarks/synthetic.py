@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+"""
+Generator of synthetic T-Mobile bills and configuration files of any size for benchmarks
+    - get_bill_data: lines of text as extracted from a summary bill pdf, with the pages
+      before the summary, new, transferred and removed lines and the detailed charges
+    - get_account_data: account to data mapping of the lines, as parsed by lib_tmobile
+    - write_fixtures: users.json and venmo.json files of the lines
+    - get_lines: models.line.Line objects of the lines, with their users.json
+Every generator is seeded, so the same arguments always give the same bill
+"""
+import json
+import os
+import random
+from tmobile.models.line import Line
+from tmobile.models.user_directory import UserDirectory
+
+# Titles of the summary once "charges" of "One-time charges" is dropped
+TITLES = ["Line", "Type", "Plans", "Equipment", "Services", "One-time", "Total"]
+
+ACCOUNT_CENTS = 12057
+
+__front_pages__ = [
+    "T-Mobile",
+    "",
+    "Bill period",
+    "Mar 19, 2020 - Apr 18, 2020",
+    "",
+    "Account",
+    "000123",
+    "",
+    "Page",
+    "1\xa0of\xa06",
+    "",
+    "TOTAL DUE",
+    "Your bill is due by May 11, 2020.",
+    "",
+    "AutoPay is scheduled for May 09, 2020 using Visa",
+    "",
+    "PLANS",
+    "",
+    "This month's charges are $0.12 less",
+    "",
+    "EQUIPMENT",
+    "",
+    "This month's charges are the same as last month's",
+    "",
+    "Previous balance $314.62",
+    "",
+    "Payment - thank you Apr 09 -$254.62",
+    "",
+]
+
+__suffixes__ = ["", "", "", "", "", "", " - New", " - Transferred to T-Mobile"]
+__types__ = ["Voice", "Voice", "Voice", "Wearable"]
+
+
+def get_number(num):
+    """Function to get the phone number of a synthetic line as printed on the bill
+
+    :param num: Index of the line on the account
+    :type num: (int)
+    :return: Phone number e.g. "(555) 000-0001" with a non-breaking space
+    :rtype: (str)
+    """
+    return "(555)\xa0{:03d}-{:04d}".format(num // 10000 % 1000, num % 10000)
+
+
+def __format_amount__(cents):
+    return "${}.{:02d}".format(cents // 100, cents % 100) if cents else "-"
+
+
+def __get_rows__(no_of_lines, seed):
+    """Function to get the charges of each synthetic line
+
+    :return: Phone number, suffix, removed flag, type and charges in cents of each line
+    :rtype: (list)
+    """
+    rng = random.Random(seed)
+    rows = []
+    for num in range(no_of_lines):
+        charges = [
+            rng.choice([429, 1000, 2443, 3500]),
+            rng.choice([0, 0, 2234, 3556]),
+            rng.choice([0, 0, 0, 1637]),
+            rng.choice([0] * 9 + [500]),
+        ]
+        rows.append(
+            (
+                get_number(num),
+                rng.choice(__suffixes__),
+                rng.random() < 0.02,
+                rng.choice(__types__),
+                charges + [sum(charges)],
+            )
+        )
+    return rows
+
+
+def get_bill_data(no_of_lines, seed=0, detail_lines=5):
+    """Function to get lines of text extracted from a synthetic summary bill
+
+    :param no_of_lines: Number of lines on the account
+    :type no_of_lines: (int)
+    :param seed: Seed of the generated charges, defaults to 0
+    :type seed: (int), optional
+    :param detail_lines: Number of detailed charges lines per line, defaults to 5
+    :type detail_lines: (int), optional
+    :return: Lines of text as extracted from the pdf
+    :rtype: (list)
+    """
+    rows = __get_rows__(no_of_lines, seed)
+    totals = [
+        sum(charges[index] for _, _, removed, _, charges in rows if not removed)
+        for index in range(5)
+    ]
+    totals[0] += ACCOUNT_CENTS
+    totals[-1] += ACCOUNT_CENTS
+    data = __front_pages__ + [
+        "THIS BILL SUMMARY",
+        "Line Type Plans Equipment Services One-time charges Total",
+        "",
+        "Totals " + " ".join(__format_amount__(cents) for cents in totals),
+        "",
+        "Account {0} - - - {0}".format(__format_amount__(ACCOUNT_CENTS)),
+        "",
+    ]
+    for number, suffix, removed, line_type, charges in rows:
+        data.append(
+            "{}{} {} {}".format(
+                number,
+                " - Removed" if removed else suffix,
+                line_type,
+                " ".join(__format_amount__(cents) for cents in charges),
+            )
+        )
+        data.append("")
+    data += ["DETAILED CHARGES", "", "PLANS {}".format(__format_amount__(totals[0]))]
+    for number, _, _, line_type, charges in rows:
+        data.append("{} {}".format(number, line_type))
+        data += [
+            "REGULAR CHARGES Apr 19 - May 18 {}".format(__format_amount__(charges[0]))
+        ] * detail_lines
+    return data
+
+
+def get_account_data(no_of_lines, seed=0):
+    """Function to get the account to data mapping of a synthetic bill, the same as
+       TMobile(get_bill_data(no_of_lines, seed)).get_account_data_mapping()
+
+    :param no_of_lines: Number of lines on the account
+    :type no_of_lines: (int)
+    :param seed: Seed of the generated charges, defaults to 0
+    :type seed: (int), optional
+    :return: Details of each line on the account that was not removed
+    :rtype: (list)
+    """
+    return [
+        dict(
+            zip(
+                TITLES,
+                [number.replace("\xa0", ""), line_type]
+                + [__format_amount__(cents) for cents in charges],
+            )
+        )
+        for number, _, removed, line_type, charges in __get_rows__(no_of_lines, seed)
+        if not removed
+    ]
+
+
+def get_plan_total(no_of_lines, seed=0):
+    """Function to get the plan total of a synthetic bill
+
+    :return: Plans of the account and its lines that were not removed, in dollars
+    :rtype: (float)
+    """
+    rows = __get_rows__(no_of_lines, seed)
+    return (
+        ACCOUNT_CENTS
+        + sum(charges[0] for _, _, removed, _, charges in rows if not removed)
+    ) / 100
+
+
+def write_fixtures(directory, no_of_lines):
+    """Function to write users.json and venmo.json files with a user for each line
+
+    :param directory: Directory to write the files to
+    :type directory: (str)
+    :param no_of_lines: Number of lines on the account
+    :type no_of_lines: (int)
+    :return: Paths of users.json and venmo.json
+    :rtype: (tuple)
+    """
+    numbers = [get_number(num).replace("\xa0", "") for num in range(no_of_lines)]
+    users = {
+        number: {
+            "name": "User{}".format(num),
+            "email": "user{}@gmail.com".format(num),
+        }
+        for num, number in enumerate(numbers)
+    }
+    venmo = {
+        "users": {
+            number: {
+                "venmo_username": "User-{}".format(num),
+                "additional_note": "",
+                "additional_amount": 0,
+            }
+            for num, number in enumerate(numbers)
+        },
+        "token": "synthetic-token",
+    }
+    paths = (
+        os.path.join(directory, "users.json"),
+        os.path.join(directory, "venmo.json"),
+    )
+    for path, data in zip(paths, [users, venmo]):
+        with open(path, "w") as json_file:
+            json.dump(data, json_file, indent=4)
+    return paths
+
+
+def get_lines(no_of_lines, directory, seed=0):
+    """Function to get Line objects of a synthetic bill, with users.json and venmo.json
+       written to directory
+
+    :param no_of_lines: Number of lines on the account
+    :type no_of_lines: (int)
+    :param directory: Directory to write users.json and venmo.json to
+    :type directory: (str)
+    :param seed: Seed of the generated charges, defaults to 0
+    :type seed: (int), optional
+    :return: Lines on the account that were not removed
+    :rtype: (list)
+    """
+    users_file, _ = write_fixtures(directory, no_of_lines)
+    user_directory = UserDirectory(users_file)
+    return [
+        Line(prop, directory=user_directory)
+        for prop in get_account_data(no_of_lines, seed=seed)
+    ]
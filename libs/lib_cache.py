@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+"""
+Module pertaining to the on-disk cache of parsed T-Mobile bills
+    - Entries are keyed by SHA-256 of the pdf contents and lib_tmobile.PARSER_VERSION
+    - Entries are stored as gzipped json with account rows stored in title order
+    - Least recently used entries are evicted once the cache grows beyond max_bytes
+    - One cache can be shared by threads, e.g. the requests of src/daemon.py
+    - Hashes of the latest max_hashes pdfs are kept by path, size and modification time,
+      so a pdf is hashed once while it is unchanged
+    - A pdf that can not be read is a cache miss
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from tmobile.libs.lib_tmobile import PARSER_VERSION
+from tmobile.utilities.utils import get_file_hash
+
+logger = logging.getLogger(__name__)
+
+__cached_fields__ = ["positions", "titles", "plan_total", "account_total"]
+
+
+class BillCache:
+    """
+    Main class to store and look up parsed bills by the contents of their pdf
+    """
+
+    def __init__(
+        self, cache_dir="configs/cache", max_bytes=16 * 1024 * 1024, max_hashes=1024
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_hashes = max_hashes
+        self.hits = 0
+        self.misses = 0
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_hash(self, path):
+        """Function to get SHA-256 of the contents of a pdf, hashed again only once the
+           size or modification time of the pdf changes
+
+        :param path: Path to T-Mobile pdf bill
+        :type path: (str)
+        :raises OSError: If the pdf can not be read
+        :return: SHA-256 hex digest of the pdf
+        :rtype: (str)
+        """
+        stat = os.stat(path)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            known = self._hashes.get(path)
+            if known is not None and known[0] == file_key:
+                self._hashes.move_to_end(path)
+                return known[1]
+        # Hashed without the lock, so other threads are not held up by a large pdf
+        file_hash = get_file_hash(path)
+        with self._lock:
+            self._hashes[path] = (file_key, file_hash)
+            self._hashes.move_to_end(path)
+            while len(self._hashes) > self.max_hashes:
+                self._hashes.popitem(last=False)
+        return file_hash
+
+    def _get_entry_file(self, file_hash):
+        """Private function to get the cache entry file for given pdf
+
+        :param file_hash: SHA-256 of the pdf, see get_hash
+        :type file_hash: (str)
+        :return: Path to the cache entry of the pdf
+        :rtype: (str)
+        """
+        return os.path.join(
+            self.cache_dir, "{}-v{}.json.gz".format(file_hash, PARSER_VERSION)
+        )
+
+    def get(self, path):
+        """Function to get the parsed bill cached for given pdf
+
+        :param path: Path to T-Mobile pdf bill
+        :type path: (str)
+        :return: Parsed bill with the SHA-256 of its pdf as "hash" if cached | None
+                 otherwise, or if the pdf can not be read
+        :rtype: (dict | None)
+        """
+        try:
+            file_hash = self.get_hash(path)
+        except OSError as err:
+            logger.info("Could not read bill=%s: %s" % (path, err))
+            with self._lock:
+                self.misses += 1
+            return None
+        entry_file = self._get_entry_file(file_hash)
+        with self._lock:
+            try:
+                with gzip.open(entry_file, "rt") as entry:
+                    record = json.load(entry)
+                os.utime(entry_file)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            self.hits += 1
+        bill = {field: record[field] for field in __cached_fields__}
+        bill["account_to_data"] = [
+            dict(zip(record["titles"], row)) for row in record["rows"]
+        ]
+        bill.update(path=path, hash=file_hash, cached=True)
+        return bill
+
+    def put(self, path, bill):
+        """Function to cache a parsed bill for given pdf and evict least recently used bills
+
+        :param path: Path to T-Mobile pdf bill
+        :type path: (str)
+        :param bill: Parsed bill including positions, titles, totals and account_to_data
+        :type bill: (dict)
+        :return: SHA-256 of the pdf | None if the pdf can not be read and is not cached
+        :rtype: (str | None)
+        """
+        try:
+            file_hash = self.get_hash(path)
+        except OSError as err:
+            logger.info("Could not read bill=%s: %s" % (path, err))
+            return None
+        record = {field: bill[field] for field in __cached_fields__}
+        record["rows"] = [
+            [data_obj[title] for title in bill["titles"] if title in data_obj]
+            for data_obj in bill["account_to_data"]
+        ]
+        entry_file = self._get_entry_file(file_hash)
+        with self._lock:
+            with gzip.open(entry_file + ".tmp", "wt") as entry:
+                json.dump(record, entry, separators=(",", ":"))
+            os.replace(entry_file + ".tmp", entry_file)
+            self._evict()
+        return file_hash
+
+    def _evict(self):
+        """Private function to remove least recently used entries beyond max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+
+    def clear(self):
+        """Function to remove every entry from the cache"""
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+"""
+Module pertaining to the checkpoint of emails and Venmo requests sent during a run
+    - Each sent email or Venmo request is appended to a json lines file as soon as it completes
+    - Every record is written to the OS right away, so a crash of the process loses none, and
+      fsync is batched to every sync_every records or sync_interval seconds, so a power loss
+      loses at most that many
+    - A resumed run skips every line and channel the checkpoint has completed
+    - The checkpoint of a completed run is removed, so one that is left holds an
+      interrupted run and is not started over unless asked
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+__fields__ = ["line", "channel", "recipient", "total_cents", "status", "reference"]
+
+
+def __has_records__(checkpoint_file):
+    """Function to check if a checkpoint file was left with records by a previous run
+
+    :rtype: (bool)
+    """
+    return os.path.exists(checkpoint_file) and os.path.getsize(checkpoint_file) > 0
+
+
+class Checkpoint:
+    """
+    Main class to append and read records of side effects of a run
+    """
+
+    def __init__(
+        self,
+        checkpoint_file="configs/checkpoint.jsonl",
+        resume=False,
+        sync_every=32,
+        sync_interval=0.5,
+        fresh=False,
+    ):
+        if not (resume or fresh) and __has_records__(checkpoint_file):
+            raise FileExistsError(
+                "Checkpoint file={} holds an interrupted run, resume it or start a "
+                "fresh one".format(checkpoint_file)
+            )
+        self.checkpoint_file = checkpoint_file
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.records = self._read() if resume else []
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._synced = time.monotonic()
+        self._file = open(checkpoint_file, "a" if resume else "w")
+        if self._file.tell() and not self._ends_with_newline():
+            # Start after the record cut short by a crash
+            self._file.write("\n")
+
+    def _read(self):
+        """Private function to read records of a previous run, ignoring a record cut
+           short by a crash
+
+        :return: Records of the checkpoint file
+        :rtype: (list)
+        """
+        if not os.path.exists(self.checkpoint_file):
+            return []
+        records = []
+        with open(self.checkpoint_file) as checkpoint:
+            for record in checkpoint:
+                try:
+                    records.append(json.loads(record))
+                except ValueError:
+                    logger.info("Ignoring partial record=%s" % record.strip())
+        return records
+
+    def _ends_with_newline(self):
+        """Private function to check if the checkpoint file ends with a complete record
+
+        :return: True if the last byte of the file is a newline
+        :rtype: (bool)
+        """
+        with open(self.checkpoint_file, "rb") as checkpoint:
+            checkpoint.seek(-1, os.SEEK_END)
+            return checkpoint.read(1) == b"\n"
+
+    def load(self, bill_hash):
+        """Function to get the latest record of each line and channel of a bill
+
+        :param bill_hash: SHA-256 of the pdf of the bill
+        :type bill_hash: (str)
+        :return: Records by (line, channel), in the format of RunJournal.load
+        :rtype: (dict)
+        """
+        return {
+            (record["line"], record["channel"]): record
+            for record in self.records
+            if record["bill"] == bill_hash
+        }
+
+    def append(self, bill_hash, entry):
+        """Function to append the record of a completed email or Venmo request, safe to
+           call from worker threads
+
+        :param bill_hash: SHA-256 of the pdf of the bill
+        :type bill_hash: (str)
+        :param entry: Line, channel, recipient, total in cents, status and reference
+        :type entry: (tuple)
+        """
+        record = dict(zip(__fields__, entry), bill=bill_hash)
+        with self._lock:
+            self.records.append(record)
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+            self._pending += 1
+            if (
+                self._pending >= self.sync_every
+                or time.monotonic() - self._synced >= self.sync_interval
+            ):
+                self._sync()
+
+    def _sync(self):
+        """Private function to fsync pending records, called with the lock held"""
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._synced = time.monotonic()
+
+    def sync(self):
+        """Function to fsync records appended since the last sync"""
+        with self._lock:
+            if self._pending:
+                self._sync()
+
+    def close(self, completed=False):
+        """Function to fsync pending records and close the checkpoint file
+
+        :param completed: True if the run completed, its checkpoint is then removed
+        :type completed: (bool), optional
+        """
+        self.sync()
+        self._file.close()
+        if completed:
+            os.remove(self.checkpoint_file)
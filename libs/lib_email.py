@@ -1,18 +1,30 @@
 #!/usr/bin/python3
 """
 Module pertaining to email properties and functionalities
+    - Google client libraries are imported and the Gmail service is built on first use,
+      so runs that send no email do no OAuth or network work
 """
 import pickle
 import base64
+import json
+import logging
 import os.path
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from email.mime.text import MIMEText
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from tmobile.utilities.profiler import record
+from tmobile.utilities.utils import get_percentile
 
-# If modifying these scopes, delete the file token.pickle.
+logger = logging.getLogger(__name__)
+
+# If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
 
+# Gmail rejects batches of more than 100 requests and advises against more than 50
+BATCH_SIZE = 50
+
 
 class EmailFailure(Exception):
     """Raise this error when service failed to send email
@@ -22,7 +34,35 @@ class EmailFailure(Exception):
     """
 
 
-def create_message(sender_email, to_email, subject, message_text):
+def _get_send_errors():
+    """Private function to get errors raised by Gmail API requests
+
+    :return: Exception types raised when a request fails
+    :rtype: (tuple)
+    """
+    import httplib2
+    from googleapiclient.errors import HttpError
+
+    return (HttpError, httplib2.HttpLib2Error, OSError)
+
+
+def _expires_soon(creds, margin=timedelta(minutes=5)):
+    """Private function to check if credentials expire within given margin
+
+    :param creds: Credentials to check
+    :type creds: (google.oauth2.credentials.Credentials)
+    :param margin: Time before expiry to refresh at, defaults to 5 minutes
+    :type margin: (timedelta), optional
+    :return: True if credentials expire within margin
+    :rtype: (bool)
+    """
+    if creds.expiry is None:
+        return False
+    # google-auth keeps expiry as a naive UTC datetime
+    return creds.expiry - margin <= datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def create_message(sender_email, to_email, subject, message_text, subtype="plain"):
     """Function to generate a raw format utf-8 message based on given inputs
 
     :param sender_email: Email of the sender
@@ -33,10 +73,12 @@ def create_message(sender_email, to_email, subject, message_text):
     :type subject: (str)
     :param message_text: Text to be included in the email body
     :type message_text: (str)
+    :param subtype: Subtype of the body, "plain" or "html", defaults to "plain"
+    :type subtype: (str), optional
     :return: Raw formateed utf-8 message generated based on given inputs
     :rtype: (dict)
     """
-    message = MIMEText(message_text)
+    message = MIMEText(message_text, subtype)
     message["to"] = to_email
     message["from"] = sender_email
     message["subject"] = subject
@@ -49,32 +91,141 @@ class EmailClient:
     Main class to perform operations pertaining to email
     """
 
-    def __init__(self):
-        self.service = build("gmail", "v1", credentials=self._get_creds())
+    __credentials_file__ = "configs/credentials.json"
+    __token_file__ = "configs/token.json"
+    __legacy_token_file__ = "configs/token.pickle"
+    __discovery_file__ = "configs/gmail_discovery.json"
 
-    def _get_creds(self):
-        """Shows basic usage of the Gmail API.
-        Lists the user's Gmail labels.
+    def __init__(self, service=None, workers=4):
+        self.creds = None
+        self.workers = workers
+        self._service = service
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def service(self):
+        """Property defining the Gmail service, built on first use from the
+           locally cached discovery document
+
+        :return: Gmail v1 discovery service
+        :rtype: (googleapiclient.discovery.Resource)
         """
-        creds = None
-        # The file token.pickle stores the user's access and refresh tokens, and is
-        # created automatically when the authorization flow completes for the first
-        # time.
-        if os.path.exists("configs/token.pickle"):
-            with open("configs/token.pickle", "rb") as token:
-                creds = pickle.load(token)
-        # If there are no (valid) credentials available, let the user log in.
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    "configs/credentials.json", SCOPES
+        with self._lock:
+            if self._service is None:
+                from googleapiclient.discovery import build_from_document
+
+                self.creds = self._get_creds()
+                self._service = build_from_document(
+                    self._get_discovery_document(), credentials=self.creds
                 )
-                creds = flow.run_local_server(port=0)
-            # Save the credentials for the next run
-            with open("configs/token.pickle", "wb") as token:
-                pickle.dump(creds, token)
+        return self._service
+
+    def _get_discovery_document(self):
+        """Private function to get the Gmail discovery document, cached in
+           configs/gmail_discovery.json after it is first obtained
+
+        :raises googleapiclient.errors.HttpError: If the document could not be fetched
+        :raises googleapiclient.errors.InvalidJsonError: If the fetched document is not
+                                                         a json object
+        :return: Gmail v1 discovery document
+        :rtype: (str)
+        """
+        if os.path.exists(EmailClient.__discovery_file__):
+            with open(EmailClient.__discovery_file__) as discovery_file:
+                return discovery_file.read()
+        from googleapiclient.discovery import DISCOVERY_URI
+        from googleapiclient.discovery_cache import get_static_doc
+
+        document = get_static_doc("gmail", "v1")
+        if document is None:
+            document = self._fetch_discovery_document(
+                DISCOVERY_URI.format(api="gmail", apiVersion="v1")
+            )
+        with open(EmailClient.__discovery_file__, "w") as discovery_file:
+            discovery_file.write(document)
+        return document
+
+    @staticmethod
+    def _fetch_discovery_document(uri):
+        """Private function to fetch a discovery document, checked before it is cached
+
+        :param uri: Discovery uri of the API
+        :type uri: (str)
+        :raises googleapiclient.errors.HttpError: If the response is not 200 OK
+        :raises googleapiclient.errors.InvalidJsonError: If the response is not a json
+                                                         object
+        :return: Discovery document
+        :rtype: (str)
+        """
+        import httplib2
+        from googleapiclient.errors import HttpError, InvalidJsonError
+
+        resp, content = httplib2.Http().request(uri)
+        if resp.status != 200:
+            raise HttpError(resp, content, uri=uri)
+        try:
+            document = content.decode("utf-8")
+            is_object = isinstance(json.loads(document), dict)
+        except ValueError as err:
+            raise InvalidJsonError("Invalid discovery document=%s" % uri) from err
+        if not is_object:
+            raise InvalidJsonError("Invalid discovery document=%s" % uri)
+        return document
+
+    def _load_creds(self):
+        """Private function to load stored credentials, migrating the pickled
+           credentials of older versions to the json token format
+
+        :return: Stored credentials | None if there are none
+        :rtype: (google.oauth2.credentials.Credentials | None)
+        """
+        from google.oauth2.credentials import Credentials
+
+        if os.path.exists(EmailClient.__token_file__):
+            return Credentials.from_authorized_user_file(
+                EmailClient.__token_file__, SCOPES
+            )
+        if os.path.exists(EmailClient.__legacy_token_file__):
+            with open(EmailClient.__legacy_token_file__, "rb") as token:
+                creds = pickle.load(token)
+            self._save_creds(creds)
+            return creds
+        return None
+
+    def _save_creds(self, creds):
+        """Private function to store credentials in the json token format
+
+        :param creds: Credentials to store
+        :type creds: (google.oauth2.credentials.Credentials)
+        """
+        with open(EmailClient.__token_file__, "w") as token:
+            token.write(creds.to_json())
+
+    def _get_creds(self):
+        """Function to get credentials for the Gmail API. Stored credentials are
+           refreshed only when they are about to expire, and the user is asked to
+           log in only if there are no credentials that can be refreshed
+
+        :return: Credentials for the Gmail API
+        :rtype: (google.oauth2.credentials.Credentials)
+        """
+        creds = self._load_creds()
+        if creds and creds.valid and not _expires_soon(creds):
+            return creds
+        if creds and creds.refresh_token:
+            from google.auth.transport.requests import Request
+
+            creds.refresh(Request())
+        else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
+
+            flow = InstalledAppFlow.from_client_secrets_file(
+                EmailClient.__credentials_file__, SCOPES
+            )
+            creds = flow.run_local_server(port=0)
+        # Save the credentials for the next run
+        self._save_creds(creds)
         return creds
 
     def send_message(self, message, user_id="me"):
@@ -93,3 +244,123 @@ class EmailClient:
         return message.get(
             "id", EmailFailure("Failed to send email to address=%s" % user_id)
         )
+
+    def send_messages(
+        self, messages, user_id="me", batch_size=BATCH_SIZE, on_result=None
+    ):
+        """Function to send many emails using Gmail batch requests of batch_size emails,
+           or on a pool of self.workers threads if the service does not support batching
+
+        :param messages: Email bodies generated from lib_email.create_message
+        :type messages: (list)
+        :param user_id: [description], defaults to "me"
+        :type user_id: str, optional
+        :param batch_size: Maximum number of emails per batch request, defaults to BATCH_SIZE
+        :type batch_size: (int), optional
+        :param on_result: Called with the index and result of each email as soon as it
+                          is sent, from worker threads when not batching, defaults to None
+        :type on_result: (callable), optional
+        :return: Id, error and latency of each email, in the same order as given messages
+        :rtype: (list)
+        """
+        started = time.perf_counter()
+        on_result = on_result or (lambda index, result: None)
+        if hasattr(self.service, "new_batch_http_request"):
+            results = []
+            for start in range(0, len(messages), batch_size):
+                end = start + batch_size
+                for result in self._send_batch(messages[start:end], user_id):
+                    on_result(len(results), result)
+                    results.append(result)
+        else:
+
+            def __send__(index):
+                result = self._send_one(messages[index], user_id)
+                on_result(index, result)
+                return result
+
+            with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+                results = list(pool.map(__send__, range(len(messages))))
+        logger.info(
+            "Sent %s of %s email(s) in %.2fs, p95 latency %.2fs"
+            % (
+                sum(1 for result in results if result["error"] is None),
+                len(messages),
+                time.perf_counter() - started,
+                get_percentile([result["latency"] for result in results], 95),
+            )
+        )
+        return results
+
+    def _send_batch(self, messages, user_id):
+        """Private function to send emails in one Gmail batch request
+
+        :return: Id, error and latency of each email
+        :rtype: (list)
+        """
+        results = [{"id": None, "error": None} for _ in messages]
+
+        def __callback__(request_id, response, exception):
+            result = results[int(request_id)]
+            if exception is not None:
+                result["error"] = EmailFailure(str(exception))
+            elif not response or "id" not in response:
+                result["error"] = EmailFailure("Failed to send email")
+            else:
+                result["id"] = response["id"]
+
+        batch = self.service.new_batch_http_request(callback=__callback__)
+        for index, message in enumerate(messages):
+            batch.add(
+                self.service.users().messages().send(userId=user_id, body=message),
+                request_id=str(index),
+            )
+        started = time.perf_counter()
+        try:
+            # Batches may run on several threads, each with its own connection
+            batch.execute(**self._get_thread_http())
+        except _get_send_errors() as err:
+            for result in results:
+                result["error"] = result["error"] or EmailFailure(str(err))
+        latency = time.perf_counter() - started
+        for result in results:
+            result["latency"] = latency
+        record("email_batch", latency, emails=len(messages))
+        return results
+
+    def _send_one(self, message, user_id):
+        """Private function to send one email, runs inside worker threads
+
+        :return: Id, error and latency of the email
+        :rtype: (dict)
+        """
+        started = time.perf_counter()
+        result = {"id": None, "error": None}
+        request = self.service.users().messages().send(userId=user_id, body=message)
+        try:
+            response = request.execute(**self._get_thread_http())
+        except _get_send_errors() as err:
+            result["error"] = EmailFailure(str(err))
+        else:
+            result["id"] = response.get("id")
+            if result["id"] is None:
+                result["error"] = EmailFailure("Failed to send email")
+        result["latency"] = time.perf_counter() - started
+        record("email", result["latency"], error=result["error"])
+        return result
+
+    def _get_thread_http(self):
+        """Private function to get http arguments for a request or batch executed on a
+           thread, as httplib2 connections can not be shared between threads
+
+        :return: Keyword arguments for HttpRequest.execute
+        :rtype: (dict)
+        """
+        if self.creds is None:
+            return {}
+        if not hasattr(self._local, "http"):
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+
+            self._local.http = AuthorizedHttp(self.creds, http=httplib2.Http())
+        return {"http": self._local.http}
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+"""
+Module pertaining to exporting the charges of each line of computed bills
+    - Rows are written as each bill is computed, so exports of any number of bills use
+      the same memory
+    - csv and jsonl rows are written straight to the file, parquet rows are buffered
+      and written one row group at a time
+    - Amounts are in cents, as in lib_store
+    - pyarrow is an optional dependency only needed for parquet, imported on first use
+"""
+import csv
+import json
+import os
+from tmobile.libs.lib_store import get_bill_period
+from tmobile.utilities.utils import normalize_phone, to_cents
+
+FIELDS = (
+    "period",
+    "user",
+    "line",
+    "type",
+    "equipment_cents",
+    "services_cents",
+    "one_time_cents",
+    "basic_cents",
+    "total_cents",
+)
+
+# Rows of each row group of a parquet export
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def get_export_rows(bill):
+    """Function to get the export row of each line of a computed bill
+
+    :param bill: Computed bill returned by src/main.py __compute_bill__
+    :type bill: (dict)
+    :return: Values of each line in FIELDS order
+    :rtype: (generator)
+    """
+    _, _, period = get_bill_period(bill)
+    for line, _, total in bill["charges"]:
+        charges = line.charges
+        total_cents = to_cents(total)
+        yield (
+            period,
+            line.user["name"],
+            normalize_phone(line.line),
+            line.linetype,
+            charges.equipment_cents,
+            charges.services_cents,
+            charges.one_time_cents,
+            total_cents - charges.own_charges_cents,
+            total_cents,
+        )
+
+
+class Exporter:
+    """
+    Base class of a file the lines of computed bills are exported to
+    """
+
+    name = None
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_bill(self, bill):
+        """Function to export every line of a computed bill
+
+        :param bill: Computed bill returned by src/main.py __compute_bill__
+        :type bill: (dict)
+        :return: Number of rows written
+        :rtype: (int)
+        """
+        rows = 0
+        for row in get_export_rows(bill):
+            self._write_row(row)
+            rows += 1
+        self.rows += rows
+        return rows
+
+    def _write_row(self, row):
+        """Private function to write the row of a line
+
+        :param row: Values of the line in FIELDS order
+        :type row: (tuple)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Function to write everything left and close the file"""
+        raise NotImplementedError
+
+
+class CsvExporter(Exporter):
+    """
+    Exporter of a csv file with a header row
+    """
+
+    name = "csv"
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(FIELDS)
+
+    def _write_row(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._file.close()
+
+
+class JsonLinesExporter(Exporter):
+    """
+    Exporter of a json object per line
+    """
+
+    name = "jsonl"
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._file = open(path, "w")
+
+    def _write_row(self, row):
+        self._file.write(json.dumps(dict(zip(FIELDS, row))))
+        self._file.write("\n")
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetExporter(Exporter):
+    """
+    Exporter of a parquet file written in row groups of row_group_size rows
+    """
+
+    name = "parquet"
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(path)
+        self.row_group_size = row_group_size
+        self._pa = pa
+        self._schema = pa.schema(
+            [(field, pa.string()) for field in FIELDS[:4]]
+            + [(field, pa.int64()) for field in FIELDS[4:]]
+        )
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._columns = [[] for _ in FIELDS]
+
+    def _write_row(self, row):
+        for column, value in zip(self._columns, row):
+            column.append(value)
+        if len(self._columns[0]) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        """Private function to write the buffered rows as a row group"""
+        if not self._columns[0]:
+            return
+        table = self._pa.Table.from_arrays(
+            [
+                self._pa.array(column, type=field.type)
+                for column, field in zip(self._columns, self._schema)
+            ],
+            schema=self._schema,
+        )
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._columns = [[] for _ in FIELDS]
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+EXPORTERS = {
+    exporter.name: exporter
+    for exporter in [CsvExporter, JsonLinesExporter, ParquetExporter]
+}
+
+
+def open_exporter(path, fmt=None):
+    """Function to open an exporter of given file
+
+    :param path: Path to the export file
+    :type path: (str)
+    :param fmt: csv | jsonl | parquet, defaults to the extension of the path
+    :type fmt: (str), optional
+    :raises ValueError: If the format is not one of EXPORTERS
+    :return: Exporter of the file
+    :rtype: (Exporter)
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in EXPORTERS:
+        raise ValueError(
+            "Unknown export format=%s, expected one of %s" % (fmt, ", ".join(EXPORTERS))
+        )
+    return EXPORTERS[fmt](path)
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""
+Module pertaining to the journal of emails and Venmo requests sent for each bill
+    - Each line of a bill has one entry per channel ("email" | "venmo") with the recipient,
+      total in cents, status and reference (email message id) of the latest attempt
+    - A re-run sends again only to lines whose total or recipient changed or whose
+      latest attempt failed. Attempts with an UNKNOWN outcome are not sent again, as
+      they may have reached the recipient
+"""
+import sqlite3
+import time
+
+__schema__ = """
+CREATE TABLE IF NOT EXISTS journal (
+    bill_hash TEXT NOT NULL,
+    line TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    recipient TEXT,
+    total_cents INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    reference TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (bill_hash, line, channel)
+);
+"""
+
+__upsert_entry__ = """
+INSERT INTO journal (bill_hash, line, channel, recipient, total_cents, status,
+                     reference, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (bill_hash, line, channel) DO UPDATE SET
+    recipient = excluded.recipient,
+    total_cents = excluded.total_cents,
+    status = excluded.status,
+    reference = excluded.reference,
+    updated_at = excluded.updated_at
+"""
+
+# Statuses of attempts that need not be repeated while total and recipient are unchanged,
+# UNKNOWN attempts may have been sent and are checked by hand instead
+DONE_STATUSES = ("SUCCESS", "SKIPPED", "UNKNOWN")
+
+
+class RunJournal:
+    """
+    Main class to record and look up what was sent to each line of a bill
+    """
+
+    def __init__(self, db_file="configs/tmobile.db"):
+        self.db_file = db_file
+        # Bills may be dispatched from a thread other than the one that opened the journal
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        self.connection.executescript(__schema__)
+
+    def close(self):
+        """Function to close the connection to the journal"""
+        self.connection.close()
+
+    def load(self, bill_hash):
+        """Function to get the latest attempt of each line and channel of a bill
+
+        :param bill_hash: SHA-256 of the pdf of the bill
+        :type bill_hash: (str)
+        :return: Recipient, total in cents, status and reference by (line, channel)
+        :rtype: (dict)
+        """
+        rows = self.connection.execute(
+            """
+            SELECT line, channel, recipient, total_cents, status, reference
+            FROM journal WHERE bill_hash = ?
+            """,
+            (bill_hash,),
+        )
+        return {
+            (line, channel): {
+                "recipient": recipient,
+                "total_cents": total_cents,
+                "status": status,
+                "reference": reference,
+            }
+            for line, channel, recipient, total_cents, status, reference in rows
+        }
+
+    def record(self, bill_hash, entries):
+        """Function to record attempts of a bill in one transaction
+
+        :param bill_hash: SHA-256 of the pdf of the bill
+        :type bill_hash: (str)
+        :param entries: Line, channel, recipient, total in cents, status and reference
+                        of each attempt
+        :type entries: (list)
+        """
+        updated_at = time.time()
+        with self.connection:
+            self.connection.executemany(
+                __upsert_entry__,
+                [(bill_hash,) + tuple(entry) + (updated_at,) for entry in entries],
+            )
+
+
+def is_dispatched(entry, recipient, total_cents):
+    """Function to check if a journal entry covers sending total_cents to recipient
+
+    :param entry: Entry of the line and channel from RunJournal.load | None
+    :type entry: (dict | None)
+    :param recipient: Email address or Venmo user-name the line is sent to
+    :type recipient: (str)
+    :param total_cents: Total of the line in cents
+    :type total_cents: (int)
+    :return: True if it was sent, or may have been, before with the same total and
+             recipient
+    :rtype: (bool)
+    """
+    return (
+        entry is not None
+        and entry["status"] in DONE_STATUSES
+        and entry["recipient"] == recipient
+        and entry["total_cents"] == total_cents
+    )
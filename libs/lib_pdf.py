@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+"""
+Module pertaining to text extraction from T-Mobile pdf bills
+    - Each extractor returns the list of text lines expected by lib_tmobile.TMobile
+    - Backends are imported lazily so only the selected one needs to be installed
+"""
+import importlib
+import time
+
+
+class PdfExtractor:
+    """
+    Base class for pdf text extraction backends
+    """
+
+    name = None
+
+    def warm_up(self):
+        """Function to import the backend ahead of the first extraction"""
+
+    def extract(self, path):
+        """Function to extract text lines from given pdf file
+
+        :param path: Path to T-Mobile pdf bill
+        :type path: (str)
+        :return: Lines of text extracted from the pdf
+        :rtype: (list)
+        """
+        content = "\n".join(self._iter_pages(path, stats={"pages_read": 0}))
+        if not content.strip():
+            raise OSError("Could not extract any text from file={}".format(path))
+        return content.split("\n")
+
+    def iter_lines(self, path, stats=None):
+        """Function to lazily yield text lines from given pdf file page by page.
+           Pages are only read as the lines are consumed, so a consumer that stops
+           early (e.g. at the DETAILED marker) never reads the remaining pages
+
+        :param path: Path to T-Mobile pdf bill
+        :type path: (str)
+        :param stats: Dict updated with "pages_read", "total_pages" and "seconds" spent
+                      reading pages, defaults to None
+        :type stats: (dict), optional
+        :return: Generator of lines of text extracted from the pdf
+        :rtype: (generator)
+        """
+        stats = {} if stats is None else stats
+        stats.update(pages_read=0, total_pages=0, seconds=0.0)
+        pages = self._iter_pages(path, stats=stats)
+        while True:
+            started = time.perf_counter()
+            content = next(pages, None)
+            stats["seconds"] += time.perf_counter() - started
+            if content is None:
+                return
+            yield from content.split("\n")
+
+    def _iter_pages(self, path, stats):
+        """Private function to yield text content of given pdf file page by page
+
+        :param path: Path to T-Mobile pdf bill
+        :type path: (str)
+        :param stats: Dict to update with "pages_read" and "total_pages"
+        :type stats: (dict)
+        :return: Generator of text content of each page
+        :rtype: (generator)
+        """
+        raise NotImplementedError
+
+
+class PypdfExtractor(PdfExtractor):
+    """
+    Pure python, in-process extraction backend based on pypdf
+    """
+
+    name = "pypdf"
+
+    def warm_up(self):
+        importlib.import_module("pypdf")
+
+    def _iter_pages(self, path, stats):
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        stats["total_pages"] = len(reader.pages)
+        for page in reader.pages:
+            stats["pages_read"] += 1
+            yield page.extract_text() or ""
+
+
+class TikaExtractor(PdfExtractor):
+    """
+    Extraction backend based on Apache Tika, needs a Java runtime for the Tika server.
+    Tika extracts the whole document at once, so every page is always read
+    """
+
+    name = "tika"
+
+    def warm_up(self):
+        importlib.import_module("tika.parser")
+
+    def _iter_pages(self, path, stats):
+        from tika import parser
+
+        raw = parser.from_file(path)
+        pages = int((raw.get("metadata") or {}).get("xmpTPg:NPages", 1))
+        stats["total_pages"] = stats["pages_read"] = pages
+        yield raw["content"] or ""
+
+
+EXTRACTORS = {
+    PypdfExtractor.name: PypdfExtractor,
+    TikaExtractor.name: TikaExtractor,
+}
+
+DEFAULT_EXTRACTOR = PypdfExtractor.name
+
+__extractor_instances__ = {}
+
+
+def get_extractor(name=DEFAULT_EXTRACTOR):
+    """Function to get the extractor registered with given name, one instance per process
+
+    :param name: Name of the extraction backend, defaults to DEFAULT_EXTRACTOR
+    :type name: (str), optional
+    :raises ValueError: If no extractor is registered with given name
+    :return: Extractor for given name
+    :rtype: (PdfExtractor)
+    """
+    if name not in EXTRACTORS:
+        raise ValueError(
+            "Unknown extractor={}, choose one of {}".format(name, sorted(EXTRACTORS))
+        )
+    if name not in __extractor_instances__:
+        __extractor_instances__[name] = EXTRACTORS[name]()
+    return __extractor_instances__[name]
@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+"""
+Module pertaining to the SQLite store of processed T-Mobile bills
+    - Each bill is stored once, keyed by SHA-256 of its pdf, and stored again replaces it
+    - Each bill is written in one transaction with the charges of its lines in integer cents
+    - Lines are indexed by number and period (YYYY-MM) of their bill, so history
+      queries do not re-parse archived pdfs
+"""
+import calendar
+import os
+import sqlite3
+import threading
+import time
+from tmobile.utilities.utils import (
+    get_file_hash,
+    normalize_phone,
+    parse_year,
+    to_cents,
+)
+
+__schema__ = """
+CREATE TABLE IF NOT EXISTS bills (
+    bill_hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    period TEXT NOT NULL,
+    month TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    plan_total_cents INTEGER NOT NULL,
+    account_total_cents INTEGER,
+    total_cents INTEGER NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lines (
+    bill_hash TEXT NOT NULL REFERENCES bills (bill_hash) ON DELETE CASCADE,
+    period TEXT NOT NULL,
+    line TEXT NOT NULL,
+    user TEXT NOT NULL,
+    type TEXT NOT NULL,
+    equipment_cents INTEGER NOT NULL,
+    services_cents INTEGER NOT NULL,
+    plans_cents INTEGER NOT NULL,
+    one_time_cents INTEGER NOT NULL,
+    basic_cents INTEGER NOT NULL,
+    total_cents INTEGER NOT NULL,
+    PRIMARY KEY (bill_hash, line)
+);
+CREATE INDEX IF NOT EXISTS idx_bills_period ON bills (period);
+CREATE INDEX IF NOT EXISTS idx_lines_line ON lines (line, period);
+CREATE INDEX IF NOT EXISTS idx_lines_period ON lines (period);
+"""
+
+__upsert_bill__ = """
+INSERT INTO bills (bill_hash, path, period, month, year, plan_total_cents,
+                   account_total_cents, total_cents, stored_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (bill_hash) DO UPDATE SET
+    path = excluded.path,
+    period = excluded.period,
+    month = excluded.month,
+    year = excluded.year,
+    plan_total_cents = excluded.plan_total_cents,
+    account_total_cents = excluded.account_total_cents,
+    total_cents = excluded.total_cents,
+    stored_at = excluded.stored_at
+"""
+
+
+def get_bill_period(bill):
+    """Function to get the period of a computed bill, with the year taken from the
+       file name e.g. SummaryBillApr2020.pdf -> "2020-04", else from bill["year"]
+
+    :param bill: Computed bill returned by src/main.py __compute_bill__
+    :type bill: (dict)
+    :return: Month abbreviation, year and period (YYYY-MM) of the bill
+    :rtype: (tuple)
+    """
+    month = bill["months"]["current_month"]
+    base_name, _ = os.path.splitext(os.path.basename(bill["path"]))
+    year = parse_year(base_name)
+    year = bill["year"] if year is None else year
+    period = "{:04d}-{:02d}".format(year, list(calendar.month_abbr).index(month))
+    return month, year, period
+
+
+class BillStore:
+    """
+    Main class to store processed bills and query their history
+    """
+
+    def __init__(self, db_file="configs/tmobile.db"):
+        self.db_file = db_file
+        # Bills may be stored from a thread other than the one that opened the store
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(__schema__)
+
+    def close(self):
+        """Function to close the connection to the store"""
+        self.connection.close()
+
+    def put(self, bill, bill_hash=None):
+        """Function to store a computed bill and its lines, replacing any bill stored
+           for the same pdf, in one transaction
+
+        :param bill: Computed bill returned by src/main.py __compute_bill__
+        :type bill: (dict)
+        :param bill_hash: SHA-256 of the pdf of the bill, defaults to hash of bill["path"]
+        :type bill_hash: (str), optional
+        :return: SHA-256 the bill is stored by
+        :rtype: (str)
+        """
+        bill_hash = bill_hash or get_file_hash(bill["path"])
+        month, year, period = get_bill_period(bill)
+        account_total = bill.get("account_total")
+        rows = []
+        for line, _, total in bill["charges"]:
+            charges = line.charges
+            total_cents = to_cents(total)
+            rows.append(
+                (
+                    bill_hash,
+                    period,
+                    normalize_phone(line.line),
+                    line.user["name"],
+                    line.linetype,
+                    charges.equipment_cents,
+                    charges.services_cents,
+                    charges.plans_cents,
+                    charges.one_time_cents,
+                    total_cents - charges.own_charges_cents,
+                    total_cents,
+                )
+            )
+        with self._lock, self.connection:
+            self.connection.execute(
+                __upsert_bill__,
+                (
+                    bill_hash,
+                    bill["path"],
+                    period,
+                    month,
+                    year,
+                    to_cents(bill["plan_total"]),
+                    None if account_total is None else to_cents(account_total),
+                    to_cents(bill["total"]),
+                    time.time(),
+                ),
+            )
+            self.connection.execute(
+                "DELETE FROM lines WHERE bill_hash = ?", (bill_hash,)
+            )
+            self.connection.executemany(
+                "INSERT INTO lines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        return bill_hash
+
+    def get_periods(self):
+        """Function to get the periods of stored bills
+
+        :return: Periods (YYYY-MM) of stored bills, oldest first
+        :rtype: (list)
+        """
+        return [
+            period
+            for (period,) in self.connection.execute(
+                "SELECT DISTINCT period FROM bills ORDER BY period"
+            )
+        ]
+
+    def get_totals_by_user(self, months=24):
+        """Function to get total charges of each user over the latest stored months
+
+        :param months: Number of latest stored periods to sum, defaults to 24
+        :type months: (int), optional
+        :return: User, number of bills and total in cents, highest total first
+        :rtype: (list)
+        """
+        return self.connection.execute(
+            """
+            SELECT user, COUNT(*), SUM(total_cents) AS total
+            FROM lines
+            WHERE period IN (
+                SELECT DISTINCT period FROM bills ORDER BY period DESC LIMIT ?
+            )
+            GROUP BY user
+            ORDER BY total DESC, user
+            """,
+            (months,),
+        ).fetchall()
+
+    def get_line_history(self, line):
+        """Function to get the charges of a line on each stored bill
+
+        :param line: Number associated with line, in any format
+        :type line: (str)
+        :return: Period, equipment, services, plans, one-time, basic and total in cents
+        :rtype: (list)
+        """
+        return self.connection.execute(
+            """
+            SELECT period, equipment_cents, services_cents, plans_cents,
+                   one_time_cents, basic_cents, total_cents
+            FROM lines
+            WHERE line = ?
+            ORDER BY period
+            """,
+            (normalize_phone(line),),
+        ).fetchall()
+
+    def get_equipment_changes(self):
+        """Function to get lines whose equipment charge changed from their previous bill
+
+        :return: Line, user, period, previous and current equipment charge in cents
+        :rtype: (list)
+        """
+        return self.connection.execute("""
+            SELECT line, user, period, previous, equipment_cents FROM (
+                SELECT line, user, period, equipment_cents,
+                       LAG(equipment_cents) OVER (
+                           PARTITION BY line ORDER BY period
+                       ) AS previous
+                FROM lines
+            )
+            WHERE previous IS NOT NULL AND previous != equipment_cents
+            ORDER BY period, line
+            """).fetchall()
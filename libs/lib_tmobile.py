@@ -1,73 +1,215 @@
 #!/usr/bin/python3
 """
 Module pertaining to T-Mobile account details that are parsed from PDF provided by the user
+    - parse_bill walks the extracted lines once and builds an immutable ParsedBill
+    - Rows of the summary are split by the LayoutProfile of its header row
+    - TMobile exposes the parsed bill with the attributes used across the application
 """
+import threading
+from typing import NamedTuple, Tuple
 from tmobile.utilities.utils import parse_to_num, clean_chunk
 
+# Bump whenever parsed output changes so cached bills are parsed again
+PARSER_VERSION = 2
 
-class TMobile:
+__layouts__ = {}
+__layouts_lock__ = threading.Lock()
+
+# Types of lines of more than one word, told apart from the status of the line before them
+__multi_word_types__ = (("Mobile", "Internet"),)
+
+
+def __get_type_length__(words):
+    """Function to get the number of words of the type of a line ending given words
+
+    :param words: Words of the status and type of a line e.g. ["New", "Mobile", "Internet"]
+    :type words: (list)
+    :return: Number of words of the type, 1 unless it is one of __multi_word_types__
+    :rtype: (int)
     """
-    Main class to perform get details pertaining to T-Mobile account
+    for line_type in __multi_word_types__:
+        first = len(words) - len(line_type)
+        if first >= 0 and tuple(words[first:]) == line_type:
+            return len(line_type)
+    return 1
+
+
+class LayoutProfile:
+    """
+    Layout of the summary rows of a bill with given titles. A row is split once on
+    whitespace, the columns after the type of the line are its last tokens, and the
+    words between the phone number and them hold the type e.g. "Mobile Internet", after
+    any status e.g. " - Transferred to T-Mobile", which is set aside without being known
     """
 
-    def __init__(self, raw_data):
-        self.raw_data = raw_data
-        self.positions = self._get_start_end_positions()
-        self.plan_total = self._get_plan_total()
-        self.account_total = self._get_account_total()
-        self.titles = self.get_titles()
+    def __init__(self, name, titles):
+        if len(titles) < 2 or titles[0] != "Line":
+            raise OSError("Layout={} needs Line and other titles".format(name))
+        self.name = name
+        self.titles = tuple(titles)
+        self._columns = len(titles) - 1
 
-    @property
-    def _data(self):
-        """Private function to get required chunk of the data from the file
+    def tokenize(self, chunk):
+        """Function to split a summary row into the value of each title
 
-        :return: Required data from the file
-        :rtype: (str)
+        :param chunk: Row of the summary e.g. "(123)\xa0456-7890 - New Voice $4.29 - -"
+        :type chunk: (str)
+        :return: Values in title order and status of the line e.g. "New", None without
+                 status | None if the row does not start with a phone number
+        :rtype: (tuple)
         """
-        start = self.positions["start"] + 1
-        end = self.positions["end"]
-        return self.raw_data[start:end]
+        tokens = chunk.split()
+        # Index of the last word of the type, the columns after it are single tokens
+        start = len(tokens) - self._columns
+        if start < 1 or tokens[0][0] != "(":
+            return None
+        line, words_at = tokens[0], 1
+        # Extractors put a non-breaking or plain space inside the phone number
+        if start > 1 and tokens[1][0].isdigit():
+            line, words_at = line + tokens[1], 2
+        if len(line) != 13:
+            return None
+        end = start + 1
+        words = tokens[words_at:end]
+        status = None
+        if words[0] == "-" and len(words) > 1:
+            words = words[1:]
+            type_length = __get_type_length__(words)
+            status = " ".join(words[:-type_length]) or None
+            words = words[-type_length:]
+        return (line, " ".join(words)) + tuple(tokens[end:]), status
 
-    def _get_start_end_positions(self):
-        """Function to parse the bill and get start & end
-           positions of required chunk of data from the file
 
-        :return: Start and End position of the chunk of data needed on the file
-        :rtype: (dict)
-        :raises: OSError if required data is not found in given pdf
-        """
-        start_pos = end_pos = 0
-        for _, detail in enumerate(self.raw_data):
-            if "SUMMARY" in detail:
-                start_pos = _
-            if "DETAILED" in detail:
-                end_pos = _
-            if start_pos > 0 and end_pos > 0:
-                break
-        if not 0 <= start_pos < end_pos:
-            raise OSError(
-                "Could not parse given pdf for required data. \
-                Please verify or contact developer"
-            )
-        return {"start": start_pos, "end": end_pos}
-
-    def _get_plan_total(self):
-        """Private function to get plan total
-
-        :return: Total plan amount on account
-        :rtype: (int)
-        """
-        content = self._data[2].split()
-        return parse_to_num(content[1])
+def register_layout(name, titles):
+    """Function to register the layout of bills whose header row has given titles, see
+       the layouts registered below for the headers of T-Mobile bills
+
+    :param name: Name of the layout e.g. "summary"
+    :type name: (str)
+    :param titles: Titles of the header row, without "charges"
+    :type titles: (list)
+    :raises OSError: If the titles do not start with Line and another title
+    :return: Registered layout
+    :rtype: (LayoutProfile)
+    """
+    layout = LayoutProfile(name, titles)
+    with __layouts_lock__:
+        __layouts__[layout.titles] = layout
+    return layout
+
 
-    def _get_account_total(self):
-        """Private function to get total amount on the account
+def get_layout(titles):
+    """Function to get the registered layout of bills whose header row has given titles
 
-        :return: Total amount on the account
-        :rtype: (int)
+    :param titles: Titles of the header row, without "charges"
+    :type titles: (tuple)
+    :raises OSError: If no layout is registered for the titles
+    :return: Layout of the summary rows
+    :rtype: (LayoutProfile)
+    """
+    layout = __layouts__.get(tuple(titles))
+    if layout is None:
+        # Raised as the parser raises for any bill it can not read
+        raise OSError(
+            "Could not parse given pdf, unknown summary header=%s" % " ".join(titles)
+        )
+    return layout
+
+
+register_layout(
+    "summary", ["Line", "Type", "Plans", "Equipment", "Services", "One-time", "Total"]
+)
+register_layout(
+    "summary-without-one-time",
+    ["Line", "Type", "Plans", "Equipment", "Services", "Total"],
+)
+
+
+class ParsedBill(NamedTuple):
+    """
+    Immutable summary of a T-Mobile bill, rows hold values of each line in title order
+    """
+
+    start: int
+    end: int
+    titles: Tuple[str, ...]
+    plan_total: float
+    account_total: float
+    rows: Tuple[Tuple[str, ...], ...]
+
+    def get_account_data_mapping(self):
+        """Function to get an account to data mapping for each line on account
+
+        :return: List of key-value pairs of account mapped to its details
+        :rtype: (list)
         """
-        content = self._data[2].split()
-        return parse_to_num(content[-1])
+        return [dict(zip(self.titles, row)) for row in self.rows]
+
+
+def parse_bill(raw_data):
+    """Function to parse the bill in a single pass over the extracted lines.
+       Lines between the last "SUMMARY" and the first "DETAILED" marker hold, once
+       blank lines are dropped, the header row, the totals row, the account row and
+       a row for each line on the account. Lines after the DETAILED marker are never read
+
+    :param raw_data: Lines of text extracted from the pdf, a list or any iterator
+    :type raw_data: (iterable)
+    :raises OSError: If required data is not found in given pdf, or no layout is
+                     registered for its summary header
+    :return: Parsed summary of the bill
+    :rtype: (ParsedBill)
+    """
+    start = end = None
+    summary = []
+    for index, detail in enumerate(raw_data):
+        is_summary = "SUMMARY" in detail
+        if is_summary:
+            start = index
+            summary = []
+        if "DETAILED" in detail:
+            end = index
+        elif not is_summary and start is not None and end is None and detail.strip():
+            summary.append(detail)
+        if start is not None and end is not None:
+            break
+    if start is None or end is None or not start < end:
+        raise OSError("Could not parse given pdf for required data. \
+            Please verify or contact developer")
+    titles = tuple(title for title in summary[0].split() if title != "charges")
+    tokenize = get_layout(titles).tokenize
+    totals = summary[1].split()
+    rows = []
+    for chunk in summary[3:]:
+        tokens = tokenize(chunk)
+        if tokens is None:
+            # Rows the layout does not match are split on spaces as they used to be
+            chunk = clean_chunk(data_chunk=chunk)
+            tokens = tuple(chunk.split(" ")[: len(titles)]), chunk
+        row, status = tokens
+        if status is not None and "Removed" in status:
+            continue
+        rows.append(row)
+    return ParsedBill(
+        start=start,
+        end=end,
+        titles=titles,
+        plan_total=parse_to_num(totals[1]),
+        account_total=parse_to_num(totals[-1]),
+        rows=tuple(rows),
+    )
+
+
+class TMobile:
+    """
+    Main class to perform get details pertaining to T-Mobile account
+    """
+
+    def __init__(self, raw_data):
+        self.bill = parse_bill(raw_data)
+        self.positions = {"start": self.bill.start, "end": self.bill.end}
+        self.plan_total = self.bill.plan_total
+        self.account_total = self.bill.account_total
+        self.titles = self.get_titles()
 
     def get_titles(self):
         """Function to get titles from T-Mobile summary bill PDF
@@ -75,10 +217,7 @@ class TMobile:
         :return: List of titles parsed from PDF provided by the user
         :rtype: (list)
         """
-        titles = self._data[0].split()
-        if "charges" in titles:
-            titles.pop(titles.index("charges"))
-        return titles
+        return list(self.bill.titles)
 
     def get_account_data_mapping(self):
         """Function to get an account to data mapping for each line on account
@@ -86,16 +225,4 @@ class TMobile:
         :return: List of key-value pairs of account mapped to its details
         :rtype: (list)
         """
-        account_to_data = []
-        real_data = self._data[5:]
-        for chunk in real_data:
-            if len(chunk) > 0:
-                chunk = clean_chunk(data_chunk=chunk)
-                if "Removed" in chunk:
-                    continue
-                data_ = chunk.split(" ")
-                data_obj = {}
-                for data_value, data_key in zip(data_, self.titles):
-                    data_obj[data_key] = data_value
-                account_to_data.append(data_obj)
-        return account_to_data
+        return self.bill.get_account_data_mapping()
@@ -1,14 +1,118 @@
 #!/usr/bin/python3
 """
 Module pertaining to Venmo account and other functionalities
+    - One Venmo session is meant to be shared by all lines of a run
+    - Venmo user ids are cached in configs/venmo_ids.json so steady-state runs make no search calls
+    - Requests may be sent from many threads, API calls are rate limited across all of them
+      and transient errors retried
+    - Money requests are retried only when Venmo can not have received them, so a user is
+      never requested twice. A request whose outcome is unclear is reported as UNKNOWN,
+      to be checked in Venmo rather than sent again
+    - venmo_api is imported and the client created on first use, so runs that send no request
+      do no network work
 """
 import os
+import json
 import logging
-from venmo_api import Client
-from tmobile.utilities.utils import parse_json_data, UserNotFound
+import re
+import threading
+import time
+from tmobile.utilities.concurrency import TokenBucket, call_with_retries
+from tmobile.utilities.profiler import record
+from tmobile.utilities.utils import normalize_phone, parse_json_data, UserNotFound
 
 logger = logging.getLogger(__name__)
 
+# venmo_api.HttpCodeError keeps the status code of the response only in its message
+__status_code__ = re.compile(r"-> (\d{3}) ")
+
+
+def get_transient_errors():
+    """Function to get errors of Venmo API calls that are worth retrying
+
+    :return: Exception types of transient errors
+    :rtype: (tuple)
+    """
+    import requests
+    from venmo_api import HttpCodeError
+
+    return (
+        HttpCodeError,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+    )
+
+
+def __get_status_code__(err):
+    """Function to get the status code of the response of a HttpCodeError
+
+    :return: Status code | None if it is not known
+    :rtype: (int)
+    """
+    response = getattr(err, "response", None)
+    if response is not None:
+        return response.status_code
+    status_code = __status_code__.search(str(err))
+    return int(status_code.group(1)) if status_code else None
+
+
+def __is_connect_error__(err):
+    """Function to check if an error was raised while connecting, before the request
+       was sent to Venmo
+
+    :rtype: (bool)
+    """
+    import requests
+    from urllib3.exceptions import ConnectTimeoutError
+
+    if isinstance(err, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(err, requests.exceptions.ConnectionError) or not err.args:
+        return False
+    # requests wraps the urllib3 error, itself wrapped by MaxRetryError after retries
+    reason = getattr(err.args[0], "reason", err.args[0])
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def is_retryable(err, idempotent=True):
+    """Function to check if a Venmo API call that raised one of get_transient_errors
+       is worth retrying
+        - 429 responses and errors raised before the request was sent, always
+        - 5xx responses, timeouts and dropped connections, only for idempotent calls,
+          as Venmo may already have acted on the request
+
+    :param err: Error raised by the call
+    :type err: (Exception)
+    :param idempotent: False for calls that must not be made twice, e.g. request_money
+    :type idempotent: (bool), optional
+    :rtype: (bool)
+    """
+    from venmo_api import HttpCodeError
+
+    if isinstance(err, HttpCodeError):
+        status_code = __get_status_code__(err)
+        if status_code == 429:
+            return True
+        return idempotent and status_code is not None and status_code >= 500
+    return __is_connect_error__(err) or idempotent
+
+
+def is_outcome_unknown(err):
+    """Function to check if a money request that raised one of get_transient_errors may
+       still have been received by Venmo, i.e. 5xx responses, timeouts and dropped
+       connections once the request was sent
+
+    :param err: Error raised by the request
+    :type err: (Exception)
+    :rtype: (bool)
+    """
+    from venmo_api import HttpCodeError
+
+    if isinstance(err, HttpCodeError):
+        status_code = __get_status_code__(err)
+        return status_code is None or status_code >= 500
+    return not __is_connect_error__(err)
+
 
 class Venmo:
     """
@@ -16,15 +120,113 @@ class Venmo:
     """
 
     __venmo_file__ = "configs/venmo.json"
+    __id_cache_file__ = "configs/venmo_ids.json"
+    __id_cache_ttl__ = 30 * 24 * 60 * 60
 
-    def __init__(self):
-        if not os.path.exists(Venmo.__venmo_file__):
+    def __init__(
+        self,
+        venmo_file=None,
+        id_cache_file=None,
+        id_cache_ttl=None,
+        workers=4,
+        rate=5.0,
+        retries=3,
+        backoff=0.5,
+        client=None,
+    ):
+        self.venmo_file = venmo_file or Venmo.__venmo_file__
+        self.id_cache_file = id_cache_file or Venmo.__id_cache_file__
+        self.id_cache_ttl = (
+            Venmo.__id_cache_ttl__ if id_cache_ttl is None else id_cache_ttl
+        )
+        if not os.path.exists(self.venmo_file):
             raise FileNotFoundError(
                 "Please created venmo.json file containing your access token"
             )
-        data = parse_json_data(Venmo.__venmo_file__)
+        data = parse_json_data(self.venmo_file)
         self.users = data["users"]
-        self.client = Client(access_token=data["token"])
+        self._lines = {normalize_phone(line): line for line in self.users}
+        self.id_cache = self._load_id_cache()
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self._limiter = TokenBucket(rate=rate)
+        self._lock = threading.Lock()
+        self._token = data["token"]
+        self._client = client
+
+    @property
+    def client(self):
+        """Property defining the Venmo API client, created on first use
+
+        :return: Venmo API client
+        :rtype: (venmo_api.Client)
+        """
+        with self._lock:
+            if self._client is None:
+                from venmo_api import Client
+
+                self._client = Client(access_token=self._token)
+        return self._client
+
+    def _load_id_cache(self):
+        """Private function to load cached Venmo user ids
+
+        :return: Cached user ids with the time they were resolved, by Venmo user-name
+        :rtype: (dict)
+        """
+        if not os.path.exists(self.id_cache_file):
+            return {}
+        try:
+            return parse_json_data(self.id_cache_file)
+        except ValueError:
+            logger.info("Ignoring corrupt file=%s" % self.id_cache_file)
+            return {}
+
+    def _save_id_cache(self):
+        """Private function to persist cached Venmo user ids"""
+        with open(self.id_cache_file + ".tmp", "w") as cache_file:
+            json.dump(self.id_cache, cache_file, indent=4)
+        os.replace(self.id_cache_file + ".tmp", self.id_cache_file)
+
+    def _call_api(self, func, *func_args, idempotent=True):
+        """Private function to call Venmo API at most `rate` times per second across
+           all threads, retrying transient errors with exponential backoff
+
+        :param func: Venmo API function to call
+        :type func: (callable)
+        :param idempotent: False for calls that must not be made twice, see is_retryable
+        :type idempotent: (bool), optional
+        :return: Value returned by the Venmo API
+        """
+
+        def __limited__():
+            self._limiter.acquire()
+            return func(*func_args)
+
+        return call_with_retries(
+            __limited__,
+            get_transient_errors(),
+            retries=self.retries,
+            backoff=self.backoff,
+            is_transient=lambda err: is_retryable(err, idempotent=idempotent),
+        )
+
+    def get_line_details(self, line):
+        """Function to get Venmo details of a line in any phone number format
+
+        :param line: Number associated with line
+        :type line: (str)
+        :raises UserNotFound: If the line is not defined in venmo.json file
+        :return: Venmo user-name, additional note and amount of the line
+        :rtype: (dict)
+        """
+        try:
+            return self.users[self._lines[normalize_phone(line)]]
+        except KeyError as err:
+            raise UserNotFound(
+                "line={} is missing in file={}".format(line, self.venmo_file)
+            ) from err
 
     def get_user(self, user_name):
         """Function to get user details by Venmo repository
@@ -35,14 +237,48 @@ class Venmo:
         :return: Details of user fetched form the venmo repository
         :rtype: (NamedTuple)
         """
-        users = self.client.user.search_for_users(query=user_name)
-        if len(users) < 1:
+        users = self._call_api(self.client.user.search_for_users, user_name)
+        if not users:
             err = "User={} does not exits, please check venmo user name in venmo.json file".format(
                 user_name
             )
             raise UserNotFound(err)
         return users[0]
 
+    def get_user_id(self, user_name):
+        """Function to get Venmo user id of a user-name, searching Venmo only when
+           the id is not cached or was resolved more than id_cache_ttl seconds ago
+
+        :param user_name: User-name of the user whose id need to be fetched
+        :type user_name: (str)
+        :raises UserNotFound: If given user-name is not found in Venmo repository
+        :return: Venmo user id
+        :rtype: (str)
+        """
+        cached = self.id_cache.get(user_name)
+        if cached and time.time() - cached["resolved"] < self.id_cache_ttl:
+            return cached["id"]
+        user_id = self.get_user(user_name=user_name).id
+        with self._lock:
+            self.id_cache[user_name] = {"id": user_id, "resolved": time.time()}
+            self._save_id_cache()
+        return user_id
+
+    def warm_up(self):
+        """Function to resolve and cache ids of all users in venmo.json in one pass
+
+        :return: User-names that could not be found in Venmo repository
+        :rtype: (list)
+        """
+        missing = []
+        for details in self.users.values():
+            try:
+                self.get_user_id(user_name=details["venmo_username"])
+            except UserNotFound as err:
+                logger.info(err)
+                missing.append(details["venmo_username"])
+        return missing
+
     def request(self, note, user_id, amount, addtional_amount=0):
         """Function to perform a venmo request to given user id with given amount and note
 
@@ -54,9 +290,52 @@ class Venmo:
         :type amount: (int)
         :param addtional_amount: Additional amount to added to the request, defaults to 0
         :type addtional_amount:(int), optional
+        :return: True if the request was sent | False if amount was not positive
+        :rtype: (bool)
         """
         total_amount = amount + addtional_amount
         if total_amount <= 0:
             logger.info("Total amount < 0, request not sent")
-        else:
-            self.client.payment.request_money(total_amount, note, user_id)
+            return False
+        self._call_api(
+            self.client.payment.request_money,
+            total_amount,
+            note,
+            user_id,
+            idempotent=False,
+        )
+        return True
+
+    def request_one(self, venmo_request):
+        """Function to send one venmo request, reporting failures in its result. The
+           pipeline of src/main.py runs self.workers of these concurrently
+
+        :param venmo_request: Request with note, user_name, amount and addtional_amount
+        :type venmo_request: (dict)
+        :return: Status ("SUCCESS" | "SKIPPED" | "FAILED" | "UNKNOWN" if Venmo may have
+                 received the request, see is_outcome_unknown), latency and error of the
+                 request
+        :rtype: (dict)
+        """
+        started = time.perf_counter()
+        result = {"status": "SUCCESS", "error": None}
+        user_id = None
+        try:
+            user_id = self.get_user_id(user_name=venmo_request["user_name"])
+            sent = self.request(
+                note=venmo_request["note"],
+                user_id=user_id,
+                amount=venmo_request["amount"],
+                addtional_amount=venmo_request.get("addtional_amount", 0),
+            )
+            if not sent:
+                result["status"] = "SKIPPED"
+        except UserNotFound as err:
+            result.update(status="FAILED", error=err)
+        except get_transient_errors() as err:
+            # Errors before the user id is known come from searching, nothing was sent
+            unknown = user_id is not None and is_outcome_unknown(err)
+            result.update(status="UNKNOWN" if unknown else "FAILED", error=err)
+        result["latency"] = time.perf_counter() - started
+        record("venmo", result["latency"], status=result["status"])
+        return result
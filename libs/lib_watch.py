@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+"""
+Module pertaining to watching a folder for new or changed T-Mobile summary bills
+    - Wakes on inotify events of the folder on Linux, and polls it everywhere else or
+      when inotify is not available, e.g. some network shares
+    - A pdf is only reported once its size and modification time have not changed for
+      settle seconds, so partially written or copied files are not read
+    - Bills already in the folder when watching starts are not reported unless asked,
+      so a restarted watcher does not report every bill of the folder again
+    - Every wake is a single scandir of the folder, an idle watcher costs next to no CPU
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import select
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Files closed after writing, moved into, created in or deleted from the folder
+__inotify_mask__ = 0x8 | 0x80 | 0x100 | 0x200 | 0x40
+__inotify_flags__ = 0o4000 | 0o2000000
+
+__bill_name__ = re.compile(r"^SummaryBill[A-Z][a-z]{2}\d{4}\.pdf$")
+
+
+def __get_inotify_fd__(folder):
+    """Function to get an inotify file descriptor watching given folder
+
+    :param folder: Folder to watch
+    :type folder: (str)
+    :return: Non-blocking file descriptor, or None if inotify is not available
+    :rtype: (int)
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        inotify_fd = libc.inotify_init1(__inotify_flags__)
+    except (AttributeError, OSError):
+        return None
+    if inotify_fd < 0:
+        return None
+    if libc.inotify_add_watch(inotify_fd, folder.encode(), __inotify_mask__) < 0:
+        logger.warning(
+            "inotify not available for folder=%s: %s"
+            % (folder, os.strerror(ctypes.get_errno()))
+        )
+        os.close(inotify_fd)
+        return None
+    return inotify_fd
+
+
+class FolderWatcher:
+    """
+    Main class to get summary bills of a folder once they are written completely
+    """
+
+    def __init__(
+        self,
+        folder,
+        settle=2.0,
+        interval=5.0,
+        use_inotify=True,
+        pattern=__bill_name__,
+        report_existing=False,
+    ):
+        self.folder = folder
+        self.settle = settle
+        self.interval = interval
+        self.pattern = pattern
+        self._inotify_fd = __get_inotify_fd__(folder) if use_inotify else None
+        # Bills already in the folder count as reported until they are written again
+        self._reported = {} if report_existing else self._get_signatures()
+        self._pending = {}
+
+    @property
+    def mode(self):
+        """Property of how the watcher wakes, "inotify" or "polling"
+
+        :return: Mode of the watcher
+        :rtype: (str)
+        """
+        return "polling" if self._inotify_fd is None else "inotify"
+
+    def close(self):
+        """Function to stop receiving inotify events"""
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def _get_signatures(self):
+        """Private function to get size and modification time of every summary bill
+
+        :return: Path to signature mapping
+        :rtype: (dict)
+        """
+        signatures = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if self.pattern.match(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    signatures[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def scan(self, now=None):
+        """Function to get summary bills whose signature has been the same for settle
+           seconds since they were last reported
+
+        :param now: Monotonic time of the scan, defaults to time.monotonic()
+        :type now: (float), optional
+        :return: Sorted paths to new or changed summary bills
+        :rtype: (list)
+        """
+        now = time.monotonic() if now is None else now
+        signatures = self._get_signatures()
+        ready = []
+        for path, signature in signatures.items():
+            if self._reported.get(path) == signature:
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[0] != signature:
+                self._pending[path] = (signature, now)
+            elif now - pending[1] >= self.settle:
+                del self._pending[path]
+                self._reported[path] = signature
+                ready.append(path)
+        for path in set(self._pending).difference(signatures):
+            del self._pending[path]
+        for path in set(self._reported).difference(signatures):
+            del self._reported[path]
+        return sorted(ready)
+
+    def wait(self, timeout):
+        """Function to block until the folder changes, or for timeout seconds when polling
+
+        :param timeout: Longest time to block in seconds
+        :type timeout: (float)
+        """
+        if self._inotify_fd is None:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select([self._inotify_fd], [], [], timeout)
+        if readable:
+            # Events are only a wake up call, the folder is scanned after each of them
+            try:
+                while os.read(self._inotify_fd, 64 * 1024):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def watch(self, stop):
+        """Function to yield every new or changed summary bill until stop is set
+
+        :param stop: Event to stop watching
+        :type stop: (threading.Event)
+        :yield: Path to a summary bill
+        :rtype: (str)
+        """
+        logger.info("Watching folder=%s mode=%s" % (self.folder, self.mode))
+        while not stop.is_set():
+            yield from self.scan()
+            if stop.is_set():
+                break
+            # Pending bills are checked again once they could have settled
+            timeout = self.interval
+            if self._pending:
+                timeout = min(timeout, self.settle)
+            self.wait(timeout)
@@ -2,8 +2,9 @@
 """
 Module that represents the T-Mobile account with operations pertaining to whole account
     - Relies on SummaryBillMMMYYYY.pdf to perform operations pertaining to the account
+    - Charges are computed in exact integer cents, so basic shares of lines add up to the account total
 """
-from tmobile.utilities.utils import parse_to_float
+from tmobile.utilities.utils import allocate_cents, parse_to_float, to_cents
 
 
 class Account:
@@ -14,6 +15,7 @@ class Account:
     def __init__(self, all_lines, account_total=0):
         self.lines = all_lines
         self.account_total = account_total
+        self.account_total_cents = to_cents(account_total)
         self.tax_total = self._get_tax_total()
 
     @property
@@ -31,10 +33,7 @@ class Account:
         :return: Total calculated tax on the account
         :rtype: (float)
         """
-        total_tax = 0
-        for line in self.lines:
-            total_tax += line.tax
-        return parse_to_float(total_tax)
+        return sum(line.charges.tax_cents for line in self.lines) / 100
 
     def get_basic_charge(self):
         """Function to get basic charge for each line on the account
@@ -43,3 +42,24 @@ class Account:
         :rtype: (float)
         """
         return parse_to_float(self.account_total / self.no_of_lines)
+
+    def get_basic_shares(self):
+        """Function to get basic charge of each line in cents, the account total split
+           with the largest remainder method so the shares add up to it exactly
+
+        :return: Basic charge of each line in cents, in the order of lines
+        :rtype: (list)
+        """
+        return allocate_cents(self.account_total_cents, [1] * self.no_of_lines)
+
+    def get_line_totals(self):
+        """Function to get total charges of each line in cents, its equipment, services
+           and one-time charges plus its basic share
+
+        :return: Total charges of each line in cents, in the order of lines
+        :rtype: (list)
+        """
+        return [
+            line.charges.own_charges_cents + share
+            for line, share in zip(self.lines, self.get_basic_shares())
+        ]
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+"""
+Module that represents the charges of a line on the T-Mobile account
+    - Charges are parsed once from the bill and stored as exact integer cents
+"""
+from tmobile.utilities.utils import parse_to_cents
+
+# Part of the plan charge of a line that is covered by the account plan total
+PLAN_ALLOWANCE_CENTS = 2000
+
+
+class LineCharges:
+    """
+    Compact record of charges of a line in cents, built from a row of the bill
+    """
+
+    __slots__ = ("equipment_cents", "services_cents", "plans_cents", "one_time_cents")
+
+    def __init__(
+        self, equipment_cents=0, services_cents=0, plans_cents=0, one_time_cents=0
+    ):
+        self.equipment_cents = equipment_cents
+        self.services_cents = services_cents
+        self.plans_cents = plans_cents
+        self.one_time_cents = one_time_cents
+
+    @classmethod
+    def from_prop(cls, prop):
+        """Function to parse charges of a line from its row of the bill
+
+        :param prop: Row of the bill mapped by titles, as from TMobile.get_account_data_mapping
+        :type prop: (dict)
+        :return: Charges of the line
+        :rtype: (LineCharges)
+        """
+        return cls(
+            equipment_cents=parse_to_cents(prop["Equipment"]),
+            services_cents=parse_to_cents(prop["Services"]),
+            plans_cents=parse_to_cents(prop["Plans"]),
+            one_time_cents=parse_to_cents(prop.get("One-time") or "-"),
+        )
+
+    @property
+    def tax_cents(self):
+        """Property defining tax on a line in cents, the plan charge beyond the allowance
+
+        :return: Tax amount on a line in cents
+        :rtype: (int)
+        """
+        if self.plans_cents > PLAN_ALLOWANCE_CENTS:
+            return self.plans_cents - PLAN_ALLOWANCE_CENTS
+        return self.plans_cents
+
+    @property
+    def own_charges_cents(self):
+        """Property defining charges of a line that are not shared by the account
+
+        :return: Equipment, services and one-time charges of a line in cents
+        :rtype: (int)
+        """
+        return self.equipment_cents + self.services_cents + self.one_time_cents
+
+    def __repr__(self):
+        return "LineCharges(equipment_cents={}, services_cents={}, plans_cents={}, one_time_cents={})".format(
+            self.equipment_cents,
+            self.services_cents,
+            self.plans_cents,
+            self.one_time_cents,
+        )
@@ -3,61 +3,40 @@
 Module that represents each line on the T-Mobile account with operations pertaining to each line
     - Relies on configs/users.json with appropriate line:{name, email} definition for each user
 """
-import os
-from tmobile.utilities.utils import (
-    parse_to_num,
-    parse_to_float,
-    parse_json_data,
-    UserNotFound,
-    validate_email,
-)
+from tmobile.models.charges import LineCharges
+from tmobile.models.user_directory import UserDirectory
 
 
 class Line:
     """
     Main class to perform operations each line on T-Mobile account with
-    class variable corresponding to full path to user details.json file
+    user details looked up from a UserDirectory of the users.json file and
+    charges parsed once into a LineCharges record
     """
 
-    def __init__(self, prop, user_info_file="configs/users.json"):
-        self.user_info_file = user_info_file
+    def __init__(self, prop, user_info_file="configs/users.json", directory=None):
+        if directory is None:
+            directory = UserDirectory.for_file(user_info_file)
+        self.directory = directory
+        self.user_info_file = self.directory.user_info_file
         self.prop = prop
-        self.__check_file()
+        self.charges = LineCharges.from_prop(prop)
+        # Users are validated by the directory as users.json is loaded
         self.user = self.get_user()
-        self.__validate_user_info()
 
-    def __validate_user_info(self):
-        """Private function to validate the user information provided in the json file
+    def __get_charge(self, title, cents):
+        """Private function to get a charge of the line as it was shown on the statement
 
-        :raises UserNotFound: If user or email details are not valid
+        :param title: Title of the charge on the bill
+        :type title: (str)
+        :param cents: Charge in cents
+        :type cents: (int)
+        :return: 0 if the bill has no charge ("-"), else the charge in dollars
+        :rtype: (int/float)
         """
-        if "name" not in self.user or not self.user["name"]:
-            raise UserNotFound(
-                '"name" details are missing in file={}'.format(self.user_info_file)
-            )
-        if "email" not in self.user:
-            raise UserNotFound(
-                '"email" details are missing in file={} for user={}'.format(
-                    self.user_info_file, self.user["name"]
-                )
-            )
-        if not validate_email(self.user["email"]):
-            raise ValueError(
-                "Incorrect email={} address provided for user={}".format(
-                    self.user["email"], self.user["name"]
-                )
-            )
-
-    def __check_file(self):
-        """Function to check if file exists
-
-        :raises FileNotFoundError: If file is not found
-        """
-        if not os.path.exists(self.user_info_file):
-            err = "file={} is missing. Kindly review --help menu".format(
-                self.user_info_file
-            )
-            raise FileNotFoundError(err)
+        if self.prop.get(title) in (None, "-"):
+            return 0
+        return cents / 100
 
     def get_user(self):
         """Property defining user details on a line
@@ -65,7 +44,7 @@ class Line:
         :return: User details defined in users.json file
         :rtype: (dict)
         """
-        return parse_json_data(self.user_info_file)[self.line]
+        return self.directory.get_user(self.line)
 
     @property
     def line(self):
@@ -90,22 +69,18 @@ class Line:
         """Property defining equipment charges on a line
 
         :return: Equipment charges on a line
-        :rtype: (int)
+        :rtype: (int/float)
         """
-        if self.prop["Equipment"] == "-":
-            return 0
-        return parse_to_num(self.prop["Equipment"])
+        return self.__get_charge("Equipment", self.charges.equipment_cents)
 
     @property
     def services(self):
         """Property defining service charges on a line
 
         :return: Service charges on a line
-        :rtype: (int)
+        :rtype: (int/float)
         """
-        if self.prop["Services"] == "-":
-            return 0
-        return parse_to_num(self.prop["Services"])
+        return self.__get_charge("Services", self.charges.services_cents)
 
     @property
     def tax(self):
@@ -114,18 +89,13 @@ class Line:
         :return: Tax amount on a line
         :rtype: (float)
         """
-        tax = parse_to_num(self.prop["Plans"])
-        if tax > 20:
-            tax = tax - 20
-        return parse_to_float(tax)
+        return self.charges.tax_cents / 100
 
     @property
     def one_time_charge(self):
         """Property defining one-time charges on a line
 
         :return: One-time charges on a line
-        :rtype: (int)
+        :rtype: (int/float)
         """
-        if self.prop.get("One-time") is None or self.prop.get("One-time") == "-":
-            return 0
-        return parse_to_num(self.prop["One-time"])
+        return self.__get_charge("One-time", self.charges.one_time_cents)
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+"""
+Module that represents the users of the T-Mobile account defined in configs/users.json
+    - The file is loaded, validated and indexed by phone number once and reloaded only when it changes
+"""
+import os
+from tmobile.utilities.utils import (
+    normalize_phone,
+    parse_json_data,
+    UserNotFound,
+    validate_email,
+)
+
+
+class UserDirectory:
+    """
+    Main class to look up users on the T-Mobile account by line number with
+    class variable holding one directory per users.json file
+    """
+
+    __directories__ = {}
+
+    def __init__(self, user_info_file="configs/users.json"):
+        self.user_info_file = user_info_file
+        self._signature = None
+        self._users = {}
+        self.refresh()
+
+    @classmethod
+    def for_file(cls, user_info_file="configs/users.json"):
+        """Function to get the shared directory for given users.json file
+
+        :param user_info_file: Path to users.json file, defaults to "configs/users.json"
+        :type user_info_file: (str), optional
+        :return: Directory of users loaded from given file
+        :rtype: (UserDirectory)
+        """
+        key = os.path.abspath(user_info_file)
+        if key in cls.__directories__:
+            cls.__directories__[key].refresh()
+        else:
+            cls.__directories__[key] = cls(user_info_file)
+        return cls.__directories__[key]
+
+    def refresh(self):
+        """Function to reload and re-index users.json if it changed since last load
+
+        :raises FileNotFoundError: If file is not found
+        """
+        try:
+            stat = os.stat(self.user_info_file)
+        except FileNotFoundError as err:
+            raise FileNotFoundError(
+                "file={} is missing. Kindly review --help menu".format(
+                    self.user_info_file
+                )
+            ) from err
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        users = {}
+        for number, user in parse_json_data(self.user_info_file).items():
+            self._validate_user_info(number, user)
+            users[normalize_phone(number)] = user
+        self._users = users
+        self._signature = signature
+
+    def _validate_user_info(self, number, user):
+        """Private function to validate the user information provided for a line
+
+        :param number: Line number the user is defined for
+        :type number: (str)
+        :param user: User details defined for the line
+        :type user: (dict)
+        :raises UserNotFound: If user or email details are missing
+        :raises ValueError: If email address is not valid
+        """
+        if not user.get("name"):
+            raise UserNotFound(
+                '"name" details are missing in file={} for line={}'.format(
+                    self.user_info_file, number
+                )
+            )
+        if "email" not in user:
+            raise UserNotFound(
+                '"email" details are missing in file={} for user={}'.format(
+                    self.user_info_file, user["name"]
+                )
+            )
+        if not validate_email(user["email"]):
+            raise ValueError(
+                "Incorrect email={} address provided for user={}".format(
+                    user["email"], user["name"]
+                )
+            )
+
+    def get_user(self, line):
+        """Function to get user details of a line in any phone number format
+
+        :param line: Number associated with line
+        :type line: (str)
+        :raises UserNotFound: If no user is defined for the line
+        :return: User details defined in users.json file
+        :rtype: (dict)
+        """
+        try:
+            return self._users[normalize_phone(line)]
+        except KeyError as err:
+            raise UserNotFound(
+                "line={} is missing in file={}".format(line, self.user_info_file)
+            ) from err
+
+    def __len__(self):
+        return len(self._users)
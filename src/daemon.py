@@ -0,0 +1,523 @@
+#!/usr/bin/python3
+"""
+Resident service of the T-Mobile application, keeping everything a run needs warm:
+    - The pdf extractor, parsed users.json and venmo.json, Gmail service and Venmo session
+    - Parsed bills of the latest submissions, by SHA-256 of their pdf
+Local HTTP API, requests are handled concurrently:
+    - POST /bills: json {"path": "SummaryBillMMMYYYY.pdf"}, or the pdf itself with
+      Content-Type application/pdf and ?name=SummaryBillMMMYYYY.pdf, returns the charges
+      of each line
+    - POST /dispatch: same as /bills, and emails and requests the charges of each line
+    - GET /health: uptime, warm clients and number of requests
+    - GET /stats: count, total, p50, p95 and max time of each request and stage
+With --watch, summary bills written to a folder are also dispatched as they arrive
+Usage:
+    python src/daemon.py --port 8642
+    python src/daemon.py --watch bills/
+    curl -d '{"path": "bills/SummaryBillApr2020.pdf"}' http://127.0.0.1:8642/bills
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from tmobile.libs.lib_cache import BillCache
+from tmobile.libs.lib_email import EmailClient
+from tmobile.libs.lib_journal import RunJournal
+from tmobile.libs.lib_pdf import DEFAULT_EXTRACTOR, get_extractor
+from tmobile.libs.lib_store import BillStore
+from tmobile.libs.lib_venmo import Venmo
+from tmobile.libs.lib_watch import FolderWatcher, __bill_name__
+from tmobile.models.user_directory import UserDirectory
+from tmobile.src.main import (
+    __compute_bill__,
+    __dispatch_bill__,
+    __get_args__,
+    __load_bill__,
+    __store_bill__,
+)
+from tmobile.utilities.profiler import enable_profiling, get_profiler, record
+from tmobile.utilities.statement import DEFAULT_FORMAT
+from tmobile.utilities.utils import UserNotFound, get_file_hash, to_cents
+
+logger = logging.getLogger(__name__)
+
+# Largest pdf accepted by POST /bills and POST /dispatch
+MAX_UPLOAD_BYTES = 32 * 1024 * 1024
+
+
+class BadRequest(Exception):
+    """Raise this error when a request is missing or has invalid inputs
+
+    :param Exception: Base Exception Class object
+    :type Exception: (Exception)
+    """
+
+
+def __get_bill_path__(content):
+    """Function to get the path of the bill of a json request
+
+    :param content: Body of the request e.g. b'{"path": "SummaryBillApr2020.pdf"}'
+    :type content: (bytes)
+    :raises BadRequest: If the body is not a json object with the path of a pdf file
+    :return: Path to the bill
+    :rtype: (str)
+    """
+    try:
+        body = json.loads(content or b"{}")
+    except ValueError as err:
+        raise BadRequest('Expected json {"path": <pdf bill>}') from err
+    path = body.get("path") if isinstance(body, dict) else None
+    if not isinstance(path, str):
+        raise BadRequest('Expected json {"path": <pdf bill>}')
+    if not os.path.isfile(path):
+        raise BadRequest("Bill={} is not a file".format(path))
+    return path
+
+
+def __get_breakdown__(bill):
+    """Function to get the charges of each line of a computed bill as json
+
+    :param bill: Computed bill returned by src/main.py __compute_bill__
+    :type bill: (dict)
+    :return: Subject, hash, total and charges of each line of the bill
+    :rtype: (dict)
+    """
+    lines = []
+    for _acc_, data_for_account, total in bill["charges"]:
+        lines.append(
+            {
+                "line": _acc_.line,
+                "user": _acc_.user["name"],
+                "type": _acc_.linetype,
+                "equipment": _acc_.equipment,
+                "services": _acc_.services,
+                "one_time": _acc_.one_time_charge,
+                "basic": (to_cents(total) - _acc_.charges.own_charges_cents) / 100,
+                "total": total,
+                "table": data_for_account,
+            }
+        )
+    return {
+        "subject": bill["subject"],
+        "hash": bill["hash"],
+        "total": bill["total"],
+        "lines": lines,
+    }
+
+
+class BillService:
+    """
+    Main class holding the warm state shared by all requests of the daemon
+    """
+
+    def __init__(
+        self,
+        args,
+        cache=None,
+        store=None,
+        journal=None,
+        email_cli=None,
+        venmo_cli=None,
+        max_bills=64,
+    ):
+        self.args = args
+        self.extractor = args.get("extractor", DEFAULT_EXTRACTOR)
+        self.cache = cache
+        self.store = store
+        self.journal = journal
+        self.email_cli = email_cli
+        self.venmo_cli = venmo_cli
+        self.max_bills = max_bills
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self._bills = OrderedDict()
+        self._lock = threading.Lock()
+        self._dispatch_lock = threading.Lock()
+
+    def warm_up(self):
+        """Function to load the pdf backend, users and API clients before any request"""
+        get_extractor(self.extractor).warm_up()
+        UserDirectory.for_file()
+        if self.args["test"]:
+            return
+        # Both properties build their client on first use
+        if self.args["email"] and self.email_cli is not None:
+            logger.info("Gmail service ready: %s" % bool(self.email_cli.service))
+        if self.venmo_cli is not None:
+            logger.info("Venmo client ready: %s" % bool(self.venmo_cli.client))
+
+    def _get_parsed_bill(self, path):
+        """Private function to get a parsed bill from the latest submissions, or from
+           the cache or pdf otherwise
+
+        :param path: Path to T-Mobile pdf bill
+        :type path: (str)
+        :return: Parsed bill and SHA-256 of its pdf
+        :rtype: (tuple)
+        """
+        # The cache keeps hashes of unchanged pdfs, so a bill is not hashed again
+        get_hash = get_file_hash if self.cache is None else self.cache.get_hash
+        bill_hash = get_hash(path)
+        with self._lock:
+            bill = self._bills.get(bill_hash)
+            if bill is not None:
+                self._bills.move_to_end(bill_hash)
+        if bill is None:
+            bill = __load_bill__(path, extractor=self.extractor, cache=self.cache)
+            with self._lock:
+                self._bills[bill_hash] = bill
+                while len(self._bills) > self.max_bills:
+                    self._bills.popitem(last=False)
+        return dict(bill, path=path), bill_hash
+
+    def compute(self, path):
+        """Function to compute and store the charges of each line of a bill
+
+        :param path: Path to T-Mobile pdf bill
+        :type path: (str)
+        :return: Computed bill, see src/main.py __compute_bill__
+        :rtype: (dict)
+        """
+        parsed_bill, bill_hash = self._get_parsed_bill(path)
+        bill = __compute_bill__(
+            parsed_bill, statement=self.args.get("statement", DEFAULT_FORMAT)
+        )
+        bill["hash"] = bill_hash
+        __store_bill__(store=self.store, bill=bill)
+        return bill
+
+    def dispatch(self, path):
+        """Function to compute a bill and email and request the charges of each line.
+           One bill is dispatched at a time, so the journal of a bill submitted twice
+           keeps its lines from being sent twice
+
+        :param path: Path to T-Mobile pdf bill
+        :type path: (str)
+        :return: Computed bill, see src/main.py __compute_bill__
+        :rtype: (dict)
+        """
+        bill = self.compute(path)
+        with self._dispatch_lock:
+            __dispatch_bill__(
+                args=self.args,
+                bill=bill,
+                email_cli=self.email_cli,
+                venmo_cli=self.venmo_cli,
+                journal=self.journal,
+            )
+        return bill
+
+    def count_request(self, failed):
+        """Function to count a request handled by the daemon
+
+        :param failed: True if the request failed
+        :type failed: (bool)
+        """
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+
+    def get_health(self):
+        """Function to get the state of the service
+
+        :return: Status, uptime, warm clients, parsed bills held and number of requests
+        :rtype: (dict)
+        """
+        return {
+            "status": "ok",
+            "uptime": round(time.time() - self.started, 3),
+            "extractor": self.extractor,
+            "email": self.email_cli is not None and self.email_cli.creds is not None,
+            "venmo": self.venmo_cli is not None,
+            "bills": len(self._bills),
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+    def get_stats(self):
+        """Function to get count, total, p50, p95 and max time of each request and stage
+
+        :return: Stats of each request and stage in milliseconds
+        :rtype: (dict)
+        """
+        profiler = get_profiler()
+        summary = [] if profiler is None else profiler.get_summary()
+        fields = ["stage", "count", "total_ms", "p50_ms", "p95_ms", "max_ms"]
+        return {"stages": [dict(zip(fields, row)) for row in summary]}
+
+
+class BillRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler of a request to the daemon, running on its own thread
+    """
+
+    server_version = "tmobile"
+
+    def log_message(self, format, *args):
+        logger.info("%s %s" % (self.address_string(), format % args))
+
+    def do_GET(self):
+        self._handle(
+            {
+                "/health": self.server.service.get_health,
+                "/stats": self.server.service.get_stats,
+            }
+        )
+
+    def do_POST(self):
+        self._handle(
+            {
+                "/bills": lambda: self._with_bill(self.server.service.compute),
+                "/dispatch": lambda: self._with_bill(self.server.service.dispatch),
+            }
+        )
+
+    def _handle(self, routes):
+        """Private function to run the route of the request and send its json response"""
+        started = time.perf_counter()
+        route = urlparse(self.path).path
+        service = self.server.service
+        status, body = 200, None
+        try:
+            if route not in routes:
+                status, body = 404, {"error": "Unknown route={}".format(route)}
+            else:
+                body = routes[route]()
+        except (BadRequest, UserNotFound, ValueError) as err:
+            status, body = 400, {"error": str(err)}
+        except FileNotFoundError as err:
+            status, body = 404, {"error": str(err)}
+        except (OSError, sqlite3.Error) as err:
+            status, body = 422, {"error": str(err)}
+        except Exception as err:  # a failed request should not stop the daemon
+            logger.exception("Request to route=%s failed" % route)
+            status, body = 500, {"error": str(err)}
+        service.count_request(failed=status >= 400)
+        self._send_json(status, body)
+        record(
+            "{} {}".format(self.command, route),
+            time.perf_counter() - started,
+            status=status,
+        )
+
+    def _send_json(self, status, body):
+        """Private function to send a json response"""
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _with_bill(self, handle):
+        """Private function to call handle with the path of the bill of the request,
+           writing an uploaded pdf to a temporary directory for the duration of the call
+
+        :param handle: BillService.compute | BillService.dispatch
+        :type handle: (callable)
+        :raises BadRequest: If the request has no bill or its name is invalid
+        :return: Charges of each line of the bill
+        :rtype: (dict)
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_BYTES:
+            raise BadRequest("Bill is larger than {} bytes".format(MAX_UPLOAD_BYTES))
+        content = self.rfile.read(length)
+        if self.headers.get("Content-Type") != "application/pdf":
+            return __get_breakdown__(handle(__get_bill_path__(content)))
+        name = parse_qs(urlparse(self.path).query).get("name", [""])[0]
+        if not __bill_name__.match(name):
+            raise BadRequest("Expected ?name=SummaryBillMMMYYYY.pdf with the upload")
+        with tempfile.TemporaryDirectory() as upload_dir:
+            path = os.path.join(upload_dir, name)
+            with open(path, "wb") as pdf_file:
+                pdf_file.write(content)
+            return __get_breakdown__(handle(path))
+
+
+class BillServer(ThreadingHTTPServer):
+    """
+    HTTP server of the daemon handling each request on its own thread
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, BillRequestHandler)
+        self.service = service
+
+
+def __ingest_bill__(service, path, bill_hash, seen):
+    """Function to dispatch a bill found by the folder watcher, forgetting its hash on
+       failure so the bill is tried again once it is written again
+
+    :param service: Service of the daemon
+    :type service: (BillService)
+    :param path: Path to T-Mobile pdf bill
+    :type path: (str)
+    :param bill_hash: SHA-256 of the pdf
+    :type bill_hash: (str)
+    :param seen: SHA-256 of every bill dispatched by the watcher
+    :type seen: (set)
+    """
+    started, failed = time.perf_counter(), False
+    try:
+        service.dispatch(path)
+    except Exception:  # a bad bill should not stop the watcher
+        logger.exception("Dispatching watched bill=%s failed" % path)
+        seen.discard(bill_hash)
+        failed = True
+    service.count_request(failed=failed)
+    record("watch", time.perf_counter() - started, path=path)
+
+
+def __watch_folder__(service, watcher, stop, workers=2):
+    """Function to dispatch every new bill of a watched folder on a bounded pool of
+       threads, until stop is set. Bills with the contents of a bill dispatched before,
+       e.g. a copy or a re-saved pdf, are skipped
+
+    :param service: Service of the daemon
+    :type service: (BillService)
+    :param watcher: Watcher of the folder
+    :type watcher: (FolderWatcher)
+    :param stop: Event to stop watching
+    :type stop: (threading.Event)
+    :param workers: Number of bills dispatched at once, defaults to 2
+    :type workers: (int), optional
+    """
+    seen = set()
+    # The watcher waits for a free worker instead of queueing every bill of the folder
+    slots = threading.BoundedSemaphore(workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path in watcher.watch(stop):
+            try:
+                bill_hash = get_file_hash(path)
+            except OSError as err:
+                logger.warning("Skipping watched bill=%s: %s" % (path, err))
+                continue
+            if bill_hash in seen:
+                logger.info("Skipping watched bill=%s, already dispatched" % path)
+                continue
+            seen.add(bill_hash)
+            slots.acquire()
+            pool.submit(
+                __ingest_bill__, service, path, bill_hash, seen
+            ).add_done_callback(lambda _: slots.release())
+
+
+def __get_daemon_args__():
+    """Function to get command line options of the daemon
+
+    :return: Options parsed from the command line
+    :rtype: (argparse.Namespace)
+    """
+    cli = argparse.ArgumentParser(description="T-Mobile bill service")
+    cli.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    cli.add_argument("--port", type=int, default=8642, help="Port to listen on")
+    cli.add_argument(
+        "--store",
+        default="configs/tmobile.db",
+        help="SQLite file every processed bill and dispatch is stored to",
+    )
+    cli.add_argument(
+        "--no-store",
+        action="store_true",
+        help="Do not store processed bills, nor journal what is sent",
+    )
+    cli.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Extract and parse every new bill instead of using cached results",
+    )
+    cli.add_argument("--venmo-workers", type=int, default=4)
+    cli.add_argument("--venmo-rate", type=float, default=5.0)
+    cli.add_argument(
+        "--events",
+        metavar="FILE",
+        help="Append the timing of every request and stage to FILE as json lines",
+    )
+    cli.add_argument(
+        "--watch",
+        metavar="FOLDER",
+        help="Dispatch every summary bill written to FOLDER",
+    )
+    cli.add_argument("--watch-workers", type=int, default=2)
+    cli.add_argument(
+        "--watch-existing",
+        action="store_true",
+        help="Also dispatch the bills already in the watched folder on start",
+    )
+    cli.add_argument(
+        "--settle",
+        type=float,
+        default=2.0,
+        help="Seconds a watched bill must be unchanged before it is read",
+    )
+    cli.add_argument(
+        "--poll-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between scans of the watched folder without inotify events",
+    )
+    cli.add_argument(
+        "--polling",
+        action="store_true",
+        help="Poll the watched folder instead of using inotify, e.g. for network shares",
+    )
+    return cli.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename="tmobile.log",
+        level=logging.INFO,
+        format="%(asctime)s %(message)s",
+        datefmt="%m-%d-%Y %I:%M:%S %p",
+    )
+    cli_args = __get_daemon_args__()
+    enable_profiling(events_file=cli_args.events, max_samples=1024)
+    args = __get_args__()
+    venmo_cli = None
+    if args["venmo"] and not args["test"]:
+        venmo_cli = Venmo(workers=cli_args.venmo_workers, rate=cli_args.venmo_rate)
+    service = BillService(
+        args,
+        cache=None if cli_args.no_cache else BillCache(),
+        store=None if cli_args.no_store else BillStore(cli_args.store),
+        journal=None if cli_args.no_store else RunJournal(cli_args.store),
+        email_cli=EmailClient(),
+        venmo_cli=venmo_cli,
+    )
+    service.warm_up()
+    server = BillServer((cli_args.host, cli_args.port), service)
+    logger.info("Serving on http://%s:%s" % server.server_address[:2])
+    stop = threading.Event()
+    if cli_args.watch:
+        watcher = FolderWatcher(
+            cli_args.watch,
+            settle=cli_args.settle,
+            interval=cli_args.poll_interval,
+            use_inotify=not cli_args.polling,
+            report_existing=cli_args.watch_existing,
+        )
+        threading.Thread(
+            target=__watch_folder__,
+            args=(service, watcher, stop, cli_args.watch_workers),
+            daemon=True,
+        ).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
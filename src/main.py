@@ -7,6 +7,9 @@ Contains the workflow of T-Mobile application with following roles:
     - Generates an individual report for each line user
     - Sends email with details to each user
     - Creates a Venmo request to each user
+    - Processes a directory of bills concurrently in batch mode (--batch)
+    - Sends emails and Venmo requests on a pipeline overlapping with extraction of bills
+    - Exports the charges of each line to csv, jsonl or parquet (--export)
 Configuration needed:
     - credentials.json: Json file containing the key configuration for google imap email api
     - input.json: Json file containing inputs to be provided to the application
@@ -14,25 +17,62 @@ Configuration needed:
     - venmo.json: Json file containing venmo related details for all users
     - SummaryBillMMMYYYY.pdf : File obtained from family head's T-Mobile account each month
 """
+import argparse
+import glob
+import html
 import json
 import logging
+import multiprocessing
 import os
+import sqlite3
 import sys
-from tika import parser
-from tabulate import tabulate
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tmobile.models.line import Line
 from tmobile.models.account import Account
+from tmobile.models.user_directory import UserDirectory
+from tmobile.utilities.statement import (
+    DEFAULT_FORMAT,
+    FORMATS,
+    get_renderer,
+    get_statement_values,
+)
 from tmobile.utilities.template import get_email_template, get_help
 from tmobile.utilities.utils import (
-    parse_to_float,
+    to_cents,
+    get_file_hash,
+    normalize_phone,
     parse_months,
     validate_email,
     UserNotFound,
     get_year,
 )
-from tmobile.libs.lib_email import EmailClient, create_message, EmailFailure
+from tmobile.libs.lib_email import BATCH_SIZE, EmailClient, create_message
+from tmobile.libs.lib_cache import BillCache
+from tmobile.libs.lib_export import EXPORTERS, open_exporter
+from tmobile.libs.lib_checkpoint import Checkpoint
+from tmobile.libs.lib_journal import RunJournal, is_dispatched
+from tmobile.libs.lib_store import BillStore
+from tmobile.libs.lib_pdf import EXTRACTORS, DEFAULT_EXTRACTOR, get_extractor
 from tmobile.libs.lib_tmobile import TMobile
 from tmobile.libs.lib_venmo import Venmo
+from tmobile.utilities.concurrency import Stage, run_pipeline_sync
+from tmobile.utilities.profiler import (
+    disable_profiling,
+    enable_profiling,
+    record,
+    timer,
+)
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of emails or Venmo requests queued per stage of the dispatch pipeline
+QUEUE_SIZE = 64
+# Email senders of the dispatch pipeline, each sending batches of up to BATCH_SIZE
+EMAIL_WORKERS = 2
+
+# Values allowed for optional inputs of configs/input.json
+__choices__ = {"extractor": EXTRACTORS, "statement": FORMATS}
 
 
 def __update_and_validate_inputs__(_data):
@@ -52,6 +92,8 @@ def __update_and_validate_inputs__(_data):
                 raise ValueError('Incorrect value provided for boolean "{}"'.format(k))
         if k == "sender" and not validate_email(val):
             raise ValueError("Incorrect email address provided")
+        if k in __choices__ and val not in __choices__[k]:
+            raise ValueError('Unknown value provided for "{}"'.format(k))
         if val == "":
             raise ValueError("Values not provided as expected")
         if val.lower() == "true":
@@ -86,56 +128,998 @@ def __get_args__():
             sys.exit(1)
 
 
-def __get_total_charges_and_tabular_data__(account_details):
-    total_charges = parse_to_float(
-        account_details.equipment
-        + account_details.services
-        + account_details.one_time_charge
-        + basic_on_each_line
-    )
-    chunk = [
-        ["User", account_details.user["name"]],
-        ["Line", account_details.line],
-        ["Type", account_details.linetype],
-        ["Equipment", account_details.equipment],
-        ["Services", account_details.services],
-        ["One-time", account_details.one_time_charge],
-        ["Basic (incl Tax)", basic_on_each_line],
-        ["Total", "${}".format(total_charges)],
-    ]
-    tabular_data = tabulate(chunk, tablefmt="grid")
-    return tabular_data, total_charges
+def __get_cli_args__():
+    """Function to get command line options passed to application by the user
+
+    :return: Command line options passed to application by the user
+    :rtype: (argparse.Namespace)
+    """
+    cli = argparse.ArgumentParser(
+        description="T-Mobile bill generator. Inputs are read from configs/input.json"
+    )
+    cli.add_argument(
+        "--batch",
+        help="Directory or glob of SummaryBillMMMYYYY.pdf files to process in one run",
+    )
+    cli.add_argument(
+        "--workers",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Maximum number of bills extracted concurrently in batch mode",
+    )
+    cli.add_argument(
+        "--report",
+        default="tmobile_report.txt",
+        help="File to write the combined report of a batch run to",
+    )
+    cli.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Extract and parse every bill again instead of using cached results",
+    )
+    cli.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Remove all cached bills before running",
+    )
+    cli.add_argument(
+        "--venmo-workers",
+        type=int,
+        default=4,
+        help="Maximum number of Venmo requests sent concurrently",
+    )
+    cli.add_argument(
+        "--venmo-rate",
+        type=float,
+        default=5.0,
+        help="Maximum number of Venmo API calls per second",
+    )
+    cli.add_argument(
+        "--venmo-warm-up",
+        action="store_true",
+        help="Resolve and cache Venmo user ids of all users in venmo.json, then exit",
+    )
+    cli.add_argument(
+        "--store",
+        default="configs/tmobile.db",
+        help="SQLite file every processed bill is stored to",
+    )
+    cli.add_argument(
+        "--no-store",
+        action="store_true",
+        help="Do not store processed bills, nor journal what is sent",
+    )
+    cli.add_argument(
+        "--history",
+        type=int,
+        metavar="MONTHS",
+        help="Print total charges of each user over the latest stored MONTHS, then exit",
+    )
+    cli.add_argument(
+        "--resend-all",
+        action="store_true",
+        help="Email and request every line again, even if its charges are unchanged",
+    )
+    cli.add_argument(
+        "--checkpoint",
+        default="configs/checkpoint.jsonl",
+        help="File every email and Venmo request sent is appended to as it completes",
+    )
+    cli.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run, skipping lines its checkpoint has completed",
+    )
+    cli.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Start over the checkpoint of an interrupted run instead of resuming it",
+    )
+    cli.add_argument(
+        "--queue-size",
+        type=int,
+        default=QUEUE_SIZE,
+        help="Maximum number of emails or Venmo requests waiting to be sent",
+    )
+    cli.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print count, total, p50, p95 and max time of each stage of the run",
+    )
+    cli.add_argument(
+        "--events",
+        metavar="FILE",
+        help="Append the timing of every stage of the run to FILE as json lines",
+    )
+    cli.add_argument(
+        "--export",
+        metavar="FILE",
+        help='Export the charges of each line to FILE, overrides "export" of input.json',
+    )
+    cli.add_argument(
+        "--export-format",
+        choices=sorted(EXPORTERS),
+        help="Format of the export, defaults to the extension of FILE",
+    )
+    return cli.parse_args()
+
+
+def __get_bill_paths__(pattern):
+    """Function to get all summary bills matching a directory or glob pattern
+
+    :param pattern: Directory containing summary bills or glob pattern
+    :type pattern: (str)
+    :raises FileNotFoundError: If no summary bill matches the pattern
+    :return: Sorted paths to summary bills
+    :rtype: (list)
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "SummaryBill*.pdf")
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise FileNotFoundError("No summary bills found for batch=%s" % pattern)
+    return paths
+
+
+def __extract_bill__(path, extractor=DEFAULT_EXTRACTOR):
+    """Function to extract and parse a summary bill. Runs inside batch worker processes
+
+    :param path: Path to T-Mobile pdf bill
+    :type path: (str)
+    :param extractor: Name of the pdf extraction backend, defaults to DEFAULT_EXTRACTOR
+    :type extractor: (str), optional
+    :return: Parsed account details of the bill along with extraction time
+    :rtype: (dict)
+    """
+    started = time.perf_counter()
+    stats = {}
+    tmobile = TMobile(raw_data=get_extractor(extractor).iter_lines(path, stats=stats))
+    return {
+        "path": path,
+        "positions": tmobile.positions,
+        "titles": tmobile.titles,
+        "account_to_data": tmobile.get_account_data_mapping(),
+        "plan_total": tmobile.plan_total,
+        "account_total": tmobile.account_total,
+        "elapsed": time.perf_counter() - started,
+        "extract_elapsed": stats["seconds"],
+        "pages_read": stats["pages_read"],
+        "total_pages": stats["total_pages"],
+    }
+
+
+def __log_extraction__(bill):
+    """Function to log time taken and pages read to extract a bill
+
+    :param bill: Parsed bill returned by __extract_bill__
+    :type bill: (dict)
+    """
+    logger.info(
+        "Extraction of file=%s : SUCCESS in %.2fs, read %s of %s pages"
+        % (bill["path"], bill["elapsed"], bill["pages_read"], bill["total_pages"])
+    )
+    # Pages are read as TMobile consumes their lines, so parsing is the rest of elapsed
+    record("extract", bill["extract_elapsed"], path=bill["path"])
+    record("parse", bill["elapsed"] - bill["extract_elapsed"], path=bill["path"])
+
+
+def __load_bill__(path, extractor=DEFAULT_EXTRACTOR, cache=None):
+    """Function to get a parsed bill from the cache or extract it otherwise
+
+    :param path: Path to T-Mobile pdf bill
+    :type path: (str)
+    :param extractor: Name of the pdf extraction backend, defaults to DEFAULT_EXTRACTOR
+    :type extractor: (str), optional
+    :param cache: Cache of parsed bills, defaults to None for no caching
+    :type cache: (BillCache), optional
+    :return: Parsed account details of the bill
+    :rtype: (dict)
+    """
+    bill = cache.get(path) if cache is not None else None
+    if bill is None:
+        bill = __extract_bill__(path, extractor=extractor)
+        __log_extraction__(bill)
+        if cache is not None:
+            bill["hash"] = cache.put(path, bill)
+    return bill
+
+
+def __iter_extracted_bills__(paths, workers, extractor=DEFAULT_EXTRACTOR, cache=None):
+    """Function to extract summary bills concurrently on a bounded process pool, yielding
+       each bill as soon as it is ready. Bills found in the cache are yielded first and
+       are not extracted again
+
+    :param paths: Paths to T-Mobile pdf bills
+    :type paths: (list)
+    :param workers: Maximum number of concurrent worker processes
+    :type workers: (int)
+    :param extractor: Name of the pdf extraction backend, defaults to DEFAULT_EXTRACTOR
+    :type extractor: (str), optional
+    :param cache: Cache of parsed bills, defaults to None for no caching
+    :type cache: (BillCache), optional
+    :return: Path and parsed bill in the order they are ready, failed bills are skipped
+    :rtype: (generator)
+    """
+    missing = []
+    for path in paths:
+        bill = None if cache is None else cache.get(path)
+        if bill is None:
+            missing.append(path)
+        else:
+            yield path, bill
+    if not missing:
+        return
+    # Bills are pulled on a thread of the pipeline, and forking a process that runs
+    # threads can copy a lock held by another thread into the workers
+    start_method = "spawn"
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        start_method = "forkserver"
+    with ProcessPoolExecutor(
+        max_workers=max(1, workers),
+        mp_context=multiprocessing.get_context(start_method),
+    ) as pool:
+        futures = {
+            pool.submit(__extract_bill__, path, extractor): path for path in missing
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                bill = future.result()
+            except Exception as err:  # one bad bill should not abort the batch
+                logger.error("Extraction of file=%s : FAILED (%s)" % (path, err))
+                continue
+            __log_extraction__(bill)
+            if cache is not None:
+                bill["hash"] = cache.put(path, bill)
+            yield path, bill
+
+
+def __extract_bills__(paths, workers, extractor=DEFAULT_EXTRACTOR, cache=None):
+    """Function to extract summary bills concurrently on a bounded process pool.
+       Bills found in the cache are not extracted again
+
+    :param paths: Paths to T-Mobile pdf bills
+    :type paths: (list)
+    :param workers: Maximum number of concurrent worker processes
+    :type workers: (int)
+    :param extractor: Name of the pdf extraction backend, defaults to DEFAULT_EXTRACTOR
+    :type extractor: (str), optional
+    :param cache: Cache of parsed bills, defaults to None for no caching
+    :type cache: (BillCache), optional
+    :return: Parsed bills in the same order as given paths, failed bills are skipped
+    :rtype: (list)
+    """
+    bills = dict(__iter_extracted_bills__(paths, workers, extractor, cache))
+    return [bills[path] for path in paths if path in bills]
 
 
-def __send_email__(account_details, account_data):
+def __get_total_charges_and_tabular_data__(
+    account_details, basic_cents, statement=DEFAULT_FORMAT
+):
+    values, total_charges = get_statement_values(account_details, basic_cents)
+    return get_renderer(statement).render(values), total_charges
 
+
+def __compute_bill__(bill, statement=DEFAULT_FORMAT):
+    """Function to compute charges for each line on a parsed bill
+
+    :param bill: Parsed bill returned by __extract_bill__
+    :type bill: (dict)
+    :param statement: Format of the statement of each line, defaults to DEFAULT_FORMAT
+    :type statement: (str), optional
+    :return: Months, subject, per-line charges and total of the bill
+    :rtype: (dict)
+    """
+    base_name, _ = os.path.splitext(os.path.basename(bill["path"]))
+    with timer("accounts", path=bill["path"]):
+        directory = UserDirectory.for_file()
+        lines = [
+            Line(account, directory=directory) for account in bill["account_to_data"]
+        ]
+        account = Account(all_lines=lines, account_total=bill["plan_total"])
+
+    months = parse_months(file_name=base_name)
+    curr_year = get_year(months=months, file_name=base_name)
+    charges = []
+    grand_total_cents = 0
+    with timer("render", path=bill["path"]):
+        statements = [
+            get_statement_values(account_details=_acc_, basic_cents=basic_cents)
+            for _acc_, basic_cents in zip(lines, account.get_basic_shares())
+        ]
+        tables = get_renderer(statement).render_all(values for values, _ in statements)
+    for _acc_, data_for_account, (_, sub_total) in zip(lines, tables, statements):
+        charges.append((_acc_, data_for_account, sub_total))
+        grand_total_cents += to_cents(sub_total)
+    return {
+        "path": bill["path"],
+        "months": months,
+        "year": curr_year,
+        "subject": "T-Mobile({} {})".format(months["current_month"], curr_year),
+        "plan_total": bill["plan_total"],
+        "account_total": bill.get("account_total"),
+        "charges": charges,
+        "total": grand_total_cents / 100,
+    }
+
+
+def __get_email_message__(args, bill, account_details, account_data):
+    months = bill["months"]
     email_template = get_email_template(
         user=account_details.user["name"],
         prev_month=months["prev_month"],
         month=months["current_month"],
         next_month=months["next_month"],
-        year=curr_year,
+        year=bill["year"],
     )
-
-    message = create_message(
+    if args.get("statement") == "html":
+        return create_message(
+            sender_email=args["sender"],
+            to_email=account_details.user["email"],
+            subject=bill["subject"],
+            message_text="<pre>{}</pre>\n{}".format(
+                html.escape(email_template), account_data
+            ),
+            subtype="html",
+        )
+    return create_message(
         sender_email=args["sender"],
         to_email=account_details.user["email"],
-        subject=SUBJECT,
+        subject=bill["subject"],
         message_text="{}\n{}".format(email_template, account_data),
     )
-    email_cli.send_message(message=message)
 
 
-def __send_venmo_request__(line, total):
-    venmo_ = Venmo()
-    v_name = venmo_.users[line]
-    user_details = venmo_.get_user(user_name=v_name["venmo_username"])
-    venmo_.request(
-        note=SUBJECT + v_name["additional_note"],
-        user_id=user_details.id,
-        amount=total,
-        addtional_amount=v_name["additional_amount"],
+def __send_emails__(email_cli, emails, on_result=None):
+    """Function to send emails of all lines in bulk and log their outcome
+
+    :param email_cli: Client used to send emails
+    :type email_cli: (EmailClient)
+    :param emails: Pairs of Line and its message from __get_email_message__
+    :type emails: (list)
+    :param on_result: Called with the index and result of each email as it is sent
+    :type on_result: (callable), optional
+    :return: Id, error and latency of each email, in the order of emails
+    :rtype: (list)
+    """
+    if not emails:
+        return []
+    logger.info("Sending %s Email(s) ..." % len(emails))
+    results = email_cli.send_messages(
+        [message for _, message in emails], on_result=on_result
     )
+    for (_acc_, _), result in zip(emails, results):
+        user_name = _acc_.user["name"]
+        if result["error"] is not None:
+            logger.error(result["error"])
+            logger.error(
+                "Email to user=%s for line=%s : FAILED" % (user_name, _acc_.line)
+            )
+        else:
+            logger.info(
+                "Email to user=%s for line=%s : SUCCESS" % (user_name, _acc_.line)
+            )
+    return results
+
+
+def __get_venmo_request__(venmo_cli, line, total, subject):
+    v_name = venmo_cli.get_line_details(line)
+    return {
+        "note": subject + v_name["additional_note"],
+        "user_name": v_name["venmo_username"],
+        "amount": total,
+        "addtional_amount": v_name["additional_amount"],
+    }
+
+
+def __log_unknown_request__(_acc_):
+    """Function to report a Venmo request that may have been sent, so it is checked in
+       Venmo by hand. It is not sent again unless --resend-all is given
+
+    :param _acc_: Line the request is for
+    :type _acc_: (Line)
+    """
+    logger.warning(
+        "Request to user=%s for line=%s : UNKNOWN, check in Venmo whether it was sent"
+        % (_acc_.user["name"], _acc_.line)
+    )
+
+
+def __send_venmo_requests__(venmo_cli, venmo_requests, on_result=None):
+    """Function to send venmo requests one after another and log their outcome. The
+       pipeline of __dispatch_bills__ runs venmo_cli.workers of these concurrently
+
+    :param venmo_cli: Venmo session shared by all lines
+    :type venmo_cli: (Venmo)
+    :param venmo_requests: Pairs of Line and its request from __get_venmo_request__
+    :type venmo_requests: (list)
+    :param on_result: Called with the index and result of each request as it is sent
+    :type on_result: (callable), optional
+    :return: Status, error and latency of each request, in the order of venmo_requests
+    :rtype: (list)
+    """
+    results = []
+    for index, (_acc_, venmo_request) in enumerate(venmo_requests):
+        result = venmo_cli.request_one(venmo_request)
+        if on_result is not None:
+            on_result(index, result)
+        if result["error"] is not None:
+            logger.info(result["error"])
+        logger.info(
+            "Request to user=%s for line=%s : %s in %.2fs"
+            % (_acc_.user["name"], _acc_.line, result["status"], result["latency"])
+        )
+        if result["status"] == "UNKNOWN":
+            __log_unknown_request__(_acc_)
+        results.append(result)
+    return results
+
+
+def __load_bills__(cli_args, args, extractor, cache):
+    """Function to get the bill of configs/input.json, or every bill of --batch extracted
+       on a pool of processes, as they are ready
+
+    :param cli_args: Command line options from __get_cli_args__
+    :type cli_args: (argparse.Namespace)
+    :param args: Validated inputs from configs/input.json
+    :type args: (dict)
+    :param extractor: Name of the pdf extractor backend
+    :type extractor: (str)
+    :param cache: Cache of parsed bills | None to parse every bill
+    :type cache: (BillCache | None)
+    :return: Paths of pdfs found and a generator of their path and parsed bill
+    :rtype: (tuple)
+    """
+    if not cli_args.batch:
+        paths = [args["path"]]
+        return paths, (
+            (path, __load_bill__(path, extractor=extractor, cache=cache))
+            for path in paths
+        )
+    paths = __get_bill_paths__(cli_args.batch)
+    return paths, __iter_extracted_bills__(
+        paths=paths, workers=cli_args.workers, extractor=extractor, cache=cache
+    )
+
+
+def __compute_bills__(
+    parsed_bills, store, computed, statement=DEFAULT_FORMAT, exporter=None
+):
+    """Function to compute, hash, store and export parsed bills one at a time, as they
+       are pulled. A bill that fails to compute is logged and skipped
+
+    :param parsed_bills: Path and parsed bill pairs from __load_bills__
+    :type parsed_bills: (iterable)
+    :param store: Store of processed bills | None if bills are not stored
+    :type store: (BillStore | None)
+    :param computed: Computed bills by path, every computed bill is added to
+    :type computed: (dict)
+    :param statement: Format of the statement of each line, defaults to DEFAULT_FORMAT
+    :type statement: (str), optional
+    :param exporter: Exporter of the lines of each bill, defaults to None
+    :type exporter: (Exporter), optional
+    :return: Computed bills
+    :rtype: (generator)
+    """
+    for path, parsed_bill in parsed_bills:
+        try:
+            bill = __compute_bill__(parsed_bill, statement=statement)
+            # Bills of the cache carry the hash it already computed
+            bill["hash"] = parsed_bill.get("hash") or get_file_hash(bill["path"])
+        except Exception as err:  # one bad bill should not abort the batch
+            logger.error("Computation of file=%s : FAILED (%s)" % (path, err))
+            continue
+        __store_bill__(store=store, bill=bill)
+        if exporter is not None:
+            with timer("export", path=path):
+                exporter.write_bill(bill)
+        computed[path] = bill
+        yield bill
+
+
+def __queue_email__(args, bill, account_details, account_data, total, sent, emails):
+    """Function to queue the email of a line unless the journal has it sent before with
+       the same total to the same address
+
+    :param total: Total charges of the line
+    :type total: (float)
+    :param sent: Journal entries of the bill from RunJournal.load
+    :type sent: (dict)
+    :param emails: Queue of Line, message and journal entry of each email to send
+    :type emails: (list)
+    """
+    line = normalize_phone(account_details.line)
+    recipient = account_details.user["email"]
+    total_cents = to_cents(total)
+    if is_dispatched(sent.get((line, "email")), recipient, total_cents):
+        logger.info(
+            "Email to user=%s for line=%s : UNCHANGED"
+            % (account_details.user["name"], account_details.line)
+        )
+        return
+    message = __get_email_message__(
+        args=args,
+        bill=bill,
+        account_details=account_details,
+        account_data=account_data,
+    )
+    emails.append((account_details, message, (line, "email", recipient, total_cents)))
+
+
+def __queue_venmo_request__(venmo_cli, bill, account_details, total, sent, queue):
+    """Function to queue the Venmo request of a line unless the journal has it sent
+       before with the same amount to the same Venmo user
+
+    :param sent: Journal entries of the bill from RunJournal.load
+    :type sent: (dict)
+    :param queue: Queues of "venmo_requests" with Line, request and journal entry of
+                  each request to send, and of "failed" journal entries
+    :type queue: (dict)
+    """
+    line = normalize_phone(account_details.line)
+    try:
+        venmo_request = __get_venmo_request__(
+            venmo_cli=venmo_cli,
+            line=account_details.line,
+            total=total,
+            subject=bill["subject"],
+        )
+    except UserNotFound as err:
+        logger.info(err)
+        logger.info(
+            "Request to user=%s for line=%s : FAILED"
+            % (account_details.user["name"], account_details.line)
+        )
+        queue["failed"].append((line, "venmo", None, to_cents(total), "FAILED", None))
+        return
+    recipient = venmo_request["user_name"]
+    amount_cents = to_cents(venmo_request["amount"] + venmo_request["addtional_amount"])
+    entry = sent.get((line, "venmo"))
+    if is_dispatched(entry, recipient, amount_cents):
+        logger.info(
+            "Request to user=%s for line=%s : UNCHANGED"
+            % (account_details.user["name"], account_details.line)
+        )
+        if entry["status"] == "UNKNOWN":
+            __log_unknown_request__(account_details)
+        return
+    queue["venmo_requests"].append(
+        (account_details, venmo_request, (line, "venmo", recipient, amount_cents))
+    )
+
+
+def __load_sent__(bill, journal, checkpoint):
+    """Function to get what was sent to each line of a bill by previous runs
+
+    :param bill: Computed bill returned by __compute_bill__
+    :type bill: (dict)
+    :param journal: Journal of emails and Venmo requests sent | None
+    :type journal: (RunJournal | None)
+    :param checkpoint: Checkpoint of the run | None
+    :type checkpoint: (Checkpoint | None)
+    :return: SHA-256 of the pdf and latest entries by (line, channel), checkpoint
+             records of a resumed run taking precedence over the journal
+    :rtype: (tuple)
+    """
+    bill_hash = bill.get("hash") or get_file_hash(bill["path"])
+    sent = {} if journal is None else journal.load(bill_hash)
+    if checkpoint is not None:
+        sent.update(checkpoint.load(bill_hash))
+    return bill_hash, sent
+
+
+def __queue_bill__(args, bill, venmo_cli, sent):
+    """Function to queue the email and Venmo request of each line of a bill that was not
+       sent before. A line that fails to queue is logged and skipped
+
+    :param sent: Journal entries of the bill from RunJournal.load
+    :type sent: (dict)
+    :return: Queue of emails and queues of "venmo_requests" and "failed" journal entries
+    :rtype: (tuple)
+    """
+    emails, queue = [], {"venmo_requests": [], "failed": []}
+    for _acc_, data_for_account, sub_total in bill["charges"]:
+        try:
+            if args["email"]:
+                __queue_email__(
+                    args, bill, _acc_, data_for_account, sub_total, sent, emails
+                )
+            if args["venmo"] and args["user"].lower() != _acc_.user["name"].lower():
+                __queue_venmo_request__(venmo_cli, bill, _acc_, sub_total, sent, queue)
+        except Exception as err:  # one bad line should not hold back the others
+            logger.error(
+                "Dispatch to user=%s for line=%s : FAILED (%s)"
+                % (_acc_.user["name"], _acc_.line, err)
+            )
+    return emails, queue
+
+
+def __finish_bill__(run, journal, checkpoint):
+    """Function to record a bill once all its emails and Venmo requests completed
+
+    :param run: Bill, its hash and journal entries of its completed items
+    :type run: (dict)
+    :param journal: Journal of emails and Venmo requests sent | None
+    :type journal: (RunJournal | None)
+    :param checkpoint: Checkpoint of the run | None
+    :type checkpoint: (Checkpoint | None)
+    """
+    if checkpoint is not None:
+        checkpoint.sync()
+    if journal is not None:
+        journal.record(run["hash"], run["completed"])
+    logger.info("TOTAL AMOUNT: %s" % run["bill"]["total"])
+
+
+def __route_bill__(args, bill, venmo_cli, journal, checkpoint, stages):
+    """Function to log a computed bill and route the email and Venmo request of each line
+       to their stage. Lines the journal or a resumed checkpoint has sent the same total
+       to the same recipient are skipped
+
+    :param bill: Computed bill returned by __compute_bill__
+    :type bill: (dict)
+    :param stages: Stages of the pipeline by channel ("email" | "venmo")
+    :type stages: (dict)
+    :return: Stage and item of each email and Venmo request to send
+    :rtype: (list)
+    """
+    logger.info(bill["subject"])
+    for _, data_for_account, _ in bill["charges"]:
+        logger.info(data_for_account)
+    if args["test"]:
+        logger.info("TOTAL AMOUNT: %s" % bill["total"])
+        return []
+    bill_hash, sent = __load_sent__(bill, journal, checkpoint)
+    emails, queue = __queue_bill__(args, bill, venmo_cli, sent)
+    run = {"bill": bill, "hash": bill_hash, "completed": queue["failed"]}
+    items = [(stages["email"], (run,) + email) for email in emails] + [
+        (stages["venmo"], (run,) + request) for request in queue["venmo_requests"]
+    ]
+    run["pending"] = len(items)
+    if not items:
+        __finish_bill__(run, journal, checkpoint)
+    return items
+
+
+def __get_route__(args, venmo_cli, journal, checkpoint, stages):
+    """Function to get the route of the pipeline, see __route_bill__. A bill that fails
+       to route is logged and nothing of it is sent
+
+    :return: Route taking a computed bill and returning its stages and items
+    :rtype: (callable)
+    """
+
+    def __route__(bill):
+        try:
+            return __route_bill__(args, bill, venmo_cli, journal, checkpoint, stages)
+        except Exception as err:  # one bad bill should not abort the batch
+            logger.error("Dispatch of file=%s : FAILED (%s)" % (bill["path"], err))
+            return []
+
+    return __route__
+
+
+def __get_email_status__(result):
+    """Function to get status and message id of a sent email from its result"""
+    return "FAILED" if result["error"] else "SUCCESS", result["id"]
+
+
+def __get_venmo_status__(result):
+    """Function to get status of a sent Venmo request from its result"""
+    return result["status"], None
+
+
+def __get_failure__(err):
+    """Function to get the result of an email or Venmo request that raised err"""
+    return {"id": None, "status": "FAILED", "error": err, "latency": 0.0}
+
+
+def __get_handler__(send, client, get_status, checkpoint):
+    """Function to get the handler of a stage sending a batch of items with send and
+       appending each to the checkpoint as it completes. Items of a batch that raised
+       before they completed are failed. Runs on executor threads
+
+    :param send: __send_emails__ | __send_venmo_requests__
+    :type send: (callable)
+    :param get_status: Function returning status and reference of an item from its result
+    :type get_status: (callable)
+    :return: Handler taking a batch of items and returning their results
+    :rtype: (callable)
+    """
+
+    def __handle__(batch):
+        recorded = {}
+
+        def __record__(index, result):
+            recorded[index] = result
+            if checkpoint is not None:
+                run, _, _, entry = batch[index]
+                checkpoint.append(run["hash"], entry + get_status(result))
+
+        try:
+            return send(
+                client,
+                [(_acc_, sent) for _, _acc_, sent, _ in batch],
+                on_result=__record__,
+            )
+        except Exception as err:  # one failing batch should not abort the pipeline
+            logger.error("Sending %s item(s) : FAILED (%s)" % (len(batch), err))
+            failure = __get_failure__(err)
+        for index in range(len(batch)):
+            if index not in recorded:
+                __record__(index, failure)
+        return [recorded[index] for index in range(len(batch))]
+
+    return __handle__
+
+
+def __get_on_done__(get_status, journal, checkpoint):
+    """Function to get the callback of a stage collecting the journal entry of each
+       completed item, and finishing its bill once none are pending. Runs in the loop
+
+    :return: Callback taking an item and its result
+    :rtype: (callable)
+    """
+
+    def __on_done__(item, result):
+        run, _, _, entry = item
+        run["completed"].append(entry + get_status(result))
+        run["pending"] -= 1
+        if not run["pending"]:
+            __finish_bill__(run, journal, checkpoint)
+
+    return __on_done__
+
+
+def __dispatch_bills__(
+    args,
+    bills,
+    email_cli,
+    venmo_cli=None,
+    journal=None,
+    checkpoint=None,
+    queue_size=QUEUE_SIZE,
+):
+    """Function to log, email and request charges for each line of computed bills on a
+       pipeline, so emails and Venmo requests of a bill are sent while the next bills are
+       extracted and computed. Stage queues hold up to queue_size items, so a slow stage
+       holds back the bills behind it. The outcome of every email and Venmo request is
+       appended to the checkpoint as it completes, and recorded in the journal once all
+       of its bill completed
+
+    :param args: Validated inputs from configs/input.json
+    :type args: (dict)
+    :param bills: Computed bills, any iterable or generator pulled as the pipeline drains
+    :type bills: (iterable)
+    :param email_cli: Client used to send emails
+    :type email_cli: (EmailClient)
+    :param venmo_cli: Venmo session shared by all lines, defaults to None
+    :type venmo_cli: (Venmo), optional
+    :param journal: Journal of emails and Venmo requests sent, defaults to None
+    :type journal: (RunJournal), optional
+    :param checkpoint: Checkpoint of the run, defaults to None
+    :type checkpoint: (Checkpoint), optional
+    :param queue_size: Maximum number of items queued per stage, defaults to QUEUE_SIZE
+    :type queue_size: (int), optional
+    """
+    stages = {
+        "email": Stage(
+            "email",
+            __get_handler__(
+                __send_emails__, email_cli, __get_email_status__, checkpoint
+            ),
+            __get_on_done__(__get_email_status__, journal, checkpoint),
+            workers=EMAIL_WORKERS,
+            batch_size=BATCH_SIZE,
+            queue_size=queue_size,
+        ),
+        "venmo": Stage(
+            "venmo",
+            __get_handler__(
+                __send_venmo_requests__, venmo_cli, __get_venmo_status__, checkpoint
+            ),
+            __get_on_done__(__get_venmo_status__, journal, checkpoint),
+            workers=getattr(venmo_cli, "workers", 1),
+            queue_size=queue_size,
+        ),
+    }
+    run_pipeline_sync(
+        source=bills,
+        route=__get_route__(args, venmo_cli, journal, checkpoint, stages),
+        stages=list(stages.values()),
+        threads=1 + sum(stage.workers for stage in stages.values()),
+    )
+
+
+def __dispatch_bill__(
+    args, bill, email_cli, venmo_cli=None, journal=None, checkpoint=None
+):
+    """Function to log, email and request charges for each line on a computed bill,
+       see __dispatch_bills__
+
+    :param bill: Computed bill returned by __compute_bill__
+    :type bill: (dict)
+    """
+    __dispatch_bills__(
+        args=args,
+        bills=[bill],
+        email_cli=email_cli,
+        venmo_cli=venmo_cli,
+        journal=journal,
+        checkpoint=checkpoint,
+    )
+
+
+def __write_report__(bills, report_file):
+    """Function to write one combined report for all bills processed in a batch
+
+    :param bills: Computed bills returned by __compute_bill__
+    :type bills: (list)
+    :param report_file: Path to the report file
+    :type report_file: (str)
+    """
+    with open(report_file, "w") as report:
+        for bill in bills:
+            report.write("{}\n".format(bill["subject"]))
+            for _, data_for_account, _ in bill["charges"]:
+                report.write("{}\n".format(data_for_account))
+            report.write("TOTAL AMOUNT: {}\n\n".format(bill["total"]))
+        report.write(
+            "GRAND TOTAL: {}\n".format(
+                sum(to_cents(bill["total"]) for bill in bills) / 100
+            )
+        )
+
+
+def __store_bill__(store, bill):
+    """Function to store a computed bill, a failure is logged and does not stop the run
+
+    :param store: Store of processed bills | None if bills are not stored
+    :type store: (BillStore | None)
+    :param bill: Computed bill returned by __compute_bill__
+    :type bill: (dict)
+    """
+    if store is None:
+        return
+    try:
+        store.put(bill, bill_hash=bill.get("hash"))
+    except (OSError, sqlite3.Error) as err:
+        logger.info("Could not store bill=%s: %s" % (bill["path"], err))
+
+
+def __get_history__(store, months):
+    """Function to get a table of total charges of each user over the latest stored months
+
+    :param store: Store of processed bills
+    :type store: (BillStore)
+    :param months: Number of latest stored months
+    :type months: (int)
+    :return: Grid formatted table of users, bills and totals
+    :rtype: (str)
+    """
+    from tabulate import tabulate
+
+    rows = [
+        [user, bills, total_cents / 100]
+        for user, bills, total_cents in store.get_totals_by_user(months=months)
+    ]
+    return tabulate(rows, headers=["User", "Bills", "Total"], tablefmt="grid")
+
+
+def __open_exporter__(cli_args, args):
+    """Function to open the exporter of --export, else of "export" of input.json
+
+    :param cli_args: Command line options from __get_cli_args__
+    :type cli_args: (argparse.Namespace)
+    :param args: Validated inputs from configs/input.json
+    :type args: (dict)
+    :return: Exporter of the lines of each bill | None if nothing is exported
+    :rtype: (Exporter | None)
+    """
+    path = cli_args.export or args.get("export")
+    if not path:
+        return None
+    return open_exporter(path, fmt=cli_args.export_format)
+
+
+def __close_exporter__(exporter):
+    """Function to close the exporter of the run, if any, and log the rows exported
+
+    :param exporter: Exporter of the lines of each bill
+    :type exporter: (Exporter | None)
+    """
+    if exporter is None:
+        return
+    exporter.close()
+    logger.info("Exported %s line(s) to %s" % (exporter.rows, exporter.path))
+
+
+def __process_bills__(cli_args, args, store, cache, journal, checkpoint):
+    """Function to extract, compute, store, export and dispatch the bill of input.json or
+       every bill of --batch, and write the report of a batch
+
+    :param cli_args: Command line options from __get_cli_args__
+    :type cli_args: (argparse.Namespace)
+    :param args: Validated inputs from configs/input.json
+    :type args: (dict)
+    :param store: Store of processed bills | None if bills are not stored
+    :type store: (BillStore | None)
+    :param cache: Cache of parsed bills | None to parse every bill
+    :type cache: (BillCache | None)
+    :param journal: Journal of emails and Venmo requests sent | None
+    :type journal: (RunJournal | None)
+    :param checkpoint: Checkpoint of the run | None
+    :type checkpoint: (Checkpoint | None)
+    """
+    email_cli = EmailClient()
+    venmo_cli = None
+    if args["venmo"] and not args["test"]:
+        venmo_cli = Venmo(workers=cli_args.venmo_workers, rate=cli_args.venmo_rate)
+    exporter = __open_exporter__(cli_args, args)
+    started = time.perf_counter()
+    paths, parsed_bills = __load_bills__(
+        cli_args, args, args.get("extractor", DEFAULT_EXTRACTOR), cache
+    )
+    computed = {}
+    try:
+        __dispatch_bills__(
+            args=args,
+            bills=__compute_bills__(
+                parsed_bills,
+                store,
+                computed,
+                statement=args.get("statement", DEFAULT_FORMAT),
+                exporter=exporter,
+            ),
+            email_cli=email_cli,
+            venmo_cli=venmo_cli,
+            journal=journal,
+            checkpoint=checkpoint,
+            queue_size=cli_args.queue_size,
+        )
+    finally:
+        # Bills exported before a failure are flushed, parquet files get their footer
+        __close_exporter__(exporter)
+    if cli_args.batch:
+        bills = [computed[path] for path in paths if path in computed]
+        __write_report__(bills=bills, report_file=cli_args.report)
+        logger.info(
+            "Processed %s of %s bill(s) in %.2fs, report=%s"
+            % (len(bills), len(paths), time.perf_counter() - started, cli_args.report)
+        )
+
+
+def __open_checkpoint__(cli_args):
+    """Function to open the checkpoint of the run, exiting if it would start over the
+       checkpoint of an interrupted run without --resume or --fresh
+
+    :param cli_args: Command line options from __get_cli_args__
+    :type cli_args: (argparse.Namespace)
+    :return: Checkpoint of the run
+    :rtype: (Checkpoint)
+    """
+    try:
+        return Checkpoint(
+            cli_args.checkpoint, resume=cli_args.resume, fresh=cli_args.fresh
+        )
+    except FileExistsError as err:
+        logger.error("%s, with --resume or --fresh" % err)
+        sys.exit("%s, with --resume or --fresh" % err)
+
+
+def __log_profile__(print_report):
+    """Function to stop profiling and log the summary of stages of the run, if enabled
+
+    :param print_report: True to also print the summary
+    :type print_report: (bool)
+    """
+    profiler = disable_profiling()
+    if profiler is None:
+        return
+    report = profiler.get_report()
+    logger.info("Run profile:\n%s" % report)
+    if print_report:
+        print(report)
 
 
 if __name__ == "__main__":
@@ -146,59 +1130,34 @@ if __name__ == "__main__":
         format="%(asctime)s %(message)s",
         datefmt="%m-%d-%Y %I:%M:%S %p",
     )
-    logger = logging.getLogger(__name__)
+    cli_args = __get_cli_args__()
+    if cli_args.profile or cli_args.events:
+        enable_profiling(events_file=cli_args.events)
+    if cli_args.venmo_warm_up:
+        missing = Venmo().warm_up()
+        logger.info("Venmo user ids cached, users not found=%s" % missing)
+        sys.exit(1 if missing else 0)
+    store = None if cli_args.no_store else BillStore(cli_args.store)
+    if cli_args.history is not None:
+        print(__get_history__(store or BillStore(cli_args.store), cli_args.history))
+        sys.exit(0)
     args = __get_args__()
-    base_name, ext = os.path.splitext(os.path.basename(args["path"]))
-    raw = parser.from_file(args["path"])
-    data = raw["content"].split("\n")
-
-    email_cli = EmailClient()
-    tmobile = TMobile(raw_data=data)
-    account_to_data = tmobile.get_account_data_mapping()
-    lines = [Line(account) for account in account_to_data]
-    account = Account(all_lines=lines, account_total=tmobile.plan_total)
-
-    basic_on_each_line = account.get_basic_charge()
-
-    months = parse_months(file_name=base_name)
-    curr_year = get_year(months=months)
-    SUBJECT = "T-Mobile({} {})".format(months["current_month"], curr_year)
-    GRAND_TOTAL = 0
-    table_data = []
-    logger.info(SUBJECT)
-    for _acc_ in lines:
-        user_name = _acc_.user["name"]
-        data_for_account, sub_total = __get_total_charges_and_tabular_data__(
-            account_details=_acc_
-        )
-        logger.info(data_for_account)
-        GRAND_TOTAL += sub_total
-        if args["test"]:
-            continue
-        if args["email"]:
-            logger.info("Sending Email ...")
-            try:
-                __send_email__(account_details=_acc_, account_data=data_for_account)
-            except EmailFailure as err:
-                logger.exception(err)
-                logger.error(
-                    "Email to user=%s for line=%s : FAILED" % (user_name, _acc_.line)
-                )
-            else:
-                logger.info(
-                    "Email to user=%s for line=%s : SUCCESS" % (user_name, _acc_.line)
-                )
-        if args["venmo"] and args["user"].lower() != user_name.lower():
-            logger.info("Sending Venmo request ...")
-            try:
-                __send_venmo_request__(line=_acc_.line, total=sub_total)
-            except UserNotFound as err:
-                logger.info(err)
-                logger.info(
-                    "Request to user=%s for line=%s : FAILED" % (user_name, _acc_.line)
-                )
-            else:
-                logger.info(
-                    "Request to user=%s for line=%s : SUCCESS" % (user_name, _acc_.line)
-                )
-    logger.info("TOTAL AMOUNT: %s" % GRAND_TOTAL)
+    cache = None if cli_args.no_cache else BillCache()
+    if cli_args.clear_cache:
+        (cache or BillCache()).clear()
+    journal = None
+    if not (cli_args.resend_all or cli_args.no_store):
+        journal = RunJournal(cli_args.store)
+    checkpoint = None if args["test"] else __open_checkpoint__(cli_args)
+    completed = False
+    try:
+        __process_bills__(cli_args, args, store, cache, journal, checkpoint)
+        completed = True
+    finally:
+        # Records appended since the last completed bill are fsynced even on failure,
+        # and kept for --resume
+        if checkpoint is not None:
+            checkpoint.close(completed=completed)
+    if cache is not None:
+        logger.info("Bill cache: hits=%s misses=%s" % (cache.hits, cache.misses))
+    __log_profile__(print_report=cli_args.profile)
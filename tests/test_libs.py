@@ -3,9 +3,48 @@
 This is pytest file to perform unit tests associated with libs library.
 For each function in libs library we have a test with all possible input/output combinations
 """
+
+import json
+import os
+import pickle
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import httplib2
 import pytest
-from tmobile.libs.lib_email import create_message
-from tmobile.libs.lib_tmobile import TMobile
+import requests
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError, InvalidJsonError
+from mock import patch
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from venmo_api import HttpCodeError
+from tmobile.benchmarks.synthetic import (
+    get_account_data,
+    get_bill_data,
+    get_plan_total,
+    write_fixtures,
+)
+from tmobile.libs.lib_cache import BillCache
+from tmobile.libs.lib_checkpoint import Checkpoint
+from tmobile.libs.lib_email import SCOPES, EmailClient, EmailFailure, create_message
+from tmobile.libs.lib_journal import RunJournal, is_dispatched
+from tmobile.libs.lib_pdf import PypdfExtractor, get_extractor
+from tmobile.libs.lib_store import BillStore
+from tmobile.libs import lib_tmobile
+from tmobile.libs.lib_tmobile import (
+    LayoutProfile,
+    ParsedBill,
+    TMobile,
+    get_layout,
+    parse_bill,
+    register_layout,
+)
+from tmobile.libs.lib_venmo import Venmo, is_outcome_unknown, is_retryable
+from tmobile.libs.lib_watch import FolderWatcher
+from tmobile.models.charges import LineCharges
+from tmobile.utilities.utils import UserNotFound, get_file_hash
 
 __test_dummy_data__ = [
     "T-Mobile",
@@ -105,6 +144,54 @@ __test_actual_data__ = [
 ]
 
 
+def __write_test_pdf__(path, pages):
+    """
+    Write a minimal pdf with one text line per entry for each page in pages
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None]
+    font = 3 + 2 * len(pages)
+    kids = []
+    for page in pages:
+        stream = "BT /F1 10 Tf 12 TL 20 800 Td {} ET".format(
+            " ".join("({}) '".format(line) for line in page)
+        )
+        kids.append("{} 0 R".format(len(objects) + 1))
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            "/Resources << /Font << /F1 {} 0 R >> >> /Contents {} 0 R >>".format(
+                font, len(objects) + 2
+            )
+        )
+        objects.append(
+            "<< /Length {} >>\nstream\n{}\nendstream".format(len(stream), stream)
+        )
+    objects[1] = "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+        " ".join(kids), len(pages)
+    )
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    content, offsets = "%PDF-1.4\n", []
+    for num, obj in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += "{} 0 obj\n{}\nendobj\n".format(num, obj)
+    xref = len(content)
+    content += "xref\n0 {}\n0000000000 65535 f \n".format(len(objects) + 1)
+    content += "".join("{:010d} 00000 n \n".format(offset) for offset in offsets)
+    content += "trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(
+        len(objects) + 1, xref
+    )
+    with open(path, "w") as pdf_file:
+        pdf_file.write(content)
+    return str(path)
+
+
+# pdf text renders the non-breaking spaces of the bill as plain spaces
+__test_pdf_pages__ = [
+    ["Previous balance $314.62", "THIS BILL SUMMARY"]
+    + [line.replace("\xa0", " ") for line in __test_actual_data__[7:19] if line],
+    [line for line in __test_actual_data__[19:] if line],
+]
+
+
 def test_create_email_message():
     """
     Test create email message function
@@ -148,3 +235,877 @@ def test_tmobile_functions():
     assert account_data_map[1]["Services"] == "$16.37"
     assert account_data_map[1]["Total"] == "$20.66"
     assert account_data_map[2]["Plans"] == "$4.29"
+
+
+@pytest.mark.parametrize("no_of_lines", [1, 10, 500])
+def test_tmobile_synthetic_bill(no_of_lines, tmp_path):
+    """
+    Test synthetic bills of the benchmarks parse to their generated lines and users
+    """
+    tmobile_ = TMobile(raw_data=get_bill_data(no_of_lines, seed=no_of_lines))
+    account_data = get_account_data(no_of_lines, seed=no_of_lines)
+    assert tmobile_.get_account_data_mapping() == account_data
+    assert tmobile_.plan_total == get_plan_total(no_of_lines, seed=no_of_lines)
+    users_file, venmo_file = write_fixtures(str(tmp_path), no_of_lines)
+    venmo_ = Venmo(venmo_file=venmo_file, id_cache_file=str(tmp_path / "ids.json"))
+    for prop in account_data:
+        assert venmo_.get_line_details(prop["Line"])["venmo_username"]
+    assert len(json.loads(open(users_file).read())) == no_of_lines
+
+
+def test_pypdf_extractor(tmp_path):
+    """
+    Test in-process pdf extraction returns lines that TMobile can parse
+    """
+    pdf_path = __write_test_pdf__(tmp_path / "bill.pdf", __test_pdf_pages__)
+    extractor = get_extractor("pypdf")
+    assert isinstance(extractor, PypdfExtractor)
+    assert get_extractor("pypdf") is extractor
+    tmobile_ = TMobile(raw_data=extractor.extract(pdf_path))
+    assert tmobile_.account_total == 317.53
+    account_data_map = tmobile_.get_account_data_mapping()
+    assert len(account_data_map) == 3
+    assert account_data_map[0]["Line"] == "(123)456-7890"
+    assert account_data_map[1]["Services"] == "$16.37"
+
+
+def test_extractor_errors(tmp_path):
+    """
+    Test unknown extractors and pdfs without text
+    """
+    with pytest.raises(ValueError):
+        get_extractor("unknown")
+    pdf_path = __write_test_pdf__(tmp_path / "empty.pdf", [[]])
+    with pytest.raises(OSError):
+        get_extractor("pypdf").extract(pdf_path)
+
+
+def test_pypdf_extractor_stops_after_summary(tmp_path):
+    """
+    Test lazy extraction reads no pages past the DETAILED marker
+    """
+    pages = __test_pdf_pages__ + [["DETAILED USAGE"], ["DETAILED USAGE"]]
+    pdf_path = __write_test_pdf__(tmp_path / "bill.pdf", pages)
+    stats = {}
+    tmobile_ = TMobile(raw_data=get_extractor("pypdf").iter_lines(pdf_path, stats))
+    assert tmobile_.plan_total == 259.63
+    assert len(tmobile_.get_account_data_mapping()) == 3
+    assert stats.pop("seconds") > 0
+    assert stats == {"pages_read": 2, "total_pages": 4}
+
+
+def test_tmobile_from_iterator():
+    """
+    Test TMobile consumes an iterator only up to the DETAILED marker
+    """
+    lines = iter(__test_actual_data__)
+    tmobile_ = TMobile(raw_data=lines)
+    assert tmobile_.account_total == 317.53
+    assert tmobile_.positions == {"start": 6, "end": 19}
+    assert next(lines) == ""
+
+
+def test_bill_cache(tmp_path):
+    """
+    Test cached bills round trip and are keyed by pdf contents
+    """
+    pdf_path = __write_test_pdf__(tmp_path / "SummaryBillApr2020.pdf", [["a"]])
+    copy_path = tmp_path / "SummaryBillMay2020.pdf"
+    copy_path.write_bytes(open(pdf_path, "rb").read())
+    tmobile_ = TMobile(raw_data=__test_actual_data__)
+    bill = {
+        "positions": tmobile_.positions,
+        "titles": tmobile_.titles,
+        "plan_total": tmobile_.plan_total,
+        "account_total": tmobile_.account_total,
+        "account_to_data": tmobile_.get_account_data_mapping(),
+    }
+    cache = BillCache(cache_dir=str(tmp_path / "cache"), max_hashes=1)
+    assert cache.get(pdf_path) is None
+    assert cache.put(pdf_path, bill) == get_file_hash(pdf_path)
+    cached = cache.get(str(copy_path))
+    assert cached["path"] == str(copy_path)
+    assert cached["hash"] == get_file_hash(pdf_path)
+    assert list(cache._hashes) == [str(copy_path)]
+    assert cached["account_to_data"] == bill["account_to_data"]
+    assert cached["plan_total"] == 259.63
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.clear()
+    assert cache.get(pdf_path) is None
+    assert cache.get(str(tmp_path / "removed.pdf")) is None
+    assert cache.put(str(tmp_path / "removed.pdf"), bill) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_bill_cache_eviction(tmp_path):
+    """
+    Test least recently used bills are evicted beyond max_bytes
+    """
+    bill = {
+        "positions": {"start": 0, "end": 1},
+        "titles": ["Line"],
+        "plan_total": 1,
+        "account_total": 1,
+        "account_to_data": [{"Line": "1"}],
+    }
+    cache = BillCache(cache_dir=str(tmp_path / "cache"), max_bytes=1)
+    paths = []
+    for num in range(3):
+        paths.append(__write_test_pdf__(tmp_path / "{}.pdf".format(num), [[num]]))
+        cache.put(paths[-1], bill)
+    assert len(os.listdir(cache.cache_dir)) == 0
+    cache.max_bytes = 1024
+    for num, path in enumerate(paths):
+        cache.put(path, bill)
+        os.utime(cache._get_entry_file(cache.get_hash(path)), (num, num))
+    cache.get(paths[0])
+    entry_file = cache._get_entry_file(cache.get_hash(paths[0]))
+    cache.max_bytes = os.path.getsize(entry_file) * 2
+    cache.put(paths[2], bill)
+    assert cache.get(paths[0]) is not None
+    assert cache.get(paths[1]) is None
+
+
+def __get_stored_bill__(name, equipment_cents):
+    """
+    Function to get a computed bill of two lines as stored by BillStore
+    """
+    lines = []
+    for number, user, total in [
+        ("(123) 456-7890", "Abcd", 20 + equipment_cents / 100),
+        ("1234567980", "Efgh", 20.0),
+    ]:
+        line = namedtuple("Line", ["line", "user", "linetype", "charges"])(
+            number,
+            {"name": user},
+            "Voice",
+            LineCharges(equipment_cents=equipment_cents if user == "Abcd" else 0),
+        )
+        lines.append((line, "", total))
+    return {
+        "path": "/tmp/{}.pdf".format(name),
+        "months": {"current_month": name[-7:-4]},
+        "year": 2021,
+        "plan_total": 40,
+        "account_total": 60.5,
+        "charges": lines,
+        "total": sum(total for _, _, total in lines),
+    }
+
+
+def test_bill_store(tmp_path):
+    """
+    Test bills are stored once per pdf hash and queried by line and month
+    """
+    store = BillStore(db_file=str(tmp_path / "tmobile.db"))
+    for month, equipment_cents in [
+        ("Nov2019", 0),
+        ("Dec2019", 1000),
+        ("Jan2020", 1000),
+    ]:
+        bill = __get_stored_bill__("SummaryBill" + month, equipment_cents)
+        store.put(bill, bill_hash=month)
+    store.put(__get_stored_bill__("SummaryBillJan2020", 1500), bill_hash="Jan2020")
+    assert store.get_periods() == ["2019-11", "2019-12", "2020-01"]
+    assert store.connection.execute("SELECT COUNT(*) FROM lines").fetchone() == (6,)
+    assert store.get_totals_by_user(months=2) == [("Abcd", 2, 6500), ("Efgh", 2, 4000)]
+    assert store.get_line_history("123-456-7890")[-1] == (
+        "2020-01",
+        1500,
+        0,
+        0,
+        0,
+        2000,
+        3500,
+    )
+    assert store.get_equipment_changes() == [
+        ("1234567890", "Abcd", "2019-12", 0, 1000),
+        ("1234567890", "Abcd", "2020-01", 1000, 1500),
+    ]
+    plan = store.connection.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM lines WHERE line = ?", ("1234567890",)
+    ).fetchall()
+    assert "idx_lines_line" in str(plan)
+    store.close()
+
+
+def test_run_journal(tmp_path):
+    """
+    Test latest attempt of each line and channel is recorded per bill
+    """
+    journal = RunJournal(db_file=str(tmp_path / "tmobile.db"))
+    journal.record(
+        "hash",
+        [
+            ("1234567890", "email", "abcd@gmail.com", 2000, "SUCCESS", "id-1"),
+            ("1234567890", "venmo", "abcd", 2000, "FAILED", None),
+        ],
+    )
+    journal.record("hash", [("1234567890", "venmo", "abcd", 2000, "SUCCESS", None)])
+    sent = journal.load("hash")
+    assert len(sent) == 2 and journal.load("other") == {}
+    assert sent[("1234567890", "email")]["reference"] == "id-1"
+    assert is_dispatched(sent[("1234567890", "venmo")], "abcd", 2000)
+    assert not is_dispatched(sent[("1234567890", "email")], "abcd@gmail.com", 2001)
+    assert not is_dispatched(sent[("1234567890", "email")], "efgh@gmail.com", 2000)
+    assert not is_dispatched(None, "abcd", 2000)
+    journal.record("hash", [("1234567890", "venmo", "abcd", 2000, "FAILED", None)])
+    assert not is_dispatched(
+        journal.load("hash")[("1234567890", "venmo")], "abcd", 2000
+    )
+    journal.record("hash", [("1234567890", "venmo", "abcd", 2000, "UNKNOWN", None)])
+    assert is_dispatched(journal.load("hash")[("1234567890", "venmo")], "abcd", 2000)
+    journal.close()
+
+
+def test_checkpoint(tmp_path):
+    """
+    Test records are appended as they complete, fsync is batched and resume reads them
+    """
+    checkpoint_file = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = Checkpoint(checkpoint_file, sync_every=3, sync_interval=60)
+    with patch("tmobile.libs.lib_checkpoint.os.fsync") as fsync:
+        for num in range(7):
+            checkpoint.append(
+                "hash", (str(num), "email", "abcd@gmail.com", 100, "SUCCESS", "id")
+            )
+        assert fsync.call_count == 2
+        checkpoint.close()
+        assert fsync.call_count == 3
+    with open(checkpoint_file, "a") as partial:
+        partial.write('{"line": "7", "chan')
+    resumed = Checkpoint(checkpoint_file, resume=True)
+    sent = resumed.load("hash")
+    assert len(sent) == 7 and resumed.load("other") == {}
+    assert is_dispatched(sent[("6", "email")], "abcd@gmail.com", 100)
+    resumed.append("hash", ("7", "email", "abcd@gmail.com", 100, "SUCCESS", "id"))
+    resumed.close()
+    assert len(Checkpoint(checkpoint_file, resume=True).load("hash")) == 8
+
+
+__venmo_users__ = {
+    "(123)456-7890": {
+        "venmo_username": "abcd",
+        "additional_note": "",
+        "additional_amount": 0,
+    },
+    "(123)456-7980": {
+        "venmo_username": "efgh",
+        "additional_note": "",
+        "additional_amount": 0,
+    },
+}
+
+
+@pytest.fixture(name="venmo_files")
+def fixture_venmo_files(tmp_path):
+    """
+    Fixture to create venmo.json and the path to its user id cache
+    """
+    venmo_file = tmp_path / "venmo.json"
+    venmo_file.write_text(json.dumps({"users": __venmo_users__, "token": "token"}))
+    return str(venmo_file), str(tmp_path / "venmo_ids.json")
+
+
+@patch("venmo_api.Client")
+def test_venmo_user_id_cache(client, venmo_files):
+    """
+    Test Venmo user ids are searched once and reused across sessions
+    """
+    user = namedtuple("User", ["id"])
+    client.return_value.user.search_for_users.side_effect = lambda query: [
+        user(id="id-" + query)
+    ]
+    venmo_ = Venmo(venmo_file=venmo_files[0], id_cache_file=venmo_files[1])
+    assert venmo_.warm_up() == []
+    assert client.return_value.user.search_for_users.call_count == 2
+    venmo_ = Venmo(venmo_file=venmo_files[0], id_cache_file=venmo_files[1])
+    details = venmo_.get_line_details("(123)\xa0456-7980")
+    assert venmo_.get_user_id(details["venmo_username"]) == "id-efgh"
+    assert client.return_value.user.search_for_users.call_count == 2
+    venmo_ = Venmo(
+        venmo_file=venmo_files[0], id_cache_file=venmo_files[1], id_cache_ttl=0
+    )
+    assert venmo_.get_user_id("abcd") == "id-abcd"
+    assert client.return_value.user.search_for_users.call_count == 3
+
+
+@patch("venmo_api.Client")
+def test_venmo_user_not_found(client, venmo_files):
+    """
+    Test unknown lines and Venmo user-names
+    """
+    client.return_value.user.search_for_users.return_value = []
+    venmo_ = Venmo(venmo_file=venmo_files[0], id_cache_file=venmo_files[1])
+    assert not client.called
+    assert venmo_.warm_up() == ["abcd", "efgh"]
+    assert client.call_count == 1
+    with pytest.raises(UserNotFound):
+        venmo_.get_line_details("(000)000-0000")
+    assert not os.path.exists(venmo_files[1])
+
+
+class __StubVenmoClient__:
+    """
+    Local stub of venmo_api.Client user and payment APIs
+    """
+
+    def __init__(self, access_token, failures=0, delay=0.05, error=None):
+        self.user = self
+        self.payment = self
+        self.access_token = access_token
+        self.failures = failures
+        self.delay = delay
+        self.error = error or requests.exceptions.ConnectTimeout("connect timeout")
+        self.calls = 0
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def search_for_users(self, query):
+        user = namedtuple("User", ["id"])
+        return [user(id="id-" + query)] if query != "unknown" else []
+
+    def request_money(self, amount, note, target_user_id):
+        time.sleep(self.delay)
+        with self._lock:
+            self.calls += 1
+            if self.failures > 0:
+                self.failures -= 1
+                raise self.error
+            self.requests.append((amount, note, target_user_id))
+        return True
+
+
+def test_venmo_request_one(venmo_files):
+    """
+    Test venmo requests are sent concurrently from many threads and transient errors
+    are retried
+    """
+    stub = __StubVenmoClient__("token", failures=2)
+    venmo_ = Venmo(
+        venmo_file=venmo_files[0],
+        id_cache_file=venmo_files[1],
+        workers=8,
+        rate=1000,
+        backoff=0.01,
+        client=stub,
+    )
+    venmo_requests = [
+        {"note": "T-Mobile", "user_name": "user{}".format(num), "amount": 10}
+        for num in range(8)
+    ]
+    venmo_requests += [
+        {"note": "T-Mobile", "user_name": "unknown", "amount": 10},
+        {
+            "note": "T-Mobile",
+            "user_name": "abcd",
+            "amount": 10,
+            "addtional_amount": -10,
+        },
+    ]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(venmo_.request_one, venmo_requests))
+    assert time.perf_counter() - started < 8 * stub.delay
+    assert [result["status"] for result in results] == ["SUCCESS"] * 8 + [
+        "FAILED",
+        "SKIPPED",
+    ]
+    assert isinstance(results[8]["error"], UserNotFound)
+    assert all(result["latency"] >= stub.delay for result in results[:8])
+    assert sorted(request[2] for request in stub.requests) == [
+        "id-user{}".format(num) for num in range(8)
+    ]
+
+
+def test_venmo_request_retries_exhausted(venmo_files):
+    """
+    Test requests fail once all retries of transient errors are used up
+    """
+    stub = __StubVenmoClient__("token", failures=10, delay=0)
+    venmo_ = Venmo(
+        venmo_file=venmo_files[0],
+        id_cache_file=venmo_files[1],
+        retries=2,
+        backoff=0,
+        client=stub,
+    )
+    result = venmo_.request_one({"note": "", "user_name": "abcd", "amount": 1})
+    assert result["status"] == "FAILED"
+    assert isinstance(result["error"], requests.exceptions.ConnectionError)
+    assert stub.failures == 7
+
+
+def test_venmo_request_not_repeated(venmo_files):
+    """
+    Test money requests are not sent again once they may have reached Venmo, and are
+    reported as UNKNOWN
+    """
+    stub = __StubVenmoClient__(
+        "token", failures=1, delay=0, error=requests.exceptions.ReadTimeout("read")
+    )
+    venmo_ = Venmo(
+        venmo_file=venmo_files[0],
+        id_cache_file=venmo_files[1],
+        backoff=0,
+        client=stub,
+    )
+    result = venmo_.request_one({"note": "", "user_name": "abcd", "amount": 1})
+    assert result["status"] == "UNKNOWN"
+    assert isinstance(result["error"], requests.exceptions.ReadTimeout)
+    assert stub.calls == 1
+    assert stub.requests == []
+
+
+def __get_http_code_error__(status_code):
+    """
+    Get the venmo_api error raised for a response with given status code
+    """
+    response = requests.models.Response()
+    response.status_code = status_code
+    response.reason = "Reason"
+    response._content = b"{}"
+    return HttpCodeError(response=response)
+
+
+@pytest.mark.parametrize(
+    ("err", "read", "write", "unknown"),
+    [
+        (__get_http_code_error__(429), True, True, False),
+        (__get_http_code_error__(503), True, False, True),
+        (__get_http_code_error__(404), False, False, False),
+        (requests.exceptions.ConnectTimeout("connect"), True, True, False),
+        (
+            requests.exceptions.ConnectionError(
+                MaxRetryError(None, "/", NewConnectionError(None, "refused"))
+            ),
+            True,
+            True,
+            False,
+        ),
+        (requests.exceptions.ConnectionError("connection reset"), True, False, True),
+        (requests.exceptions.ReadTimeout("read"), True, False, True),
+    ],
+)
+def test_venmo_is_retryable(err, read, write, unknown):
+    """
+    Test only reads are retried after the request may have reached Venmo, and only
+    then is the outcome of a money request unknown
+    """
+    assert is_retryable(err) is read
+    assert is_retryable(err, idempotent=False) is write
+    assert is_outcome_unknown(err) is unknown
+
+
+class __FakeGmailRequest__:
+    """
+    Fake of a googleapiclient HttpRequest for users().messages().send()
+    """
+
+    def __init__(self, service, body):
+        self.service = service
+        self.body = body
+
+    def execute(self, http=None):
+        self.service.https.add(http)
+        self.service.executed.append(self.body["raw"])
+        if self.body["raw"] in self.service.failing:
+            raise HttpError(httplib2.Response({"status": 500}), b"backend error")
+        return {"id": "id-" + self.body["raw"]}
+
+
+class __FakeGmailBatch__:
+    """
+    Fake of a googleapiclient BatchHttpRequest
+    """
+
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self, http=None):
+        self.service.batches.append(len(self.requests))
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request.execute(http=http), None)
+            except HttpError as err:
+                self.callback(request_id, None, err)
+
+
+class __FakeGmailService__:
+    """
+    Fake of the gmail v1 discovery service to send emails offline
+    """
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.executed = []
+        self.batches = []
+        self.https = set()
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def send(self, userId, body):
+        assert userId == "me"
+        return __FakeGmailRequest__(self, body)
+
+
+class __FakeGmailBatchService__(__FakeGmailService__):
+    """
+    Fake of the gmail v1 discovery service supporting batch requests
+    """
+
+    def new_batch_http_request(self, callback):
+        return __FakeGmailBatch__(self, callback)
+
+
+@pytest.mark.parametrize(
+    ("service_class", "batches"),
+    [(__FakeGmailBatchService__, [50, 50, 20]), (__FakeGmailService__, [])],
+)
+def test_email_send_messages(service_class, batches):
+    """
+    Test emails are sent in batches, or on worker threads without batch support
+    """
+    service = service_class(failing=("msg7", "msg64"))
+    email_cli = EmailClient(service=service)
+    messages = [{"raw": "msg{}".format(num)} for num in range(120)]
+    completed = {}
+    with patch.object(
+        email_cli,
+        "_get_thread_http",
+        side_effect=lambda: {"http": threading.current_thread().name},
+    ):
+        results = email_cli.send_messages(
+            messages,
+            on_result=lambda index, result: completed.setdefault(index, result),
+        )
+    assert completed == dict(enumerate(results))
+    assert service.batches == batches
+    assert None not in service.https
+    assert sorted(service.executed) == sorted(message["raw"] for message in messages)
+    assert [result["id"] for result in results[:3]] == ["id-msg0", "id-msg1", "id-msg2"]
+    failed = [num for num, result in enumerate(results) if result["error"]]
+    assert failed == [7, 64]
+    assert isinstance(results[7]["error"], EmailFailure)
+    assert results[7]["id"] is None
+    assert all(result["latency"] >= 0 for result in results)
+
+
+def test_email_client_is_lazy(tmp_path, monkeypatch):
+    """
+    Test EmailClient does no OAuth or discovery work until an email is sent
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "configs").mkdir()
+    with patch("tmobile.libs.lib_email.EmailClient._get_creds") as creds, patch(
+        "googleapiclient.discovery.build_from_document",
+        return_value=__FakeGmailBatchService__(),
+    ) as build:
+        email_cli = EmailClient()
+        assert not creds.called
+        assert not build.called
+        results = email_cli.send_messages([{"raw": "msg"}])
+        assert creds.call_count == 1
+        assert build.call_count == 1
+    assert results[0]["id"] == "id-msg"
+    assert (tmp_path / "configs" / "gmail_discovery.json").exists()
+
+
+@pytest.mark.parametrize(
+    ("status", "content", "error"),
+    [
+        (503, b"Service Unavailable", HttpError),
+        (200, b"<html>captive portal</html>", InvalidJsonError),
+        (200, b"[]", InvalidJsonError),
+    ],
+)
+def test_discovery_document_not_cached_on_error(
+    tmp_path, monkeypatch, status, content, error
+):
+    """
+    Test a failed or invalid discovery document download raises and is not cached
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "configs").mkdir()
+    with patch("googleapiclient.discovery_cache.get_static_doc", return_value=None):
+        with patch(
+            "httplib2.Http.request",
+            return_value=(httplib2.Response({"status": status}), content),
+        ):
+            with pytest.raises(error):
+                EmailClient()._get_discovery_document()
+        assert not (tmp_path / "configs" / "gmail_discovery.json").exists()
+        with patch(
+            "httplib2.Http.request",
+            return_value=(httplib2.Response({"status": 200}), b'{"name": "gmail"}'),
+        ):
+            assert EmailClient()._get_discovery_document() == '{"name": "gmail"}'
+    assert (tmp_path / "configs" / "gmail_discovery.json").exists()
+
+
+def test_email_client_built_once(tmp_path, monkeypatch):
+    """
+    Test the Gmail service is built once when several threads use it first together
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "configs").mkdir()
+
+    def __slow_creds__():
+        time.sleep(0.05)
+
+    with patch(
+        "tmobile.libs.lib_email.EmailClient._get_creds", side_effect=__slow_creds__
+    ) as creds, patch(
+        "googleapiclient.discovery.build_from_document",
+        return_value=__FakeGmailBatchService__(),
+    ) as build:
+        email_cli = EmailClient()
+        threads = [threading.Thread(target=lambda: email_cli.service) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert creds.call_count == 1
+    assert build.call_count == 1
+
+
+def __get_test_creds__(expires_in):
+    """
+    Get OAuth credentials for the gmail API expiring in given timedelta
+    """
+    return Credentials(
+        token="token",
+        refresh_token="refresh",
+        client_id="client",
+        client_secret="secret",
+        token_uri="https://oauth2.googleapis.com/token",
+        scopes=SCOPES,
+        expiry=datetime.now(timezone.utc).replace(tzinfo=None) + expires_in,
+    )
+
+
+@pytest.mark.parametrize(
+    ("expires_in", "refreshed"),
+    [(timedelta(hours=1), False), (timedelta(minutes=2), True)],
+)
+def test_email_client_creds(tmp_path, monkeypatch, expires_in, refreshed):
+    """
+    Test stored credentials are refreshed only when they are about to expire
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "configs").mkdir()
+    (tmp_path / "configs" / "token.json").write_text(
+        __get_test_creds__(expires_in).to_json()
+    )
+
+    def __refresh__(creds, request):
+        creds.token = "new-token"
+        creds.expiry = __get_test_creds__(timedelta(hours=1)).expiry
+
+    with patch.object(Credentials, "refresh", autospec=True) as refresh:
+        refresh.side_effect = __refresh__
+        creds = EmailClient()._get_creds()
+    assert refresh.called == refreshed
+    assert creds.token == ("new-token" if refreshed else "token")
+    stored = json.loads((tmp_path / "configs" / "token.json").read_text())
+    assert stored["token"] == creds.token
+
+
+def test_email_client_migrates_pickled_creds(tmp_path, monkeypatch):
+    """
+    Test pickled credentials of older versions are migrated to token.json
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "configs").mkdir()
+    with open(tmp_path / "configs" / "token.pickle", "wb") as token:
+        pickle.dump(__get_test_creds__(timedelta(hours=1)), token)
+    assert EmailClient()._get_creds().token == "token"
+    assert (tmp_path / "configs" / "token.json").exists()
+
+
+def test_layout_tokenize():
+    """
+    Test rows are split by the layout of their header, whatever the line status
+    """
+    layout = get_layout(("Line", "Type", "Plans", "Equipment", "Services", "Total"))
+    assert layout.name == "summary-without-one-time"
+    assert layout.tokenize("(123)\xa0456-7890 Voice $4.29 - - $4.29") == (
+        ("(123)456-7890", "Voice", "$4.29", "-", "-", "$4.29"),
+        None,
+    )
+    assert layout.tokenize(
+        "(123) 456-7890 - Transferred to T-Mobile Wearable $10 $1,024.50 - -$5.00"
+    ) == (
+        ("(123)456-7890", "Wearable", "$10", "$1,024.50", "-", "-$5.00"),
+        "Transferred to T-Mobile",
+    )
+    assert layout.tokenize("(123)\xa0456-7890 - Suspended Voice - - - -")[1] == (
+        "Suspended"
+    )
+    assert layout.tokenize("(123) 456-7890 Mobile Internet $10 - - $10") == (
+        ("(123)456-7890", "Mobile Internet", "$10", "-", "-", "$10"),
+        None,
+    )
+    assert layout.tokenize("(123)\xa0456-7890 - New Mobile Internet $10 - - $10") == (
+        ("(123)456-7890", "Mobile Internet", "$10", "-", "-", "$10"),
+        "New",
+    )
+    assert layout.tokenize("(123)\xa0456-7890 - Mobile Internet $10 - - $10") == (
+        ("(123)456-7890", "Mobile Internet", "$10", "-", "-", "$10"),
+        None,
+    )
+    assert layout.tokenize("Account $120.57 - - $120.57") is None
+    assert layout.tokenize("(123)\xa0456-7890 Voice $4.29 - -") is None
+    assert layout.tokenize("(123)\xa0456-7890") is None
+
+
+def test_layout_registry(monkeypatch):
+    """
+    Test headers without a registered layout fail as unparsable bills, and layouts need
+    Line and other titles
+    """
+    monkeypatch.setattr(lib_tmobile, "__layouts__", dict(lib_tmobile.__layouts__))
+    titles = ("Line", "Type", "Plans", "Discounts", "Total")
+    data_ = list(__test_actual_data__)
+    data_[7] = " ".join(titles)
+    data_[15] = "(123)\xa0456-7980 - Paused Voice $4.29 -$1.00 $3.29"
+    with pytest.raises(OSError, match="unknown summary header"):
+        get_layout(titles)
+    with pytest.raises(OSError):
+        parse_bill(data_)
+    assert len(lib_tmobile.__layouts__) == 2
+    custom = register_layout("discounts", titles)
+    assert isinstance(custom, LayoutProfile)
+    assert get_layout(titles) is custom
+    assert parse_bill(data_).rows[1] == (
+        "(123)456-7980",
+        "Voice",
+        "$4.29",
+        "-$1.00",
+        "$3.29",
+    )
+    with pytest.raises(OSError):
+        register_layout("invalid", ("Type", "Total"))
+
+
+def test_parse_bill_unknown_layout():
+    """
+    Test bills whose summary header is not a layout of lines fail as unparsable bills
+    """
+    data_ = list(__test_actual_data__)
+    data_[7] = "Phone Type Plans Total"
+    with pytest.raises(OSError, match="unknown summary header=Phone Type Plans Total"):
+        parse_bill(data_)
+    with pytest.raises(OSError):
+        TMobile(raw_data=data_)
+
+
+def test_parse_bill():
+    """
+    Test single-pass parsing into an immutable ParsedBill
+    """
+    data_ = list(__test_actual_data__)
+    data_[7] = "Line Type Plans Equipment Services One-time charges Total"
+    data_[13] = "(123)\xa0456-7890 - New Mobile Internet $10.00 - - - $10.00"
+    data_[15] = "(123)\xa0456-7980 - Removed Voice $4.29 - $16.37 - $20.66"
+    bill = parse_bill(iter(data_))
+    assert isinstance(bill, ParsedBill)
+    assert bill.titles == (
+        "Line",
+        "Type",
+        "Plans",
+        "Equipment",
+        "Services",
+        "One-time",
+        "Total",
+    )
+    assert (bill.plan_total, bill.account_total) == (259.63, 317.53)
+    assert bill.rows[0] == (
+        "(123)456-7890",
+        "Mobile Internet",
+        "$10.00",
+        "-",
+        "-",
+        "-",
+        "$10.00",
+    )
+    assert bill.rows[1] == ("(123)456-8970", "Voice", "$4.29", "-", "-", "$4.29")
+    assert len(bill.get_account_data_mapping()) == 2
+    with pytest.raises(AttributeError):
+        bill.plan_total = 0
+
+
+def test_folder_watcher_settles(tmp_path):
+    """
+    Test bills are reported once unchanged for settle seconds, and again once rewritten
+    """
+    watcher = FolderWatcher(str(tmp_path), settle=2.0, use_inotify=False)
+    bill = tmp_path / "SummaryBillApr2020.pdf"
+    bill.write_bytes(b"%PDF-partial")
+    (tmp_path / "notes.pdf").write_bytes(b"%PDF")
+    assert watcher.scan(now=0.0) == []
+    bill.write_bytes(b"%PDF-partial, still copying")
+    assert watcher.scan(now=1.5) == []
+    assert watcher.scan(now=3.0) == []
+    assert watcher.scan(now=3.5) == [str(bill)]
+    assert watcher.scan(now=10.0) == []
+    bill.write_bytes(b"%PDF-rewritten with new charges")
+    assert watcher.scan(now=11.0) == []
+    assert watcher.scan(now=13.0) == [str(bill)]
+    bill.unlink()
+    assert watcher.scan(now=14.0) == []
+    assert watcher.mode == "polling"
+
+
+def test_folder_watcher_existing_bills(tmp_path):
+    """
+    Test bills already in the folder are not reported after a restart, unless asked
+    """
+    bill = tmp_path / "SummaryBillApr2020.pdf"
+    bill.write_bytes(b"%PDF-dispatched before the restart")
+    watcher = FolderWatcher(str(tmp_path), settle=0.0, use_inotify=False)
+    assert watcher.scan(now=0.0) == []
+    assert watcher.scan(now=1.0) == []
+    bill.write_bytes(b"%PDF-rewritten after the restart")
+    assert watcher.scan(now=2.0) == []
+    assert watcher.scan(now=3.0) == [str(bill)]
+    watcher = FolderWatcher(
+        str(tmp_path), settle=0.0, use_inotify=False, report_existing=True
+    )
+    assert watcher.scan(now=0.0) == []
+    assert watcher.scan(now=1.0) == [str(bill)]
+
+
+def test_folder_watcher_inotify(tmp_path):
+    """
+    Test the watcher wakes on a new bill without waiting for the poll interval
+    """
+    watcher = FolderWatcher(str(tmp_path), settle=0.0, interval=30.0)
+    if watcher.mode != "inotify":
+        pytest.skip("inotify is not available")
+    stop = threading.Event()
+    found = []
+
+    def watch():
+        for path in watcher.watch(stop):
+            found.append(path)
+            stop.set()
+
+    thread = threading.Thread(target=watch)
+    thread.start()
+    time.sleep(0.2)
+    started = time.monotonic()
+    (tmp_path / "SummaryBillApr2020.pdf").write_bytes(b"%PDF")
+    thread.join(timeout=10)
+    watcher.close()
+    assert found == [str(tmp_path / "SummaryBillApr2020.pdf")]
+    assert time.monotonic() - started < 10
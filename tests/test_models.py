@@ -3,14 +3,16 @@
 This is pytest file to perform unit tests associated with models library.
 For each function in models library we have a test with all possible input/output combinations
 """
+
 import json
 import pytest
 from mock import patch, Mock
 from tmobile.models.account import Account
+from tmobile.models.charges import LineCharges
 from tmobile.models.line import Line
+from tmobile.models.user_directory import UserDirectory
 from tmobile.utilities.utils import UserNotFound
 
-
 __all_line_props__ = [
     {
         "prop": {
@@ -56,45 +58,34 @@ def test_create_line_object_error_case():
         Line(prop=__all_line_props__[0], user_info_file="non_existant_file.json")
 
 
-@patch("tmobile.models.line.Line.get_user")
-def test_create_line_object_missing_user_name(user):
-    """
-    Test UserNotFound for missing user_name
-    """
-    mock_data = Mock()
-    mock_data = {"email": "abcd@gmail.com"}
-    user.return_value = mock_data
-    with pytest.raises(UserNotFound):
-        Line(prop=__all_line_props__[0]["prop"], user_info_file=__test_info_file__)
-
-
-@patch("tmobile.models.line.Line.get_user")
-def test_create_line_object_missing_user_email(_user):
+@pytest.mark.parametrize(
+    ("user", "error"),
+    [
+        ({"email": "abcd@gmail.com"}, UserNotFound),
+        ({"name": "Abcd"}, UserNotFound),
+        ({"name": "Abcd", "email": "abcd@"}, ValueError),
+    ],
+)
+def test_create_line_object_invalid_user(tmp_path, user, error):
     """
-    Test UserNotFound for missing email
+    Test lines are not created for users with a missing name or email, or an
+    incorrect email
     """
-    mock_data = Mock()
-    mock_data = {"user": "abcd"}
-    _user.return_value = mock_data
-    with pytest.raises(UserNotFound):
-        Line(prop=__all_line_props__[0]["prop"], user_info_file=__test_info_file__)
+    users_file = tmp_path / "users.json"
+    users_file.write_text(json.dumps({"123456789": user}))
+    with pytest.raises(error):
+        Line(prop=__all_line_props__[0]["prop"], user_info_file=str(users_file))
 
 
-@patch("tmobile.models.line.Line.get_user")
-def test_create_line_object_incorrect_user_email(user):
+def test_create_line_object_empty_directory(tmp_path):
     """
-    Test UserNotFound for incorrect user_email
+    Test an injected directory is used even if it has no users
     """
-    mock_data = Mock()
-    mock_data = {"user": "abcd", "email": "abcd@"}
-    user.return_value = mock_data
+    users_file = tmp_path / "users.json"
+    users_file.write_text(json.dumps({}))
+    directory = UserDirectory(user_info_file=str(users_file))
     with pytest.raises(UserNotFound):
-        Line(prop=__all_line_props__[0]["prop"], user_info_file=__test_info_file__)
-
-    user.side_effect = {"user": "abcd", "email": "@gmail.com"}
-
-    with pytest.raises(UserNotFound):
-        Line(prop=__all_line_props__[0]["prop"], user_info_file=__test_info_file__)
+        Line(prop=__all_line_props__[0]["prop"], directory=directory)
 
 
 @pytest.mark.parametrize(("prop_"), [x["prop"] for x in __all_line_props__])
@@ -124,3 +115,102 @@ def test_all_account():
     assert account_.get_basic_charge() == 25
     assert account_.no_of_lines == 2
     assert account_.tax_total == 8.86
+    assert account_.get_basic_shares() == [2500, 2500]
+    assert account_.get_line_totals() == [5000, 2500]
+
+
+@pytest.mark.parametrize(("account_total"), [259.63, 0.01, 100, 33.33])
+def test_account_basic_shares_add_up(account_total):
+    """
+    Test basic shares of lines add up to the account total to the cent
+    """
+    lines_ = [Mock(charges=LineCharges()) for _ in range(7)]
+    account_ = Account(all_lines=lines_, account_total=account_total)
+    shares = account_.get_basic_shares()
+    assert sum(shares) == round(account_total * 100)
+    assert max(shares) - min(shares) <= 1
+    assert shares == sorted(shares, reverse=True)
+
+
+def test_line_charges():
+    """
+    Test charges of a line are parsed once into exact cents
+    """
+    charges = LineCharges.from_prop(
+        {
+            "Equipment": "$10.10",
+            "Services": "-",
+            "Plans": "$24.43",
+            "One-time": "$0.20",
+        }
+    )
+    assert charges.equipment_cents == 1010
+    assert charges.services_cents == 0
+    assert charges.one_time_cents == 20
+    assert charges.tax_cents == 443
+    assert charges.own_charges_cents == 1030
+    assert LineCharges(plans_cents=1500).tax_cents == 1500
+    assert not hasattr(charges, "__dict__")
+    with pytest.raises(ValueError):
+        LineCharges.from_prop({"Equipment": "abc", "Services": "-", "Plans": "-"})
+
+
+def test_user_directory_loaded_once():
+    """
+    Test users.json is parsed once for all lines sharing a directory
+    """
+    with patch(
+        "tmobile.models.user_directory.parse_json_data", return_value=__test_data__
+    ) as parse:
+        directory = UserDirectory(user_info_file=__test_info_file__)
+        lines_ = [
+            Line(prop=x["prop"], directory=directory) for x in __all_line_props__ * 5
+        ]
+    assert parse.call_count == 1
+    assert len(directory) == 2
+    assert lines_[-1].user["name"] == "Efgh"
+
+
+@pytest.mark.parametrize(("number"), ["(123)456-789", "123 456 789", "123456789"])
+def test_user_directory_phone_formats(number):
+    """
+    Test lines are looked up in any phone number format
+    """
+    directory = UserDirectory.for_file(__test_info_file__)
+    assert UserDirectory.for_file(__test_info_file__) is directory
+    assert directory.get_user(number)["name"] == "Abcd"
+    with pytest.raises(UserNotFound):
+        directory.get_user("(000)000-0000")
+
+
+def test_user_directory_reloads_on_change(tmp_path):
+    """
+    Test the directory is reloaded when users.json changes
+    """
+    users_file = tmp_path / "users.json"
+    users_file.write_text(json.dumps(__test_data__))
+    directory = UserDirectory.for_file(str(users_file))
+    users_file.write_text(
+        json.dumps({"(345)678-9012": {"name": "Ijkl", "email": "ijkl@gmail.com"}})
+    )
+    assert UserDirectory.for_file(str(users_file)) is directory
+    assert directory.get_user("3456789012")["name"] == "Ijkl"
+    assert len(directory) == 1
+
+
+@pytest.mark.parametrize(
+    ("user", "error"),
+    [
+        ({"email": "abcd@gmail.com"}, UserNotFound),
+        ({"name": "Abcd"}, UserNotFound),
+        ({"name": "Abcd", "email": "abcd@"}, ValueError),
+    ],
+)
+def test_user_directory_validation(tmp_path, user, error):
+    """
+    Test every user is validated when users.json is loaded
+    """
+    users_file = tmp_path / "users.json"
+    users_file.write_text(json.dumps(dict(__test_data__, **{"345678901": user})))
+    with pytest.raises(error):
+        UserDirectory(user_info_file=str(users_file))
@@ -0,0 +1,626 @@
+#!/usr/bin/python3
+"""
+This is pytest file to perform unit tests associated with src application.
+For each helper in src application we have a test with all possible input/output combinations
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+import pytest
+from tmobile.libs.lib_checkpoint import Checkpoint
+from tmobile.libs.lib_export import FIELDS, ParquetExporter, open_exporter
+from tmobile.libs.lib_journal import RunJournal
+from tmobile.libs.lib_watch import FolderWatcher
+from tmobile.src.daemon import BillServer, BillService, __watch_folder__
+from tmobile.src.main import (
+    __compute_bill__,
+    __compute_bills__,
+    __dispatch_bill__,
+    __dispatch_bills__,
+    __extract_bills__,
+    __get_bill_paths__,
+    __process_bills__,
+    __write_report__,
+)
+from tmobile.tests.test_libs import __test_pdf_pages__, __write_test_pdf__
+
+__test_info_file__ = "configs/users.json"
+
+__test_bill__ = {
+    "path": "/tmp/SummaryBillApr2020.pdf",
+    "plan_total": 60.0,
+    "account_to_data": [
+        {
+            "Line": "123456789",
+            "Type": "Voice",
+            "Plans": "$24.43",
+            "Equipment": "$10",
+            "Services": "-",
+        },
+        {
+            "Line": "234567891",
+            "Type": "Voice",
+            "Plans": "$24.43",
+            "Equipment": "-",
+            "Services": "$5",
+        },
+    ],
+}
+
+
+@pytest.fixture(name="users_file")
+def fixture_users_file(tmp_path, monkeypatch):
+    """
+    Fixture to create configs/users.json relative to a temporary working directory
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "configs").mkdir()
+    users = {
+        "123456789": {"name": "Abcd", "email": "abcd@gmail.com"},
+        "234567891": {"name": "Efgh", "email": "efgh@gmail.com"},
+    }
+    (tmp_path / __test_info_file__).write_text(json.dumps(users))
+    return tmp_path / __test_info_file__
+
+
+def test_get_bill_paths(tmp_path):
+    """
+    Test batch bill discovery for directories and glob patterns
+    """
+    for name in ["SummaryBillMay2020.pdf", "SummaryBillApr2020.pdf", "notes.txt"]:
+        (tmp_path / name).write_text("")
+    paths = __get_bill_paths__(str(tmp_path))
+    assert [p.split("/")[-1] for p in paths] == [
+        "SummaryBillApr2020.pdf",
+        "SummaryBillMay2020.pdf",
+    ]
+    assert len(__get_bill_paths__(str(tmp_path / "*May*.pdf"))) == 1
+    with pytest.raises(FileNotFoundError):
+        __get_bill_paths__(str(tmp_path / "*Jun*.pdf"))
+
+
+__baseline_statement__ = """\
++------------------+-----------+
+| User             | Abcd      |
++------------------+-----------+
+| Line             | 123456789 |
++------------------+-----------+
+| Type             | Voice     |
++------------------+-----------+
+| Equipment        | 10.0      |
++------------------+-----------+
+| Services         | 0         |
++------------------+-----------+
+| One-time         | 0         |
++------------------+-----------+
+| Basic (incl Tax) | 30.0      |
++------------------+-----------+
+| Total            | $40.0     |
++------------------+-----------+"""
+
+
+def test_compute_bill_and_report(users_file, tmp_path):
+    """
+    Test computation of per-line charges and the combined batch report
+    """
+    assert users_file.exists()
+    bill = __compute_bill__(__test_bill__)
+    assert bill["subject"] == "T-Mobile(Apr 2020)"
+    assert bill["year"] == 2020
+    december = __compute_bill__(dict(__test_bill__, path="/tmp/SummaryBillDec2015.pdf"))
+    assert december["subject"] == "T-Mobile(Dec 2015)"
+    assert [charge[2] for charge in bill["charges"]] == [40.0, 35.0]
+    assert bill["charges"][0][1] == __baseline_statement__
+    assert bill["total"] == 75.0
+    report_file = tmp_path / "report.txt"
+    __write_report__(bills=[bill, bill], report_file=str(report_file))
+    report = report_file.read_text()
+    assert report.count("TOTAL AMOUNT: 75.0") == 2
+    assert "GRAND TOTAL: 150.0" in report
+    html_bill = __compute_bill__(__test_bill__, statement="html")
+    assert [charge[2] for charge in html_bill["charges"]] == [40.0, 35.0]
+    assert html_bill["charges"][0][1].startswith("<table>")
+
+
+class __FakeEmailClient__:
+    """
+    Email client recording the address of each email sent, failing for given addresses
+    """
+
+    def __init__(self, failing=(), crash_after=None):
+        self.failing = failing
+        self.crash_after = crash_after
+        self.sent = []
+        self.creds = self.service = object()
+
+    def send_messages(self, messages, on_result=None):
+        results = []
+        for index, message in enumerate(messages):
+            if index == self.crash_after:
+                raise KeyboardInterrupt("crashed")
+            to_email = message["to"]
+            self.sent.append(to_email)
+            failed = to_email in self.failing
+            results.append(
+                {
+                    "id": None if failed else "id-" + to_email,
+                    "error": Exception("failed") if failed else None,
+                    "latency": 0,
+                }
+            )
+            on_result(index, results[-1])
+        return results
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_compute_bills_exports_lines(users_file, tmp_path, fmt):
+    """
+    Test each line of every computed bill is exported as the bill is computed
+    """
+    parsed_bills = []
+    for name in ["SummaryBillApr2020.pdf", "SummaryBillMay2020.pdf"]:
+        (tmp_path / name).write_bytes(name.encode())
+        parsed_bills.append(
+            (str(tmp_path / name), dict(__test_bill__, path=str(tmp_path / name)))
+        )
+    with open_exporter(str(tmp_path / "lines.out"), fmt=fmt) as exporter:
+        bills = __compute_bills__(parsed_bills, None, {}, exporter=exporter)
+        next(bills)
+        assert exporter.rows == 2
+        assert list(bills)
+    assert exporter.rows == 4
+    content = (tmp_path / "lines.out").read_text().splitlines()
+    if fmt == "csv":
+        assert content[0] == ",".join(FIELDS)
+        assert content[1] == "2020-04,Abcd,123456789,Voice,1000,0,0,3000,4000"
+        assert content[4].startswith("2020-05,Efgh,234567891,Voice,0,500,0,")
+    else:
+        rows = [json.loads(row) for row in content]
+        assert rows[0] == dict(
+            zip(
+                FIELDS,
+                ["2020-04", "Abcd", "123456789", "Voice", 1000, 0, 0, 3000, 4000],
+            )
+        )
+        assert sum(row["total_cents"] for row in rows) == 15000
+    with pytest.raises(ValueError):
+        open_exporter(str(tmp_path / "lines.xlsx"))
+
+
+def test_parquet_export(users_file, tmp_path):
+    """
+    Test parquet exports are written in row groups
+    """
+    parquet = pytest.importorskip("pyarrow.parquet")
+    bill = __compute_bill__(__test_bill__)
+    with ParquetExporter(str(tmp_path / "lines.parquet"), row_group_size=3) as exporter:
+        for _ in range(4):
+            exporter.write_bill(bill)
+    parquet_file = parquet.ParquetFile(str(tmp_path / "lines.parquet"))
+    assert parquet_file.metadata.num_rows == 8
+    assert parquet_file.metadata.num_row_groups == 3
+    assert parquet_file.schema_arrow.names == list(FIELDS)
+
+
+def test_export_closed_on_failure(users_file, tmp_path, monkeypatch):
+    """
+    Test bills exported before a failure of the run are written to a readable file
+    """
+    parquet = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "SummaryBillApr2020.pdf"
+    path.write_bytes(b"pdf")
+    monkeypatch.setattr(
+        "tmobile.src.main.__load_bills__",
+        lambda *_: ([str(path)], [(str(path), dict(__test_bill__, path=str(path)))]),
+    )
+
+    def __crash__(bills, **_):
+        next(bills)
+        raise KeyboardInterrupt("crashed")
+
+    monkeypatch.setattr("tmobile.src.main.__dispatch_bills__", __crash__)
+    cli_args = argparse.Namespace(
+        batch=None,
+        export=str(tmp_path / "lines.parquet"),
+        export_format=None,
+        queue_size=1,
+    )
+    args = {"test": True, "email": False, "venmo": False}
+    with pytest.raises(KeyboardInterrupt):
+        __process_bills__(cli_args, args, None, None, None, None)
+    assert parquet.ParquetFile(cli_args.export).metadata.num_rows == 2
+
+
+def test_dispatch_bill_sends_only_changes(users_file, tmp_path, monkeypatch):
+    """
+    Test a re-run emails only lines whose total or address changed or that failed
+    """
+    monkeypatch.setattr(
+        "tmobile.src.main.create_message",
+        lambda sender_email, to_email, subject, message_text: {"to": to_email},
+    )
+    args = {"test": False, "email": True, "venmo": False, "sender": "me@gmail.com"}
+    journal = RunJournal(db_file=str(tmp_path / "tmobile.db"))
+    bill = dict(__compute_bill__(__test_bill__), hash="hash")
+    email_cli = __FakeEmailClient__(failing=["efgh@gmail.com"])
+    __dispatch_bill__(args, bill, email_cli, journal=journal)
+    assert email_cli.sent == ["abcd@gmail.com", "efgh@gmail.com"]
+    email_cli = __FakeEmailClient__()
+    __dispatch_bill__(args, bill, email_cli, journal=journal)
+    assert email_cli.sent == ["efgh@gmail.com"]
+    __dispatch_bill__(args, bill, email_cli, journal=journal)
+    assert email_cli.sent == ["efgh@gmail.com"]
+    users = json.loads(users_file.read_text())
+    users["123456789"]["email"] = "abcd.new@gmail.com"
+    users_file.write_text(json.dumps(users, indent=4))
+    bill = dict(__compute_bill__(dict(__test_bill__, plan_total=62.0)), hash="hash")
+    email_cli = __FakeEmailClient__()
+    __dispatch_bill__(args, bill, email_cli, journal=journal)
+    assert email_cli.sent == ["abcd.new@gmail.com", "efgh@gmail.com"]
+    journal.close()
+
+
+def test_dispatch_bill_resumes_from_checkpoint(users_file, tmp_path, monkeypatch):
+    """
+    Test a resumed run skips emails the checkpoint of a crashed run has completed
+    """
+    assert users_file.exists()
+    monkeypatch.setattr(
+        "tmobile.src.main.create_message",
+        lambda sender_email, to_email, subject, message_text: {"to": to_email},
+    )
+    args = {"test": False, "email": True, "venmo": False, "sender": "me@gmail.com"}
+    checkpoint_file = str(tmp_path / "checkpoint.jsonl")
+    bill = dict(__compute_bill__(__test_bill__), hash="hash")
+    email_cli = __FakeEmailClient__(crash_after=1)
+    with pytest.raises(KeyboardInterrupt):
+        __dispatch_bill__(args, bill, email_cli, checkpoint=Checkpoint(checkpoint_file))
+    email_cli = __FakeEmailClient__()
+    checkpoint = Checkpoint(checkpoint_file, resume=True)
+    __dispatch_bill__(args, bill, email_cli, checkpoint=checkpoint)
+    assert email_cli.sent == ["efgh@gmail.com"]
+    checkpoint.close()
+    assert len(Checkpoint(checkpoint_file, resume=True).records) == 2
+    assert Checkpoint(checkpoint_file, fresh=True).records == []
+
+
+def test_checkpoint_kept_without_resume(users_file, tmp_path, monkeypatch):
+    """
+    Test a rerun without --resume after a crash does not start the checkpoint over,
+    and a completed run removes its checkpoint
+    """
+    assert users_file.exists()
+    monkeypatch.setattr(
+        "tmobile.src.main.create_message",
+        lambda sender_email, to_email, subject, message_text: {"to": to_email},
+    )
+    args = {"test": False, "email": True, "venmo": False, "sender": "me@gmail.com"}
+    checkpoint_file = tmp_path / "checkpoint.jsonl"
+    bill = dict(__compute_bill__(__test_bill__), hash="hash")
+    with pytest.raises(KeyboardInterrupt):
+        __dispatch_bill__(
+            args,
+            bill,
+            __FakeEmailClient__(crash_after=1),
+            checkpoint=Checkpoint(str(checkpoint_file)),
+        )
+    crashed = checkpoint_file.read_text()
+    assert crashed
+    with pytest.raises(FileExistsError):
+        Checkpoint(str(checkpoint_file))
+    assert checkpoint_file.read_text() == crashed
+    checkpoint = Checkpoint(str(checkpoint_file), resume=True)
+    __dispatch_bill__(args, bill, __FakeEmailClient__(), checkpoint=checkpoint)
+    checkpoint.close(completed=True)
+    assert not checkpoint_file.exists()
+    Checkpoint(str(checkpoint_file)).close()
+
+
+class __FakeVenmo__:
+    """
+    Venmo session recording each request and signalling once requests are sending
+    """
+
+    workers = 2
+
+    def __init__(self):
+        self.sending = threading.Event()
+        self.requested = []
+
+    def get_line_details(self, line):
+        return {"venmo_username": line, "additional_note": "", "additional_amount": 0}
+
+    def request_one(self, venmo_request):
+        self.sending.set()
+        self.requested.append(venmo_request["user_name"])
+        return {"status": "SUCCESS", "error": None, "latency": 0}
+
+
+def test_dispatch_bills_overlaps_stages(users_file, tmp_path, monkeypatch):
+    """
+    Test emails and Venmo requests of bills are sent concurrently and all are journaled
+    """
+    assert users_file.exists()
+    monkeypatch.setattr(
+        "tmobile.src.main.create_message",
+        lambda sender_email, to_email, subject, message_text: {"to": to_email},
+    )
+    args = {
+        "test": False,
+        "email": True,
+        "venmo": True,
+        "user": "Abcd",
+        "sender": "me@gmail.com",
+    }
+    venmo_cli = __FakeVenmo__()
+
+    class __SlowEmailClient__(__FakeEmailClient__):
+        def send_messages(self, messages, on_result=None):
+            # Sent one after the other, emails would never see a Venmo request
+            assert venmo_cli.sending.wait(timeout=5)
+            time.sleep(0.01)
+            return super().send_messages(messages, on_result=on_result)
+
+    journal = RunJournal(db_file=str(tmp_path / "tmobile.db"))
+    email_cli = __SlowEmailClient__()
+    bills = [
+        dict(__compute_bill__(__test_bill__), hash="hash{}".format(num))
+        for num in range(4)
+    ]
+    __dispatch_bills__(
+        args, iter(bills), email_cli, venmo_cli, journal=journal, queue_size=1
+    )
+    assert len(email_cli.sent) == 8
+    assert venmo_cli.requested == ["234567891"] * 4
+    for num in range(4):
+        assert sorted(journal.load("hash{}".format(num))) == [
+            ("123456789", "email"),
+            ("234567891", "email"),
+            ("234567891", "venmo"),
+        ]
+    journal.close()
+
+
+def test_dispatch_bills_isolates_failures(users_file, tmp_path, monkeypatch):
+    """
+    Test a bill that fails to compute or to send does not stop the other bills
+    """
+    assert users_file.exists()
+    monkeypatch.setattr(
+        "tmobile.src.main.create_message",
+        lambda sender_email, to_email, subject, message_text: {"to": to_email},
+    )
+    args = {"test": False, "email": True, "venmo": True, "user": "Abcd"}
+    args["sender"] = "me@gmail.com"
+    unknown_line = dict(__test_bill__["account_to_data"][0], Line="000000000")
+    parsed_bills = []
+    for name in ["Apr", "May", "Jun"]:
+        path = tmp_path / "SummaryBill{}2020.pdf".format(name)
+        path.write_bytes(name.encode())
+        parsed_bills.append((str(path), dict(__test_bill__, path=str(path))))
+    parsed_bills[1][1]["account_to_data"] = [unknown_line]
+
+    class __FailingVenmo__(__FakeVenmo__):
+        def request_one(self, venmo_request):
+            raise RuntimeError("venmo is down")
+
+    journal = RunJournal(db_file=str(tmp_path / "tmobile.db"))
+    email_cli = __FakeEmailClient__()
+    computed = {}
+    __dispatch_bills__(
+        args,
+        __compute_bills__(parsed_bills, None, computed),
+        email_cli,
+        __FailingVenmo__(),
+        journal=journal,
+    )
+    assert sorted(computed) == [parsed_bills[0][0], parsed_bills[2][0]]
+    assert len(email_cli.sent) == 4
+    for path in computed:
+        entries = journal.load(computed[path]["hash"])
+        assert entries[("123456789", "email")]["status"] == "SUCCESS"
+        assert entries[("234567891", "venmo")]["status"] == "FAILED"
+    journal.close()
+
+
+def __call_daemon__(server, route, body=None, content_type="application/json"):
+    """
+    Call a route of a running daemon, returning status and json response
+    """
+    request = urllib.request.Request(
+        "http://127.0.0.1:{}{}".format(server.server_address[1], route),
+        data=body,
+        headers={"Content-Type": content_type},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as err:
+        return err.code, json.loads(err.read())
+
+
+def test_extract_bills_from_thread(tmp_path):
+    """
+    Test bills are extracted on the process pool when pulled on a thread, as by the
+    pipeline, and a bill that fails to extract is skipped
+    """
+    pdf_path = __write_test_pdf__(
+        tmp_path / "SummaryBillApr2020.pdf", __test_pdf_pages__
+    )
+    bad_path = tmp_path / "SummaryBillMay2020.pdf"
+    bad_path.write_bytes(b"not a pdf")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        bills = pool.submit(
+            __extract_bills__, [str(pdf_path), str(bad_path)], workers=2
+        ).result()
+    assert [bill["path"] for bill in bills] == [str(pdf_path)]
+    assert bills[0]["account_total"] == 317.53
+
+
+def test_daemon(tmp_path, monkeypatch):
+    """
+    Test the daemon computes concurrent submissions and dispatches each line once
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "configs").mkdir()
+    users = {
+        "1234567890": {"name": "Abcd", "email": "abcd@gmail.com"},
+        "1234567980": {"name": "Efgh", "email": "efgh@gmail.com"},
+        "1234568970": {"name": "Ijkl", "email": "ijkl@gmail.com"},
+    }
+    (tmp_path / __test_info_file__).write_text(json.dumps(users))
+    monkeypatch.setattr(
+        "tmobile.src.main.create_message",
+        lambda sender_email, to_email, subject, message_text: {"to": to_email},
+    )
+    pdf_path = __write_test_pdf__(
+        tmp_path / "SummaryBillApr2020.pdf", __test_pdf_pages__
+    )
+    args = {"test": False, "email": True, "venmo": False, "sender": "me@gmail.com"}
+    email_cli = __FakeEmailClient__()
+    service = BillService(
+        args, journal=RunJournal(str(tmp_path / "tmobile.db")), email_cli=email_cli
+    )
+    service.warm_up()
+    server = BillServer(("127.0.0.1", 0), service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        body = json.dumps({"path": pdf_path}).encode()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(
+                pool.map(lambda _: __call_daemon__(server, "/bills", body), range(8))
+            )
+        assert {status for status, _ in responses} == {200}
+        breakdown = responses[0][1]
+        assert all(response == breakdown for _, response in responses)
+        assert breakdown["subject"].startswith("T-Mobile(Apr ")
+        assert [line["user"] for line in breakdown["lines"]] == ["Abcd", "Efgh", "Ijkl"]
+        assert breakdown["total"] == sum(line["total"] for line in breakdown["lines"])
+        with open(pdf_path, "rb") as pdf_file:
+            upload = pdf_file.read()
+        assert __call_daemon__(
+            server,
+            "/bills?name=SummaryBillApr2020.pdf",
+            upload,
+            content_type="application/pdf",
+        ) == (200, breakdown)
+        assert __call_daemon__(server, "/bills", upload, "application/pdf")[0] == 400
+        for invalid in [
+            b"{}",
+            b'{"path": 3}',
+            b"[]",
+            b"{path",
+            json.dumps({"path": str(tmp_path / "SummaryBillMay2020.pdf")}).encode(),
+            json.dumps({"path": str(tmp_path)}).encode(),
+        ]:
+            assert __call_daemon__(server, "/bills", invalid)[0] == 400
+        assert __call_daemon__(server, "/unknown", b"{}")[0] == 404
+        assert __call_daemon__(server, "/dispatch", body)[0] == 200
+        assert __call_daemon__(server, "/dispatch", body)[0] == 200
+        assert sorted(email_cli.sent) == [
+            "abcd@gmail.com",
+            "efgh@gmail.com",
+            "ijkl@gmail.com",
+        ]
+        status, health = __call_daemon__(server, "/health")
+        assert (status, health["requests"], health["errors"]) == (200, 19, 8)
+        assert health["bills"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.journal.close()
+
+
+class __FakeWatcher__:
+    """
+    Folder watcher reporting given paths, waiting for given events between them
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def watch(self, stop):
+        for path in self.paths:
+            if isinstance(path, threading.Event):
+                path.wait(timeout=10)
+            else:
+                yield path
+
+
+class __FakeBillService__:
+    """
+    Bill service recording dispatched paths, failing for given paths
+    """
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.dispatched = []
+        self.failed = 0
+        self.failed_once = threading.Event()
+        self.running = 0
+        self.most_running = 0
+        self._lock = threading.Lock()
+
+    def dispatch(self, path):
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.02)
+        with self._lock:
+            self.running -= 1
+            self.dispatched.append(path)
+        if path in self.failing:
+            raise ValueError("Invalid bill")
+
+    def count_request(self, failed):
+        self.failed += failed
+        if failed:
+            self.failed_once.set()
+
+
+def test_watch_folder(tmp_path):
+    """
+    Test watched bills are dispatched once per contents on a bounded pool, and bills
+    that failed are dispatched again once rewritten
+    """
+    paths = []
+    for name, content in [
+        ("SummaryBillApr2020.pdf", b"April"),
+        ("SummaryBillMay2020.pdf", b"May"),
+        ("SummaryBillApr2020 (copy).pdf", b"April"),
+        ("SummaryBillJun2020.pdf", b"June"),
+        ("SummaryBillJul2020.pdf", b"July"),
+    ]:
+        (tmp_path / name).write_bytes(content)
+        paths.append(str(tmp_path / name))
+    service = __FakeBillService__(failing=[paths[3]])
+    paths += [
+        str(tmp_path / "SummaryBillAug2020.pdf"),
+        service.failed_once,
+        paths[3],
+    ]
+    __watch_folder__(service, __FakeWatcher__(paths), threading.Event(), workers=2)
+    assert sorted(service.dispatched) == sorted(paths[:2] + paths[3:5] + paths[3:4])
+    assert service.failed == 2
+    assert service.most_running <= 2
+
+
+def test_watch_folder_existing_bill(tmp_path):
+    """
+    Test a bill already in the watched folder when the daemon starts is not dispatched,
+    while a bill written afterwards is
+    """
+    (tmp_path / "SummaryBillApr2020.pdf").write_bytes(b"April")
+    watcher = FolderWatcher(str(tmp_path), settle=0.0, interval=0.01, use_inotify=False)
+    service = __FakeBillService__()
+    stop = threading.Event()
+    new_bill = tmp_path / "SummaryBillMay2020.pdf"
+    threading.Timer(0.1, new_bill.write_bytes, args=(b"May",)).start()
+    threading.Timer(0.5, stop.set).start()
+    __watch_folder__(service, watcher, stop, workers=2)
+    assert service.dispatched == [str(new_bill)]
@@ -3,14 +3,36 @@
 This is pytest file to perform unit tests associated with utilities library.
 For each function in utitlies library we have a test with all possible input/output combinations
 """
+
 from datetime import datetime
+import json
+import time
 import pytest
-from tmobile.utilities.template import get_email_template
+from tmobile.utilities.concurrency import (
+    Stage,
+    TokenBucket,
+    call_with_retries,
+    run_pipeline_sync,
+)
+from tmobile.utilities.profiler import (
+    disable_profiling,
+    enable_profiling,
+    get_profiler,
+    record,
+    timer,
+)
+from tabulate import tabulate
+from tmobile.utilities.statement import LABELS, get_renderer
+from tmobile.utilities.template import compile_email_template, get_email_template
 from tmobile.utilities.utils import (
+    allocate_cents,
+    to_cents,
     parse_months,
+    parse_to_cents,
     parse_to_float,
     parse_to_num,
     clean_chunk,
+    get_percentile,
     get_year,
 )
 
@@ -34,6 +56,8 @@ def test_get_email_template(user, prev_month, month, new_month, year):
     assert "{} 19".format(prev_month) in template
     assert "{} 18".format(month) in template
     assert "before {}".format(new_month) in template
+    before, after = compile_email_template(prev_month, month, new_month, year)
+    assert template == "{}{}{}".format(before, user, after)
 
 
 @pytest.mark.parametrize(
@@ -56,6 +80,54 @@ def test_parse_to_num_fail(string_val):
         parse_to_num(string_val)
 
 
+@pytest.mark.parametrize(
+    ("string_val", "output_val"),
+    [("$123.45", 12345), ("34.5455", 3455), ("$5", 500), ("-", 0), ("-$34", -3400)],
+)
+def test_parse_to_cents(string_val, output_val):
+    """
+    Test function parse_to_cents
+    """
+    assert parse_to_cents(string_val) == output_val
+
+
+@pytest.mark.parametrize(
+    ("value", "output_val"), [(259.63, 25963), (50, 5000), ("$0.1", 10), (1e-05, 0)]
+)
+def test_to_cents(value, output_val):
+    """
+    Test function to_cents
+    """
+    assert to_cents(value) == output_val
+
+
+@pytest.mark.parametrize(
+    ("total_cents", "weights", "output_val"),
+    [
+        (10000, [1, 1, 1], [3334, 3333, 3333]),
+        (-100, [1, 1, 1], [-33, -33, -34]),
+        (100, [1, 2, 3], [17, 33, 50]),
+        (101, [1, 0, 1], [51, 0, 50]),
+        (7, [3, 3], [4, 3]),
+    ],
+)
+def test_allocate_cents(total_cents, weights, output_val):
+    """
+    Test function allocate_cents
+    """
+    assert allocate_cents(total_cents, weights) == output_val
+    assert sum(allocate_cents(total_cents, weights)) == total_cents
+
+
+@pytest.mark.parametrize(("string_val"), [("$123SSS"), ("")])
+def test_parse_to_cents_fail(string_val):
+    """
+    Test function parse_to_cents failure
+    """
+    with pytest.raises(ValueError):
+        parse_to_cents(string_val)
+
+
 @pytest.mark.parametrize(
     ("input_value", "expected_val"),
     [(5, 5), (123.4455, 123.45), (34.5455, 34.55), (-34.4443, -34.44)],
@@ -94,6 +166,15 @@ def test_parse_months(input_string, expected_val):
         assert parsed_months[key] == expected_val[key]
 
 
+@pytest.mark.parametrize(("year"), [2019, 2020, datetime.today().year])
+def test_parse_months_any_year(year):
+    """
+    Test parse_months function for bills from past years
+    """
+    parsed_months = parse_months("SummaryBillApr{}".format(year))
+    assert parsed_months["current_month"] == "Apr"
+
+
 @pytest.mark.parametrize(
     ("data_chunk", "expected_datachunk"),
     [
@@ -120,3 +201,173 @@ def test_get_year(months, expected_year):
     Test get_year function
     """
     assert get_year(months=months) == expected_year
+    assert get_year(months=months, file_name="SummaryBillDec2015") == 2015
+    assert get_year(months=months, file_name="SummaryBill") == expected_year
+
+
+def test_token_bucket():
+    """
+    Test TokenBucket allows bursts up to capacity and then waits for new tokens
+    """
+    clock = {"now": 0.0}
+    waits = []
+
+    def __sleep__(seconds):
+        waits.append(seconds)
+        clock["now"] += seconds
+
+    bucket = TokenBucket(
+        rate=2, capacity=2, clock=lambda: clock["now"], sleep=__sleep__
+    )
+    for _ in range(4):
+        bucket.acquire()
+    assert waits == [0.5, 0.5]
+    assert clock["now"] == 1.0
+
+
+def test_call_with_retries():
+    """
+    Test transient errors are retried with exponential backoff
+    """
+    calls, waits = [], []
+
+    def __flaky__():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("transient")
+        return "done"
+
+    assert (
+        call_with_retries(__flaky__, (ConnectionError,), sleep=waits.append) == "done"
+    )
+    assert waits == [0.5, 1.0]
+    with pytest.raises(ConnectionError):
+        calls.clear()
+        call_with_retries(__flaky__, (ConnectionError,), retries=1, sleep=waits.append)
+    with pytest.raises(ValueError):
+        call_with_retries(lambda: int("x"), (ConnectionError,), sleep=waits.append)
+    with pytest.raises(ConnectionError):
+        calls.clear()
+        call_with_retries(
+            __flaky__,
+            (ConnectionError,),
+            sleep=waits.append,
+            is_transient=lambda err: False,
+        )
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize(
+    ("values", "percent", "expected_val"),
+    [
+        ([], 95, 0),
+        ([3, 1, 2, 4], 50, 2),
+        ([3, 1, 2, 4], 95, 4),
+        (list(range(1, 101)), 95, 95),
+    ],
+)
+def test_get_percentile(values, percent, expected_val):
+    """
+    Test get_percentile function
+    """
+    assert get_percentile(values, percent) == expected_val
+
+
+def test_run_pipeline():
+    """
+    Test all items flow through stages and a slow stage holds back the source
+    """
+    pulled, handled = [], []
+
+    def __source__():
+        for num in range(20):
+            pulled.append(num)
+            yield num
+
+    def __handle__(batch):
+        time.sleep(0.005)
+        # Items pulled ahead of the slow stage are bounded by its queue and worker
+        assert len(pulled) - len(handled) <= 2 + 2 + 1
+        return [num * 2 for num in batch]
+
+    slow = Stage(
+        "slow", __handle__, lambda num, result: handled.append(result), queue_size=2
+    )
+    skipped = Stage(
+        "skipped", lambda batch: batch, lambda num, result: None, batch_size=4
+    )
+    run_pipeline_sync(
+        source=__source__(),
+        route=lambda num: [(slow, num)] + ([(skipped, num)] if num % 5 else []),
+        stages=[slow, skipped],
+    )
+    assert handled == [num * 2 for num in range(20)]
+
+
+def test_profiler(tmp_path):
+    """
+    Test timings are summarized per stage and written as events only while enabled
+    """
+    assert get_profiler() is None
+    with timer("render"):
+        pass
+    events_file = tmp_path / "events.jsonl"
+    profiler = enable_profiling(events_file=str(events_file))
+    assert get_profiler() is profiler
+    for elapsed in [0.001, 0.002, 0.003, 0.004]:
+        record("email", elapsed, error=None)
+    with pytest.raises(ValueError):
+        with timer("parse", path="bill.pdf"):
+            raise ValueError("invalid")
+    assert disable_profiling() is profiler
+    assert disable_profiling() is None
+    record("email", 1)
+    assert profiler.get_summary()[0] == ["email", 4, 10.0, 2.0, 4.0, 4.0]
+    assert profiler.get_summary()[1][:2] == ["parse", 1]
+    assert "p95 (ms)" in profiler.get_report()
+    events = [json.loads(event) for event in events_file.read_text().splitlines()]
+    assert [event["stage"] for event in events] == ["email"] * 4 + ["parse"]
+    assert events[0]["elapsed_ms"] == 1.0
+    assert events[-1]["path"] == "bill.pdf"
+    assert events[-1]["error"] == "ValueError"
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        ["Abcd", "(123)456-7890", "Voice", 0.0, 16.37, 0.0, 12.34, "$28.71"],
+        ["  Ab  ", "(123)456-7890", "Wearable", 1234.5, 0.1 + 0.2, 5, 1e-07, "$5"],
+        ["Abcd", "", "Voice", None, 16.37, "-", 12.34, "$28.71"],
+        ["Zoë 😀", "(123)456-7890", "Voice", 0.0, 16.37, 0.0, 12.34, "$28.71"],
+        ["Ab\ncd", "(123)456-7890", "Voice\tX", 0.0, 16.37, 0.0, 12.34, "$28.71"],
+        [10, "", 0.0, "12", 0.0, 16.37, None, 0.1 + 0.2],
+    ],
+)
+def test_statement_renderer_matches_tabulate(values):
+    """
+    Test grid and plain statements are the same as tabulate, whatever the values
+    """
+    for fmt in ["grid", "plain"]:
+        expected = tabulate(list(zip(LABELS, values)), tablefmt=fmt)
+        assert get_renderer(fmt).render(values) == expected
+
+
+def test_statement_renderer_formats():
+    """
+    Test html and csv statements, and unknown formats
+    """
+    values = ["A & B", "(123)456-7890", "Voice", 0.0, 16.37, 0.0, 12.34, "$28.71"]
+    body = get_renderer("html").render(values)
+    assert body.startswith("<table>\n<tbody>\n<tr><td>User</td><td>A &amp; B</td></tr>")
+    assert body.count("<tr>") == len(LABELS)
+    assert (
+        get_renderer("csv").render_all([values, values])
+        == [
+            "User,A & B\nLine,(123)456-7890\nType,Voice\nEquipment,0.0\n"
+            "Services,16.37\nOne-time,0.0\nBasic (incl Tax),12.34\nTotal,$28.71\n"
+        ]
+        * 2
+    )
+    assert get_renderer("html") is get_renderer("html")
+    with pytest.raises(ValueError):
+        get_renderer("pdf")
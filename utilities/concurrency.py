@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+"""
+This module provides helpers to call remote APIs concurrently without overloading them
+    - TokenBucket limits the rate of calls shared by all threads
+    - call_with_retries retries transient failures with exponential backoff
+    - run_pipeline runs asyncio stages with bounded queues, so items flow through all
+      stages concurrently and a slow stage holds back its producers
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` calls per second with bursts of up to `capacity` calls
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Function to take one token from the bucket, waiting until one is available"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self._sleep(wait)
+
+
+def call_with_retries(
+    func, transient_errors, retries=3, backoff=0.5, sleep=time.sleep, is_transient=None
+):
+    """Function to call func, retrying transient errors with exponential backoff
+       e.g. with backoff=0.5 retries are made after 0.5s, 1s, 2s ...
+
+    :param func: Function to call without arguments
+    :type func: (callable)
+    :param transient_errors: Exception types worth retrying
+    :type transient_errors: (tuple)
+    :param retries: Maximum number of retries, defaults to 3
+    :type retries: (int), optional
+    :param backoff: Delay before the first retry in seconds, defaults to 0.5
+    :type backoff: (float), optional
+    :param is_transient: Called with each error of transient_errors, which is raised
+                         without a retry if it returns False, defaults to None
+    :type is_transient: (callable), optional
+    :return: Value returned by func
+    :raises: Last transient error once all retries are used up
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except transient_errors as err:
+            if attempt == retries or (is_transient and not is_transient(err)):
+                raise
+            sleep(backoff * 2**attempt)
+
+
+class Stage:
+    """
+    Stage of an asyncio pipeline with a bounded queue of items, handled in batches of up to
+    `batch_size` items by `workers` tasks that run the blocking `handler` on an executor
+    """
+
+    def __init__(self, name, handler, on_done, workers=1, batch_size=1, queue_size=64):
+        self.name = name
+        self.handler = handler
+        self.on_done = on_done
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.queue_size = queue_size
+        self.queue = None
+
+    async def put(self, item):
+        """Function to queue an item, waiting while the queue is full"""
+        await self.queue.put(item)
+
+    async def close(self):
+        """Function to stop the workers once queued items are handled"""
+        for _ in range(self.workers):
+            await self.queue.put(None)
+
+    async def _work(self, executor):
+        """Private function of one worker taking batches of queued items until closed"""
+        loop = asyncio.get_running_loop()
+        closed = False
+        while not closed:
+            item = await self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is None:
+                    closed = True
+                    break
+                batch.append(item)
+            results = await loop.run_in_executor(executor, self.handler, batch)
+            for item, result in zip(batch, results):
+                self.on_done(item, result)
+
+
+async def run_pipeline(source, route, stages, executor):
+    """Function to run stages concurrently on the items routed to them from source.
+       Items are pulled from source on the executor, so a slow producer such as pdf
+       extraction overlaps with the stages, and only as fast as the stage queues drain
+
+    :param source: Items to route, any iterable or generator
+    :type source: (iterable)
+    :param route: Function returning (stage, item) pairs to queue for an item of source
+    :type route: (callable)
+    :param stages: Stages of the pipeline
+    :type stages: (list)
+    :param executor: Executor running source and handlers of stages
+    :type executor: (concurrent.futures.Executor)
+    """
+    loop = asyncio.get_running_loop()
+    for stage in stages:
+        stage.queue = asyncio.Queue(maxsize=stage.queue_size)
+    workers = [
+        asyncio.ensure_future(stage._work(executor))
+        for stage in stages
+        for _ in range(stage.workers)
+    ]
+
+    async def __produce__():
+        iterator = iter(source)
+        done = object()
+        while True:
+            item = await loop.run_in_executor(executor, next, iterator, done)
+            if item is done:
+                break
+            for stage, stage_item in route(item):
+                await stage.put(stage_item)
+        for stage in stages:
+            await stage.close()
+
+    await asyncio.gather(__produce__(), *workers)
+
+
+def run_pipeline_sync(source, route, stages, threads=8):
+    """Function to run run_pipeline to completion from synchronous code
+
+    :param threads: Number of threads of the executor, defaults to 8
+    :type threads: (int), optional
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        asyncio.run(run_pipeline(source, route, stages, executor))
@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+"""
+This module provides timers of the stages of a run, e.g. extraction, parsing, emails
+    - Profiling is disabled by default, a disabled timer is one shared no-op context manager
+    - When enabled, every timed call is summarized per stage with count, total, p50, p95
+      and max, and appended as a json line to the events file, if any
+    - Percentiles of a long running process are over its latest max_samples calls
+    - Library callers enable it with enable_profiling, the CLI with --profile or --events
+"""
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from tmobile.utilities.utils import get_percentile
+
+
+class _Timer:
+    """
+    Context manager recording the time spent in its block to a profiler
+    """
+
+    __slots__ = ("profiler", "stage", "fields", "started")
+
+    def __init__(self, profiler, stage, fields):
+        self.profiler = profiler
+        self.stage = stage
+        self.fields = fields
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        self.profiler.record(
+            self.stage, time.perf_counter() - self.started, **self.fields
+        )
+        return False
+
+
+class Profiler:
+    """
+    Main class to collect timings of stages and write them as json lines events
+    """
+
+    def __init__(self, events_file=None, max_samples=None):
+        self.events_file = events_file
+        self.max_samples = max_samples
+        self.counts = defaultdict(int)
+        self.totals = defaultdict(float)
+        self.durations = defaultdict(lambda: deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+        self._events = open(events_file, "a") if events_file else None
+
+    def timer(self, stage, **fields):
+        """Function to get a context manager timing its block as a call of stage
+
+        :param stage: Name of the stage e.g. "extract", "email"
+        :type stage: (str)
+        :param fields: Fields added to the event e.g. path of the bill
+        :type fields: (dict)
+        :return: Timer of the block
+        :rtype: (_Timer)
+        """
+        return _Timer(self, stage, fields)
+
+    def record(self, stage, elapsed, **fields):
+        """Function to record a call of stage timed by the caller, safe to call from
+           worker threads
+
+        :param stage: Name of the stage e.g. "extract", "email"
+        :type stage: (str)
+        :param elapsed: Time taken in seconds
+        :type elapsed: (float)
+        :param fields: Fields added to the event e.g. path of the bill
+        :type fields: (dict)
+        """
+        with self._lock:
+            self.counts[stage] += 1
+            self.totals[stage] += elapsed
+            self.durations[stage].append(elapsed)
+            if self._events is not None:
+                event = dict(
+                    fields, ts=time.time(), stage=stage, elapsed_ms=elapsed * 1000
+                )
+                self._events.write(json.dumps(event, default=str) + "\n")
+
+    def get_summary(self):
+        """Function to get count, total, p50, p95 and max of each stage in milliseconds,
+           percentiles and max being over the latest max_samples calls
+
+        :return: Summary row of each stage, in the order stages were first recorded
+        :rtype: (list)
+        """
+        with self._lock:
+            durations = {
+                stage: list(values) for stage, values in self.durations.items()
+            }
+            counts, totals = dict(self.counts), dict(self.totals)
+        return [
+            [
+                stage,
+                counts[stage],
+                round(totals[stage] * 1000, 3),
+                round(get_percentile(values, 50) * 1000, 3),
+                round(get_percentile(values, 95) * 1000, 3),
+                round(max(values) * 1000, 3),
+            ]
+            for stage, values in durations.items()
+        ]
+
+    def get_report(self):
+        """Function to get the summary of stages as a grid formatted table
+
+        :return: Table of count, total, p50, p95 and max of each stage
+        :rtype: (str)
+        """
+        from tabulate import tabulate
+
+        return tabulate(
+            self.get_summary(),
+            headers=[
+                "Stage",
+                "Count",
+                "Total (ms)",
+                "p50 (ms)",
+                "p95 (ms)",
+                "Max (ms)",
+            ],
+            tablefmt="grid",
+        )
+
+    def close(self):
+        """Function to close the events file"""
+        with self._lock:
+            if self._events is not None:
+                self._events.close()
+                self._events = None
+
+
+class _NullTimer:
+    """
+    Context manager of a disabled timer, doing nothing
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class _NullProfiler:
+    """
+    Profiler of a run with profiling disabled, recording nothing
+    """
+
+    def timer(self, stage, **fields):
+        """Function to get the shared no-op context manager"""
+        return __null_timer__
+
+    def record(self, stage, elapsed, **fields):
+        """Function to ignore a call of stage"""
+
+
+__null_timer__ = _NullTimer()
+__null_profiler__ = _NullProfiler()
+__profiler__ = __null_profiler__
+
+
+def enable_profiling(events_file=None, max_samples=None):
+    """Function to start timing stages of the run in this process
+
+    :param events_file: Path to the json lines file events are appended to, defaults
+                        to None for no events
+    :type events_file: (str), optional
+    :param max_samples: Number of latest calls of each stage kept for percentiles,
+                        defaults to None to keep every call
+    :type max_samples: (int), optional
+    :return: Profiler collecting the timings
+    :rtype: (Profiler)
+    """
+    global __profiler__
+    disable_profiling()
+    __profiler__ = Profiler(events_file=events_file, max_samples=max_samples)
+    return __profiler__
+
+
+def disable_profiling():
+    """Function to stop timing stages and close the events file
+
+    :return: Profiler that was collecting the timings | None if profiling was disabled
+    :rtype: (Profiler | None)
+    """
+    global __profiler__
+    profiler, __profiler__ = __profiler__, __null_profiler__
+    if profiler is __null_profiler__:
+        return None
+    profiler.close()
+    return profiler
+
+
+def get_profiler():
+    """Function to get the profiler of the run
+
+    :return: Profiler collecting the timings | None if profiling is disabled
+    :rtype: (Profiler | None)
+    """
+    return None if __profiler__ is __null_profiler__ else __profiler__
+
+
+def timer(stage, **fields):
+    """Function to time a block as a call of stage, a no-op if profiling is disabled
+       e.g. with timer("render"): ...
+
+    :param stage: Name of the stage e.g. "extract", "email"
+    :type stage: (str)
+    :return: Context manager timing its block
+    :rtype: (contextlib.AbstractContextManager)
+    """
+    if __profiler__ is __null_profiler__:
+        return __null_timer__
+    return __profiler__.timer(stage, **fields)
+
+
+def record(stage, elapsed, **fields):
+    """Function to record a call of stage timed by the caller, a no-op if profiling is
+       disabled
+
+    :param stage: Name of the stage e.g. "extract", "email"
+    :type stage: (str)
+    :param elapsed: Time taken in seconds
+    :type elapsed: (float)
+    """
+    __profiler__.record(stage, elapsed, **fields)
@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+"""
+Module pertaining to the statement of charges of each line emailed to its user
+    - Every statement has the same rows, so the label column of each format is built
+      once and only the values of a line are formatted for each statement
+    - grid: the default, the same bytes as tabulate(rows, tablefmt="grid")
+    - plain: aligned labels and values without borders, the same as tablefmt="plain"
+    - html: a table for html emails, csv: a label,value row for each row
+"""
+import csv
+import html
+import io
+
+FORMATS = ("grid", "plain", "html", "csv")
+DEFAULT_FORMAT = "grid"
+
+LABELS = (
+    "User",
+    "Line",
+    "Type",
+    "Equipment",
+    "Services",
+    "One-time",
+    "Basic (incl Tax)",
+    "Total",
+)
+
+__label_width__ = max(len(label) for label in LABELS)
+
+__renderers__ = {}
+
+
+def get_statement_values(account_details, basic_cents):
+    """Function to get the value of each row of the statement of a line
+
+    :param account_details: Line on the account
+    :type account_details: (Line)
+    :param basic_cents: Share of the account charges of the line in cents
+    :type basic_cents: (int)
+    :return: Values in LABELS order and total charges of the line
+    :rtype: (tuple)
+    """
+    total_charges = (account_details.charges.own_charges_cents + basic_cents) / 100
+    values = [
+        account_details.user["name"],
+        account_details.line,
+        account_details.linetype,
+        account_details.equipment,
+        account_details.services,
+        account_details.one_time_charge,
+        basic_cents / 100,
+        "${}".format(total_charges),
+    ]
+    return values, total_charges
+
+
+def __tabulate__(values, tablefmt):
+    """Function to render values with tabulate, imported only when it is needed"""
+    from tabulate import tabulate
+
+    return tabulate(list(zip(LABELS, values)), tablefmt=tablefmt)
+
+
+def __is_text__(value):
+    """Function to check if tabulate would treat a value as text rather than a number"""
+    if not isinstance(value, str) or not value:
+        return False
+    try:
+        float(value)
+    except ValueError:
+        return True
+    return False
+
+
+def __get_texts__(values):
+    """Function to get the text of each value as tabulate shows it in a text column
+
+    :return: Texts of the values | None if tabulate would measure or align the values
+             differently, e.g. all numbers, wide characters or line breaks
+    :rtype: (list)
+    """
+    texts = ["" if value is None else str(value).strip() for value in values]
+    if not any(__is_text__(value) for value in values):
+        return None
+    if not all(text.isascii() and text.isprintable() for text in texts):
+        return None
+    return texts
+
+
+class StatementRenderer:
+    """
+    Main class to render statements in one format with its label column built once
+    """
+
+    def __init__(self, fmt=DEFAULT_FORMAT):
+        if fmt not in FORMATS:
+            raise ValueError("Unknown statement format=%s" % fmt)
+        self.fmt = fmt
+        self._render = getattr(self, "_render_{}".format(fmt))
+        self._grid_cells = [
+            "| {} | ".format(label.ljust(__label_width__)) for label in LABELS
+        ]
+        self._grid_border = "+{}+".format("-" * (__label_width__ + 2))
+        self._plain_cells = [
+            "{}  ".format(label.ljust(__label_width__)) for label in LABELS
+        ]
+        self._html_cells = [
+            "<tr><td>{}</td><td>".format(html.escape(label)) for label in LABELS
+        ]
+
+    def render(self, values):
+        """Function to render the statement of a line
+
+        :param values: Values in LABELS order, see get_statement_values
+        :type values: (list)
+        :return: Statement of the line
+        :rtype: (str)
+        """
+        return self._render(values)
+
+    def render_all(self, statements):
+        """Function to render the statements of all lines in bulk
+
+        :param statements: Values in LABELS order of each line
+        :type statements: (iterable)
+        :return: Statement of each line
+        :rtype: (list)
+        """
+        return [self.render(values) for values in statements]
+
+    def _render_grid(self, values):
+        """Private function to render a grid table, the same as tabulate"""
+        texts = __get_texts__(values)
+        if texts is None:
+            return __tabulate__(values, "grid")
+        width = max(len(text) for text in texts)
+        border = "{}{}+".format(self._grid_border, "-" * (width + 2))
+        rows = [
+            "{}{} |".format(cell, text.ljust(width))
+            for cell, text in zip(self._grid_cells, texts)
+        ]
+        return "{0}\n{1}\n{0}".format(border, "\n{}\n".format(border).join(rows))
+
+    def _render_plain(self, values):
+        """Private function to render aligned labels and values, the same as tabulate"""
+        texts = __get_texts__(values)
+        if texts is None:
+            return __tabulate__(values, "plain")
+        return "\n".join(
+            "{}{}".format(cell, text).rstrip()
+            for cell, text in zip(self._plain_cells, texts)
+        )
+
+    def _render_html(self, values):
+        """Private function to render an html table with escaped values"""
+        rows = [
+            "{}{}</td></tr>".format(
+                cell, html.escape("" if value is None else str(value).strip())
+            )
+            for cell, value in zip(self._html_cells, values)
+        ]
+        return "<table>\n<tbody>\n{}\n</tbody>\n</table>".format("\n".join(rows))
+
+    def _render_csv(self, values):
+        """Private function to render a label,value row for each row of the statement"""
+        output = io.StringIO()
+        csv.writer(output, lineterminator="\n").writerows(zip(LABELS, values))
+        return output.getvalue()
+
+
+def get_renderer(fmt=DEFAULT_FORMAT):
+    """Function to get the renderer of a statement format, built once per format
+
+    :param fmt: Format of the statements, defaults to DEFAULT_FORMAT
+    :type fmt: (str), optional
+    :raises ValueError: If the format is not one of FORMATS
+    :return: Renderer of the format
+    :rtype: (StatementRenderer)
+    """
+    renderer = __renderers__.get(fmt)
+    if renderer is None:
+        renderer = __renderers__[fmt] = StatementRenderer(fmt)
+    return renderer
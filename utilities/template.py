@@ -4,11 +4,39 @@ This module provides all unique dependent functions binded by the
 sole purpose of helping business logic in main. All functions are
 pre-defined string templates
 """
+import functools
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+__boiler_plate__ = "**********   THIS IS AN AUTO-GENERATED EMAIL **********\n\
+       \nHello {user},\n\
+       \nFollowing is the bill details for month of {month} {year} (This covers billing cycle from {prev_month} 19 - {month} 18)\n\
+       \nAuto-pay is enabled. If you need any copy of the bill for reimbursement please make sure you get it before {next_month} 11th\n\
+       \nYou may have recieved an auto-generated Venmo request for the month of {month}\n"
+
+
+@functools.lru_cache(maxsize=16)
+def compile_email_template(prev_month, month, next_month, year):
+    """Function to fill the email template of a month once for all its users
+
+    :param prev_month: Abbr of prev month
+    :type prev_month: (str)
+    :param month: Abbr of current month
+    :type month: (str)
+    :param next_month: Abbr of next month
+    :type next_month: (str)
+    :param year: Current year
+    :type year: (int)
+    :return: Text of the email template before and after the name of the user
+    :rtype: (tuple)
+    """
+    before, _, after = __boiler_plate__.partition("{user}")
+    fields = dict(prev_month=prev_month, month=month, year=year, next_month=next_month)
+    return before.format(**fields), after.format(**fields)
+
+
 def get_email_template(user, prev_month, month, next_month, year):
     """Function to generate email template that would include
        the given user, month, next month and year
@@ -26,14 +54,8 @@ def get_email_template(user, prev_month, month, next_month, year):
     :return: Email template that includes user, month, next month and year
     :rtype: (str)
     """
-    boiler_plate = "**********   THIS IS AN AUTO-GENERATED EMAIL **********\n\
-       \nHello {user},\n\
-       \nFollowing is the bill details for month of {month} {year} (This covers billing cycle from {prev_month} 19 - {month} 18)\n\
-       \nAuto-pay is enabled. If you need any copy of the bill for reimbursement please make sure you get it before {next_month} 11th\n\
-       \nYou may have recieved an auto-generated Venmo request for the month of {month}\n"
-    return boiler_plate.format(
-        user=user, prev_month=prev_month, month=month, year=year, next_month=next_month
-    )
+    before, after = compile_email_template(prev_month, month, next_month, year)
+    return "{}{}{}".format(before, user, after)
 
 
 def get_help(input_file):
@@ -48,6 +70,8 @@ def get_help(input_file):
          \n\t-"email": (True | False) Toggle for sending email to users\
          \n\t-"sender": Email of the sender\
          \n\t-"venmo": (True | False) for to generate venmo requests(venmo.json required)\
-         \n\t-"user": User from (configs/users.json) who the venmo requests will be sent'
+         \n\t-"user": User from (configs/users.json) who the venmo requests will be sent\
+         \n\t-"extractor": (pypdf | tika) Optional pdf extraction backend, defaults to pypdf\
+         \n\t-"statement": (grid | plain | html | csv) Optional format of the charges emailed, defaults to grid'
         % input_file
     )
@@ -4,8 +4,14 @@ This module provides all unique independent utility functions that can be
 imported into other programs to perform string operations as defined
 """
 import calendar
+import hashlib
 import json
+import re
 from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+__phone_with_space__ = re.compile(r"\(\d{3}\) \d{3}-\d{4}")
+__file_year__ = re.compile(r"(\d{4})$")
 
 
 class UserNotFound(Exception):
@@ -28,6 +34,73 @@ def parse_to_num(string_val):
     return float(string_val.replace("$", ""))
 
 
+def parse_to_cents(string_val):
+    """Convert given value to an exact number of cents, rounding half cents up
+       e.g. parse_to_cents($25.9345) -> 2593
+
+    :param string_val: Value to be converted to cents, "-" is treated as no charge
+    :type string_val: (str)
+    :raises ValueError: If the value is not numeric
+    :return: Value in cents
+    :rtype: (int)
+    """
+    if string_val == "-":
+        return 0
+    value = string_val.replace("$", "")
+    whole, _, fraction = value.partition(".")
+    digits = whole.lstrip("-")
+    if digits.isdigit() and len(fraction) <= 2 and (fraction.isdigit() or not fraction):
+        cents = int(digits) * 100 + int(fraction.ljust(2, "0"))
+        return -cents if whole.startswith("-") else cents
+    try:
+        amount = Decimal(value) * 100
+        return int(amount.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation as err:
+        raise ValueError("Invalid amount={}".format(string_val)) from err
+
+
+def to_cents(value):
+    """Convert given amount in dollars to an exact number of cents
+       e.g. to_cents(259.63) -> 25963
+
+    :param value: Amount in dollars
+    :type value: (int/float/str)
+    :raises ValueError: If the value is not numeric
+    :return: Amount in cents
+    :rtype: (int)
+    """
+    return parse_to_cents(str(value))
+
+
+def allocate_cents(total_cents, weights):
+    """Split given cents in proportion to weights with the largest remainder method,
+       so the shares always add up to total_cents. Cents left after rounding down
+       go to the largest remainders, ties to the earliest weight
+       e.g. allocate_cents(10000, [1, 1, 1]) -> [3334, 3333, 3333]
+
+    :param total_cents: Amount to split in cents
+    :type total_cents: (int)
+    :param weights: Non-negative weight of each share, with a positive sum
+    :type weights: (list)
+    :raises ZeroDivisionError: If weights add up to 0
+    :return: Share of each weight in cents
+    :rtype: (list)
+    """
+    total_weight = sum(weights)
+    if all(weight == 1 for weight in weights):
+        share, left = divmod(total_cents, total_weight)
+        return [share + 1] * left + [share] * (total_weight - left)
+    shares, remainders = [], []
+    for index, weight in enumerate(weights):
+        share, remainder = divmod(total_cents * weight, total_weight)
+        shares.append(share)
+        remainders.append((-remainder, index))
+    left = total_cents - sum(shares)
+    for _, index in sorted(remainders)[:left]:
+        shares[index] += 1
+    return shares
+
+
 def parse_to_float(val):
     """Convert given numeric value to float number and round it off
        e.g. parse_to_float(25.9345) -> 25.94
@@ -49,8 +122,7 @@ def parse_months(file_name):
     :return: Abbrevation of current month and new month
     :rtype: (dict)
     """
-    current_year = str(datetime.today().year)
-    month_abbr = file_name.replace(current_year, "")[-3:]
+    month_abbr = file_name.rstrip("0123456789")[-3:]
     month_num = list(calendar.month_abbr).index(month_abbr)
     if month_num == 12:
         new_month = 1
@@ -86,6 +158,18 @@ def validate_email(email_address):
     return True
 
 
+def normalize_phone(phone_number):
+    """Function to normalize a phone number to its digits
+       e.g. normalize_phone("(123)345-3211") -> "1233453211"
+
+    :param phone_number: Phone number in any format used across config files and bills
+    :type phone_number: (str)
+    :return: Digits of the phone number
+    :rtype: (str)
+    """
+    return "".join(char for char in phone_number if char.isdigit())
+
+
 def parse_json_data(file_path):
     """Function to parse json data from a given json file
 
@@ -99,6 +183,21 @@ def parse_json_data(file_path):
     return data
 
 
+def get_file_hash(file_path):
+    """Function to get SHA-256 hex digest of the contents of a given file
+
+    :param file_path: Path to the file
+    :type file_path: (str)
+    :return: SHA-256 hex digest of the file contents
+    :rtype: (str)
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_name:
+        for block in iter(lambda: file_name.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 def clean_chunk(data_chunk):
     """Function to clear addtional variables from data chunk
 
@@ -110,17 +209,57 @@ def clean_chunk(data_chunk):
     filters = [" - New", "\xa0", " - Transferred to T-Mobile", " - Old number"]
     for filter_ in filters:
         data_chunk = data_chunk.replace(filter_, "")
+    # Some extractors render the non-breaking space inside phone numbers as a plain space
+    if __phone_with_space__.match(data_chunk):
+        data_chunk = data_chunk[:5] + data_chunk[6:]
     return data_chunk
 
 
-def get_year(months):
-    """Function to get exact year based on current and next month
+def get_percentile(values, percent):
+    """Function to get the nearest-rank percentile of given values
+       e.g. get_percentile([1, 2, 3, 4], 50) -> 2
+
+    :param values: Numeric values
+    :type values: (list)
+    :param percent: Percentile to get, between 0 and 100
+    :type percent: (int/float)
+    :return: Percentile of the values | 0 if there are no values
+    :rtype: (int/float)
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def parse_year(file_name):
+    """Function to get the year of a bill from a given file name without extension
+       e.g. parse_year("SummaryBillApr2020") -> 2020
+
+    :param file_name: Name of the file to parse
+    :type file_name: (str)
+    :return: Year in the file name | None if the name does not end with one
+    :rtype: (int)
+    """
+    year = __file_year__.search(file_name)
+    return int(year.group(1)) if year else None
+
+
+def get_year(months, file_name=None):
+    """Function to get exact year of a bill, from its file name if it ends with one,
+       else based on current and next month
 
     :param months: Dict containing current and next month
     :type months: (dict)
-    :return: Year calculated based on current and next month
+    :param file_name: Name of the bill file without extension, defaults to None
+    :type file_name: (str), optional
+    :return: Year of the bill
     :rtype: (int)
     """
+    year_ = parse_year(file_name) if file_name else None
+    if year_ is not None:
+        return year_
     if months["next_month"] == "Jan":
         year_ = datetime.today().year + 1
     else: